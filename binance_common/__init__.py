@@ -0,0 +1,2 @@
+# binance_common - moduły Binance wspólne dla bnbbot1, bnbbot2 i v1 (limiter zapytań, pula klientów,
+# filtry symboli). Katalog repozytorium dodają do sys.path ustawienia każdej z usług.
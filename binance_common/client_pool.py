@@ -0,0 +1,100 @@
+# binance_common/client_pool.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from binance.client import Client
+
+from .rate_limit import GovernedClient
+
+CLIENT_POOL_SIZE = 256      # maks. liczba klientów (kluczy API) trzymanych w pamięci
+CREDENTIALS_TTL = 900       # sekundy, po których odszyfrowany sekret jest porzucany
+
+
+def secret_fingerprint(secret_enc) -> str:
+    """
+    Odcisk zaszyfrowanego sekretu - zmienia się przy każdej zmianie klucza (nowy szyfrogram Fernet).
+    """
+    if not secret_enc:
+        return ""
+    return hashlib.sha256(bytes(secret_enc)).hexdigest()
+
+
+class ClientPool:
+    """
+    Rejestr klientów Binance współdzielonych w procesie, kluczowany kluczem API.
+
+    Klient trzyma sesję HTTP (keep-alive), więc kolejne zapytania tego samego klucza nie robią
+    nowego połączenia TLS ani ping-u z konstruktora. Odszyfrowany sekret żyje w pamięci najwyżej
+    `ttl` sekund, a pula ma limit rozmiaru z usuwaniem najdawniej używanych (LRU).
+    Gdy zaszyfrowany sekret w bazie się zmieni (rotacja klucza), wpis jest budowany od nowa.
+    Domyślnie budowani są GovernedClient - zapytania przechodzą przez wspólny limiter (rate_limit).
+    Jeden klient obsługuje równolegle wiele wątków (ThreadPoolExecutor w bnb_manager), więc fabryka
+    musi dawać klienta bezpiecznego wątkowo - GovernedClient nie trzyma odpowiedzi w self.response.
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None, requests_params: dict = None,
+                 client_factory=GovernedClient):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.requests_params = requests_params
+        self.client_factory = client_factory
+        self._entries = OrderedDict()  # {api_key: (fingerprint, created_at, client)}
+        self._lock = threading.Lock()
+
+    def get_max_size(self) -> int:
+        if self.max_size is not None:
+            return self.max_size
+        return getattr(settings, "BINANCE_CLIENT_POOL_SIZE", CLIENT_POOL_SIZE)
+
+    def get_ttl(self) -> int:
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, "BINANCE_CLIENT_CREDENTIALS_TTL", CREDENTIALS_TTL)
+
+    def get(self, api_key: str, secret_enc, decrypt) -> Client:
+        """
+        Zwraca klienta dla klucza API. `decrypt` (np. bot.get_binance_api_secret) jest wołane
+        tylko, gdy klienta trzeba zbudować - przy trafieniu w pulę sekret nie jest odszyfrowywany.
+        """
+        api_key = api_key or ""
+        fingerprint = secret_fingerprint(secret_enc)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is not None:
+                if entry[0] == fingerprint and now - entry[1] < self.get_ttl():
+                    self._entries.move_to_end(api_key)
+                    return entry[2]
+                # Zmieniony sekret albo minął TTL - porzucamy stary wpis
+                del self._entries[api_key]
+
+        # Budujemy klienta poza blokadą - konstruktor python-binance robi zapytanie (ping)
+        client = self.client_factory(api_key, decrypt() or "", self.requests_params)
+
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is not None and entry[0] == fingerprint:
+                # Inny wątek zbudował klienta w międzyczasie - używamy jego
+                self._entries.move_to_end(api_key)
+                return entry[2]
+            self._entries[api_key] = (fingerprint, now, client)
+            while len(self._entries) > self.get_max_size():
+                self._entries.popitem(last=False)
+        return client
+
+    def invalidate(self, api_key: str):
+        with self._lock:
+            self._entries.pop(api_key or "", None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
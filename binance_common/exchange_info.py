@@ -0,0 +1,156 @@
+# binance_common/exchange_info.py
+#
+# Cache filtrów handlowych symboli Binance (LOT_SIZE, PRICE_FILTER, MIN_NOTIONAL) - wspólny
+# dla bnbgrid (bnbbot1, bnbbot2) i v1 (ai_agent).
+
+import logging
+import threading
+import time
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+
+EXCHANGE_INFO_TTL = 3600  # sekundy; filtry symboli zmieniają się rzadko
+RETRY_DELAY = 60          # sekundy między próbami po nieudanym pobraniu exchangeInfo
+
+logger = logging.getLogger(__name__)
+
+
+def _step_quantize(value: Decimal, step: Decimal) -> Decimal:
+    """
+    Obcina wartość w dół do wielokrotności kroku (np. stepSize 0.001, tickSize 0.01).
+    """
+    if step <= 0:
+        return value
+    return ((value / step).to_integral_value(rounding=ROUND_DOWN) * step).quantize(step.normalize())
+
+
+class SymbolFilters:
+    """
+    Filtry handlowe jednego symbolu z exchangeInfo: LOT_SIZE, PRICE_FILTER i MIN_NOTIONAL/NOTIONAL.
+    """
+
+    def __init__(self, info: dict):
+        self.symbol = info["symbol"]
+        self.status = info.get("status", "TRADING")
+        self.base_asset = info.get("baseAsset")
+        self.quote_asset = info.get("quoteAsset")
+        self.quote_precision = int(info.get("quoteAssetPrecision", info.get("quotePrecision", 8)))
+
+        self.min_qty = Decimal("0")
+        self.max_qty = None
+        self.step_size = Decimal("0")
+        self.min_price = Decimal("0")
+        self.max_price = None
+        self.tick_size = Decimal("0")
+        self.min_notional = Decimal("0")
+        self.filters = {}
+
+        for f in info.get("filters", []):
+            self.filters[f["filterType"]] = f
+            if f["filterType"] == "LOT_SIZE":
+                self.min_qty = Decimal(f["minQty"])
+                self.max_qty = Decimal(f["maxQty"])
+                self.step_size = Decimal(f["stepSize"])
+            elif f["filterType"] == "PRICE_FILTER":
+                self.min_price = Decimal(f["minPrice"])
+                self.max_price = Decimal(f["maxPrice"])
+                self.tick_size = Decimal(f["tickSize"])
+            elif f["filterType"] in ("MIN_NOTIONAL", "NOTIONAL"):
+                # Binance zastępuje MIN_NOTIONAL filtrem NOTIONAL - oba mają minNotional
+                self.min_notional = Decimal(f.get("minNotional", "0"))
+
+    def quantize_quantity(self, quantity: Decimal) -> Decimal:
+        """
+        Ilość w walucie bazowej obcięta do stepSize i maxQty (LOT_SIZE).
+        """
+        if self.max_qty:
+            quantity = min(quantity, self.max_qty)
+        return _step_quantize(quantity, self.step_size)
+
+    def quantize_price(self, price: Decimal) -> Decimal:
+        """
+        Cena obcięta do tickSize (PRICE_FILTER).
+        """
+        return _step_quantize(price, self.tick_size)
+
+    def quantize_quote(self, amount: Decimal) -> Decimal:
+        """
+        Kwota w walucie kwotowanej (quoteOrderQty) obcięta do precyzji waluty kwotowanej.
+        """
+        return amount.quantize(Decimal(1).scaleb(-self.quote_precision), rounding=ROUND_DOWN)
+
+    def is_tradable(self, quantity: Decimal, price: Decimal = None) -> bool:
+        """
+        Czy zlecenie przejdzie LOT_SIZE (minQty) i MIN_NOTIONAL - inaczej Binance je odrzuci.
+        Bez ceny sprawdzamy tylko minQty.
+        """
+        if quantity <= 0 or quantity < self.min_qty:
+            return False
+        return price is None or quantity * price >= self.min_notional
+
+
+class ExchangeInfoCache:
+    """
+    Cache filtrów wszystkich symboli w pamięci procesu.
+
+    exchangeInfo (kilka MB) pobieramy raz na TTL jednym zapytaniem, a nie przy każdym zleceniu.
+    Gdy odświeżenie się nie uda, używamy poprzednich (przeterminowanych) danych.
+    """
+
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl
+        self._symbols = {}
+        self._fetched_at = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def get_ttl(self) -> int:
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, "BINANCE_EXCHANGE_INFO_TTL", EXCHANGE_INFO_TTL)
+
+    def _is_fresh(self) -> bool:
+        return self._fetched_at is not None and time.monotonic() - self._fetched_at < self.get_ttl()
+
+    def _recently_failed(self) -> bool:
+        # Po nieudanym odświeżeniu nie ponawiamy go przy każdym zleceniu
+        return self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_DELAY
+
+    def refresh(self, client):
+        exchange_info = client.get_exchange_info()
+        symbols = {info["symbol"]: SymbolFilters(info) for info in exchange_info.get("symbols", [])}
+        self._symbols = symbols
+        self._fetched_at = time.monotonic()
+        self._failed_at = None
+        logger.info(f"Odświeżono filtry {len(symbols)} symboli z exchangeInfo")
+
+    def get(self, client, symbol: str):
+        """
+        Zwraca SymbolFilters dla symbolu albo None (nieznany symbol / brak danych).
+        """
+        if self._is_fresh():
+            return self._symbols.get(symbol)
+
+        with self._lock:
+            # Inny wątek mógł odświeżyć cache, gdy czekaliśmy na blokadę
+            if not self._is_fresh() and not self._recently_failed():
+                try:
+                    self.refresh(client)
+                except Exception as e:
+                    self._failed_at = time.monotonic()
+                    logger.error(f"Nie udało się pobrać exchangeInfo: {e}")
+            return self._symbols.get(symbol)
+
+    def clear(self):
+        with self._lock:
+            self._symbols = {}
+            self._fetched_at = None
+            self._failed_at = None
+
+
+exchange_info_cache = ExchangeInfoCache()
+
+
+def get_symbol_filters(client, symbol: str):
+    return exchange_info_cache.get(client, symbol)
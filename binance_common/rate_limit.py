@@ -0,0 +1,348 @@
+# binance_common/rate_limit.py
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlparse
+
+from django.conf import settings
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+
+try:
+    import redis
+except ImportError:  # bez Redis limity liczymy tylko w obrębie procesu
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Limity Binance Spot: waga zapytań na IP na minutę i liczba zleceń na konto na 10 s
+IP_WEIGHT_LIMIT = 6000
+ORDER_LIMIT_10S = 100
+HEADROOM = 0.9  # używamy najwyżej 90% limitu - zapas na zegar i zapytania spoza governora
+
+# Priorytety (mniejszy = ważniejszy) i część pojemności zarezerwowana dla ważniejszych wywołań
+PRIORITY_ORDER = 0  # składanie/anulowanie zleceń
+PRIORITY_SYNC = 1   # statusy zleceń, konto, exchangeInfo
+PRIORITY_PRICE = 2  # odświeżanie cen
+RESERVE = {PRIORITY_ORDER: 0.0, PRIORITY_SYNC: 0.1, PRIORITY_PRICE: 0.3}
+MAX_WAIT = {PRIORITY_ORDER: 10.0, PRIORITY_SYNC: 5.0, PRIORITY_PRICE: 1.0}  # sekundy kolejki przed odrzuceniem
+
+# Wagi endpointów /api/v3 (https://binance-docs.github.io/apidocs/spot/en/#limits)
+REQUEST_WEIGHTS = {
+    "ping": 1, "time": 1, "exchangeInfo": 20, "ticker/price": 2, "ticker/24hr": 2, "ticker/bookTicker": 2,
+    "klines": 2, "depth": 5, "order": 4, "openOrders": 6, "allOrders": 20, "myTrades": 20,
+    "account": 20, "userDataStream": 2,
+}
+NO_SYMBOL_WEIGHTS = {"ticker/price": 4, "ticker/24hr": 80, "ticker/bookTicker": 4, "openOrders": 80}
+ORDER_ENDPOINTS = ("order", "order/oco", "orderList/oco")
+
+# Klucze w Redis są wspólne dla wszystkich usług (bnbbot1, bnbbot2, v1) na tym samym IP
+KEY_PREFIX = "binance:rl"
+BAN_STATUS_CODES = (418, 429)
+
+# Atomowe pobranie tokenów z kilku kubełków naraz: uzupełnia je wg czasu serwera Redis
+# i odejmuje koszt tylko, gdy po odjęciu w każdym zostaje rezerwa. Zwraca czas oczekiwania (s).
+TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local state = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 4 - 3])
+    local rate = tonumber(ARGV[i * 4 - 2])
+    local cost = tonumber(ARGV[i * 4 - 1])
+    local reserve = tonumber(ARGV[i * 4])
+    local data = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens - cost < reserve then
+        wait = math.max(wait, (cost + reserve - tokens) / rate)
+    end
+    state[i] = {tokens, cost}
+end
+for i, key in ipairs(KEYS) do
+    local tokens = state[i][1]
+    if wait == 0 then tokens = tokens - state[i][2] end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, 120)
+end
+return tostring(wait)
+"""
+
+# Zużycie zgłoszone przez giełdę (nagłówki X-MBX-*) obniża stan kubełka, nigdy go nie podnosi
+OBSERVE_SCRIPT = """
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local ceiling = tonumber(ARGV[1])
+local tokens = tonumber(data[1])
+if tokens == nil or tokens > ceiling then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(ceiling), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], 120)
+end
+return 1
+"""
+
+
+class RateLimitExceeded(BinanceAPIException):
+    """
+    Zapytanie odrzucone przez governor (kolejka dłuższa niż MAX_WAIT dla priorytetu albo ban IP).
+    Dziedziczy po BinanceAPIException, więc istniejąca obsługa błędów Binance traktuje je jak
+    odrzucone zapytanie (kod -1003 TOO_MANY_REQUESTS) - bez wysłania go na giełdę.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(None, 429, json.dumps({"code": -1003, "msg": message}))
+
+
+class LocalBucketStore:
+    """
+    Kubełki w pamięci procesu - gdy Redis nie jest skonfigurowany lub niedostępny.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # {key: (tokens, ts)}
+        self._blocked_until = 0.0
+
+    def take(self, buckets: list) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            state = []
+            for key, capacity, rate, cost, reserve in buckets:
+                tokens, ts = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+                if tokens - cost < reserve:
+                    wait = max(wait, (cost + reserve - tokens) / rate)
+                state.append((key, tokens, cost))
+            for key, tokens, cost in state:
+                self._buckets[key] = (tokens - cost if wait == 0 else tokens, now)
+            return wait
+
+    def observe(self, key: str, ceiling: float):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (None, now))
+            if tokens is None or tokens > ceiling:
+                self._buckets[key] = (ceiling, now)
+
+    def block(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self) -> float:
+        return max(0.0, self._blocked_until - time.monotonic())
+
+
+class RedisBucketStore:
+    """
+    Kubełki w Redis - jeden limit dla wszystkich procesów i usług korzystających z tego samego IP/klucza.
+    """
+
+    def __init__(self, url: str):
+        self.redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self.redis.register_script(TAKE_SCRIPT)
+        self._observe = self.redis.register_script(OBSERVE_SCRIPT)
+
+    def take(self, buckets: list) -> float:
+        keys = [key for key, *_ in buckets]
+        args = [value for _, *values in buckets for value in values]
+        return float(self._take(keys=keys, args=args))
+
+    def observe(self, key: str, ceiling: float):
+        self._observe(keys=[key], args=[ceiling])
+
+    def block(self, seconds: float):
+        self.redis.set(f"{KEY_PREFIX}:blocked", "1", px=max(1, int(seconds * 1000)))
+
+    def blocked_for(self) -> float:
+        ttl = self.redis.pttl(f"{KEY_PREFIX}:blocked")
+        return ttl / 1000 if ttl and ttl > 0 else 0.0
+
+
+_priority = threading.local()
+
+
+@contextmanager
+def rate_priority(priority: int):
+    """
+    Priorytet zapytań Binance wykonywanych w bloku (w bieżącym wątku), np.:
+        with rate_priority(PRIORITY_PRICE):
+            client.get_symbol_ticker(...)
+    """
+    previous = getattr(_priority, "value", None)
+    _priority.value = priority
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def request_cost(method: str, uri: str, params) -> tuple:
+    """
+    (waga IP, liczba zleceń, domyślny priorytet) zapytania do /api/v3.
+    Składanie i anulowanie zleceń ma zawsze PRIORITY_ORDER; pozostałe - priorytet z rate_priority().
+    """
+    path = urlparse(uri).path
+    path = path.split("/api/v3/", 1)[1] if "/api/v3/" in path else path.rsplit("/", 1)[-1]
+    params = params if isinstance(params, dict) else {}
+    method = method.upper()
+
+    if path in ORDER_ENDPOINTS and method in ("POST", "DELETE"):
+        return 1, 1 if method == "POST" else 0, PRIORITY_ORDER
+    weight = REQUEST_WEIGHTS.get(path, 1)
+    if path in NO_SYMBOL_WEIGHTS and "symbol" not in params:
+        weight = NO_SYMBOL_WEIGHTS[path]
+    return weight, 0, PRIORITY_SYNC
+
+
+def account_key(api_key: str) -> str:
+    # Klucz API nie trafia do Redis wprost
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class RateGovernor:
+    """
+    Wspólny limiter zapytań do Binance: token bucket na wagę IP (na minutę) i na liczbę zleceń
+    konta (na 10 s), trzymany w Redis, żeby wszystkie procesy i usługi liczyły ten sam limit.
+
+    Wywołujący o niższym priorytecie nie mogą zejść poniżej rezerwy zostawionej dla ważniejszych
+    (zlecenia > statusy > ceny); gdy na tokeny trzeba czekać dłużej niż MAX_WAIT dla priorytetu,
+    zapytanie jest odrzucane (RateLimitExceeded) zamiast ryzykować 429/418. Nagłówki
+    X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S korygują stan kubełków do zużycia widzianego
+    przez giełdę, a 429/418 z Retry-After wstrzymuje wszystkie zapytania z tego IP.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._local = LocalBucketStore()
+        self._retry_redis_at = 0.0
+
+    def get_store(self):
+        if self._store is not None:
+            return self._store
+        url = getattr(settings, "BINANCE_RATE_LIMIT_REDIS_URL", None)
+        if url and redis is not None and time.monotonic() >= self._retry_redis_at:
+            try:
+                self._store = RedisBucketStore(url)
+                return self._store
+            except Exception as e:
+                self._redis_failed(e)
+        return self._local
+
+    def _redis_failed(self, error):
+        logger.warning(f"Redis niedostępny ({error}), limity Binance liczone lokalnie")
+        self._store = None
+        self._retry_redis_at = time.monotonic() + 60
+
+    def _call(self, method: str, *args):
+        store = self.get_store()
+        try:
+            return getattr(store, method)(*args)
+        except Exception as e:
+            if store is self._local:
+                raise
+            self._redis_failed(e)
+            return getattr(self._local, method)(*args)
+
+    def limits(self) -> tuple:
+        headroom = getattr(settings, "BINANCE_RATE_LIMIT_HEADROOM", HEADROOM)
+        weight = getattr(settings, "BINANCE_RATE_LIMIT_WEIGHT", IP_WEIGHT_LIMIT) * headroom
+        orders = getattr(settings, "BINANCE_RATE_LIMIT_ORDERS_10S", ORDER_LIMIT_10S) * headroom
+        return weight, orders
+
+    def buckets(self, weight: int, api_key: str, orders: int, priority: int) -> list:
+        weight_capacity, order_capacity = self.limits()
+        reserve = RESERVE.get(priority, 0.0)
+        buckets = [(f"{KEY_PREFIX}:ip:weight", weight_capacity, weight_capacity / 60, weight,
+                    weight_capacity * reserve)]
+        if orders:
+            buckets.append((f"{KEY_PREFIX}:key:{account_key(api_key)}:orders", order_capacity,
+                            order_capacity / 10, orders, order_capacity * reserve))
+        return buckets
+
+    def acquire(self, weight: int, api_key: str = None, orders: int = 0, priority: int = PRIORITY_SYNC,
+                max_wait: float = None):
+        """
+        Czeka na tokeny dla zapytania (najwyżej max_wait s) albo rzuca RateLimitExceeded.
+        """
+        if max_wait is None:
+            max_wait = MAX_WAIT.get(priority, 0.0)
+        deadline = time.monotonic() + max_wait
+        buckets = self.buckets(weight, api_key, orders, priority)
+        while True:
+            wait = self._call("blocked_for")
+            if not wait:
+                wait = self._call("take", buckets)
+                if not wait:
+                    return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit governor: request shed (priority {priority}, wait {wait:.1f}s)")
+            time.sleep(min(wait, 1.0))
+
+    def observe(self, response, api_key: str = None):
+        """
+        Koryguje kubełki o zużycie z nagłówków odpowiedzi; przy 429/418 wstrzymuje zapytania z IP.
+        """
+        if response is None:
+            return
+        headers = getattr(response, "headers", None) or {}
+        weight_capacity, order_capacity = self.limits()
+        used = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("X-MBX-USED-WEIGHT")
+        if used is not None:
+            self._call("observe", f"{KEY_PREFIX}:ip:weight", weight_capacity - float(used))
+        order_count = headers.get("X-MBX-ORDER-COUNT-10S")
+        if order_count is not None and api_key:
+            self._call("observe", f"{KEY_PREFIX}:key:{account_key(api_key)}:orders",
+                       order_capacity - float(order_count))
+
+        if getattr(response, "status_code", None) in BAN_STATUS_CODES:
+            retry_after = float(headers.get("Retry-After") or 60)
+            logger.warning(f"Binance HTTP {response.status_code}, wstrzymuję zapytania na {retry_after:.0f}s")
+            self._call("block", retry_after)
+
+
+governor = RateGovernor()
+
+
+class GovernedClient(Client):
+    """
+    Klient python-binance, którego każde zapytanie przechodzi przez governor (kolejka/odrzucenie
+    przed wysłaniem, korekta z nagłówków X-MBX-* po odpowiedzi).
+    """
+
+    def _request(self, method, uri: str, signed: bool, force_params: bool = False, **kwargs):
+        weight, orders, priority = request_cost(method, uri, kwargs.get("data") or kwargs.get("params"))
+        if priority != PRIORITY_ORDER and getattr(_priority, "value", None) is not None:
+            priority = _priority.value
+        governor.acquire(weight, self.API_KEY, orders, priority)
+
+        # Odpowiednik Client._request bez zapisu do self.response - klient z puli jest współdzielony
+        # między wątkami, więc wysyłka, nagłówki X-MBX-* i obsługa odpowiedzi idą na zmiennej lokalnej.
+        headers = {}
+        if method.upper() in ["POST", "PUT", "DELETE"]:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if "data" in kwargs and "headers" in kwargs["data"]:
+            headers.update(kwargs["data"].pop("headers"))
+
+        kwargs = self._get_request_kwargs(method, signed, force_params, **kwargs)
+        data = kwargs.pop("data", None)
+        if signed and self.PRIVATE_KEY and data:
+            # Podpis Ed25519/RSA musi być ostatnim parametrem treści POST
+            dict_data = Client.convert_to_dict(data)
+            signature = dict_data.pop("signature", None)
+            data = f"{urlencode(dict_data)}&signature={signature}"
+
+        response = getattr(self.session, method)(uri, headers=headers, data=data, **kwargs)
+        # Przed obsługą błędu - 429/418 rzuca wyjątek, a nagłówki i tak trzeba odczytać
+        governor.observe(response, self.API_KEY)
+        if self.verbose:
+            self.logger.debug("Request: %s %s, Response: %s %s", method.upper(), uri,
+                              response.status_code, response.text[:1000] if response.text else None)
+        return self._handle_response(response)
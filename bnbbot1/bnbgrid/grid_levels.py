@@ -0,0 +1,81 @@
+# bnbgrid/grid_levels.py
+
+from bisect import bisect_right
+from decimal import Decimal
+
+
+class GridLevels:
+    """
+    Skompilowana postać poziomów bota: ceny poziomów (progi kupna) i ceny docelowe
+    sprzedaży jako posortowane tablice Decimal.
+
+    Zamiast porównywać cenę z każdym poziomem w każdym ticku, pytamy, które progi
+    zostały przekroczone między poprzednią a bieżącą ceną (bisect po tablicach).
+    """
+
+    def __init__(self, levels_data: dict):
+        self.level_names = sorted([k for k in levels_data.keys() if k.startswith("lv")],
+                                  key=lambda x: int(x.replace("lv", "")))
+        self.level_index = {lv_name: idx for idx, lv_name in enumerate(self.level_names)}
+
+        # Progi KUPNA: kupujemy gdy current_price < cena poziomu
+        self.prices = {lv_name: Decimal(str(levels_data[lv_name])) for lv_name in self.level_names}
+        buy = sorted((price, lv_name) for lv_name, price in self.prices.items())
+        self._buy_prices = [p for p, _ in buy]
+        self._buy_names = [lv for _, lv in buy]
+
+        # Progi SPRZEDAŻY: sprzedajemy gdy current_price >= cena poziomu z sell_levels
+        self.sell_targets = {}
+        for lv_name, sell_lv_name in levels_data.get("sell_levels", {}).items():
+            if lv_name in self.prices and sell_lv_name in levels_data:
+                self.sell_targets[lv_name] = Decimal(str(levels_data[sell_lv_name]))
+        sell = sorted((price, lv_name) for lv_name, price in self.sell_targets.items())
+        self._sell_prices = [p for p, _ in sell]
+        self._sell_names = [lv for _, lv in sell]
+
+    def buy_crossed(self, prev_price, current_price) -> list:
+        """
+        Poziomy, dla których current_price < cena poziomu, a prev_price nie był poniżej
+        (próg przekroczony w dół od ostatniej ceny). prev_price=None -> wszystkie poniżej ceny.
+        """
+        lo = bisect_right(self._buy_prices, current_price)
+        hi = len(self._buy_prices) if prev_price is None else bisect_right(self._buy_prices, prev_price)
+        return self._buy_names[lo:hi]
+
+    def sell_crossed(self, prev_price, current_price) -> list:
+        """
+        Poziomy, dla których current_price >= cena docelowa sprzedaży, a prev_price był poniżej
+        (próg przekroczony w górę od ostatniej ceny). prev_price=None -> wszystkie osiągnięte.
+        """
+        hi = bisect_right(self._sell_prices, current_price)
+        lo = 0 if prev_price is None else bisect_right(self._sell_prices, prev_price)
+        return self._sell_names[lo:hi]
+
+    def crossed(self, prev_price, current_price) -> list:
+        """
+        Nazwy poziomów do sprawdzenia w tym ticku, w kolejności lv1, lv2, ...
+        """
+        names = set(self.buy_crossed(prev_price, current_price))
+        names.update(self.sell_crossed(prev_price, current_price))
+        return sorted(names, key=self.level_index.get)
+
+    def trigger_band(self, current_price, flags: dict) -> tuple:
+        """
+        (lo, hi) - najbliższe progi wokół current_price, których przekroczenie zmieni stan bota:
+        KUPNO niekupionego poziomu (cena spadnie poniżej lo), SPRZEDAŻ kupionego (cena >= hi)
+        albo zamknięcie bota (cena > 110% lv1). None, gdy z danej strony nie ma progu.
+        """
+        lo = None
+        hi = self.prices["lv1"] * Decimal("1.1") if "lv1" in self.prices else None
+        for lv_name in self.level_names:
+            if flags.get(f"{lv_name}_in_progress", False):
+                continue
+            if flags.get(f"{lv_name}_bought", False):
+                target = self.sell_targets.get(lv_name)
+                if target is not None and target > current_price and (hi is None or target < hi):
+                    hi = target
+            else:
+                price = self.prices[lv_name]
+                if price <= current_price and (lo is None or price > lo):
+                    lo = price
+        return lo, hi
@@ -0,0 +1,73 @@
+# bnbgrid/management/commands/bnb_backtest.py
+# -----------------------------------------------------------------------------
+# Backtest siatki (generate_levels) na historycznych cenach z pliku CSV Binance
+# (świece 1m lub transakcje) według reguł run_grid_bot, bez bazy i bez giełdy.
+#
+# python manage.py bnb_backtest BTCUSDT-1m-2024.csv --max-price 70000 --percent 2 --capital 1000
+# python manage.py bnb_backtest BTCUSDT-trades.csv --kind trades --max-price 70000 --percent 1 --capital 500 --trades
+# python manage.py bnb_backtest --symbol BTCUSDT --start 2024-01-01 --max-price 70000 --percent 2 --capital 1000
+# -----------------------------------------------------------------------------
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bnbgrid.backtest import load_price_series, load_store_series, run_backtest
+from bnbgrid.kline_store import KlineStore, parse_time_ms
+from bnbgrid.views import generate_levels
+
+
+class Command(BaseCommand):
+    help = 'Replay historical prices through the grid bot rules and report trades and P&L'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='Binance CSV with klines or trades')
+        parser.add_argument('--max-price', type=float, required=True)
+        parser.add_argument('--percent', type=float, required=True)
+        parser.add_argument('--capital', type=float, required=True)
+        parser.add_argument('--min-price', type=float, default=None)
+        parser.add_argument('--decimals', type=int, default=3)
+        parser.add_argument('--kind', choices=['klines', 'trades', 'aggtrades'], default='klines')
+        parser.add_argument('--symbol', help='Read klines from the local store (bnb_klines) instead of a file')
+        parser.add_argument('--interval', default='1m')
+        parser.add_argument('--start', help='Store range start (ms or ISO date, UTC)')
+        parser.add_argument('--end', help='Store range end (ms or ISO date, UTC, exclusive)')
+        parser.add_argument('--path', choices=['close', 'ohlc'], default='close',
+                            help='Price path inside a candle (default: close only)')
+        parser.add_argument('--trades', action='store_true', help='Print every simulated trade')
+
+    def handle(self, *args, **options):
+        levels_data = generate_levels(options['max_price'], options['percent'], options['capital'],
+                                      options['min_price'], options['decimals'])
+        if "lv1" not in levels_data:
+            raise CommandError('Parametry nie dają żadnego poziomu')
+
+        if options['symbol']:
+            times, prices = load_store_series(KlineStore(), options['symbol'], options['interval'],
+                                              parse_time_ms(options['start']), parse_time_ms(options['end']),
+                                              options['path'])
+        elif options['file']:
+            try:
+                times, prices = load_price_series(options['file'], options['kind'], options['path'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Nie udało się wczytać {options["file"]}: {e}')
+        else:
+            raise CommandError('Podaj plik CSV albo --symbol')
+        if not len(prices):
+            raise CommandError('Brak cen w podanym zakresie')
+
+        started = time.perf_counter()
+        result = run_backtest(levels_data, prices)
+        elapsed = time.perf_counter() - started
+
+        if options['trades']:
+            for t in result.trades:
+                profit = "" if t["profit"] is None else f" profit={t['profit']:.4f}"
+                self.stdout.write(f"{int(times[t['tick']])} {t['level']:<5} {t['side']:<4} "
+                                  f"price={t['price']:.8g} qty={t['quantity']:.8g}{profit}")
+
+        levels = sum(1 for k in levels_data if k.startswith("lv"))
+        self.stdout.write(f"{len(prices)} cen, {levels} poziomów, symulacja {elapsed:.3f}s")
+        for key, value in result.summary().items():
+            self.stdout.write(f"  {key:<20} {value if isinstance(value, (int, type(None))) else f'{value:.4f}'}")
+        if result.finished_at is not None:
+            self.stdout.write(f"  Bot zakończony (cena > 110% lv1) w {int(times[result.finished_at])}")
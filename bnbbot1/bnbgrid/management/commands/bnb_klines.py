@@ -0,0 +1,54 @@
+# bnbgrid/management/commands/bnb_klines.py
+# -----------------------------------------------------------------------------
+# Lokalny magazyn świec (bnbgrid.kline_store): pobieranie z Binance, import
+# plików CSV z data.binance.vision i podgląd zawartości. Pobieranie zaczyna od
+# ostatniej zapisanej świecy, więc można je uruchamiać cyklicznie (cron).
+#
+# python manage.py bnb_klines download BTCUSDT --interval 1m --start 2024-01-01
+# python manage.py bnb_klines ingest BTCUSDT BTCUSDT-1m-2024-01.csv --interval 1m
+# python manage.py bnb_klines info BTCUSDT --interval 1m
+# -----------------------------------------------------------------------------
+from datetime import datetime, timezone
+
+from binance.client import Client
+from django.core.management.base import BaseCommand, CommandError
+
+from bnbgrid.bnb_manager import REQUEST_TIMEOUT
+from bnbgrid.kline_store import KlineStore, download_klines, ingest_csv, parse_time_ms
+
+
+class Command(BaseCommand):
+    help = 'Download, import and inspect locally stored OHLCV klines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['download', 'ingest', 'info'])
+        parser.add_argument('symbol')
+        parser.add_argument('file', nargs='?', help='CSV file for ingest')
+        parser.add_argument('--interval', default='1m')
+        parser.add_argument('--start', help='Start (ms or ISO date, UTC) for download')
+        parser.add_argument('--end', help='End (ms or ISO date, UTC, exclusive) for download')
+
+    def handle(self, *args, **options):
+        store = KlineStore()
+        symbol, interval = options['symbol'].upper(), options['interval']
+
+        if options['action'] == 'download':
+            if not options['start'] and store.last_open_time(symbol, interval) is None:
+                raise CommandError('Pusty magazyn - podaj --start')
+            # Świece są publiczne - klient bez kluczy API
+            client = Client("", "", {"timeout": REQUEST_TIMEOUT})
+            appended = download_klines(client, store, symbol, interval,
+                                       parse_time_ms(options['start']) or 0, parse_time_ms(options['end']))
+            self.stdout.write(f"Dopisano {appended} świec {symbol} {interval}.")
+        elif options['action'] == 'ingest':
+            if not options['file']:
+                raise CommandError('Podaj plik CSV')
+            appended = ingest_csv(store, symbol, interval, options['file'])
+            self.stdout.write(f"Dopisano {appended} świec {symbol} {interval} z {options['file']}.")
+
+        klines = store.read(symbol, interval)
+        if not len(klines):
+            self.stdout.write(f"{symbol} {interval}: brak danych w {store.series_dir(symbol, interval)}")
+            return
+        first, last = (datetime.fromtimestamp(int(t) / 1000, tz=timezone.utc) for t in klines.open_time[[0, -1]])
+        self.stdout.write(f"{symbol} {interval}: {len(klines)} świec, {first:%Y-%m-%d %H:%M} - {last:%Y-%m-%d %H:%M} UTC")
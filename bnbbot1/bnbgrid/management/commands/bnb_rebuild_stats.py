@@ -0,0 +1,39 @@
+# bnbgrid/management/commands/bnb_rebuild_stats.py
+# -----------------------------------------------------------------------------
+# Odbudowuje rollup zysków (BnbBotStats + dzienne BnbBotDailyProfit) z historii
+# BnbTrade. Historię sprzed rollupu uzupełnia migracja 0022_backfill_bot_stats;
+# uruchom, gdy transakcje były poprawiane ręcznie w bazie.
+# Worker może działać - tick bota czeka na koniec jego odbudowy.
+#
+# python manage.py bnb_rebuild_stats --bots 3 7
+# python manage.py bnb_rebuild_stats --all
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+
+from bnbgrid.models import BnbBot
+from bnbgrid.stats import rebuild_bot_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-bot profit rollups (BnbBotStats, BnbBotDailyProfit) from trade history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bots', type=int, nargs='+', help='Bot ids to rebuild')
+        parser.add_argument('--all', action='store_true', help='Rebuild every bot')
+
+    def handle(self, *args, **options):
+        if not options['bots'] and not options['all']:
+            raise CommandError('Podaj --bots <id ...> albo --all')
+
+        bot_ids = BnbBot.objects.order_by('id').values_list('id', flat=True)
+        if options['bots']:
+            bot_ids = bot_ids.filter(id__in=options['bots'])
+
+        rebuilt = 0
+        for bot_id in bot_ids:
+            stats = rebuild_bot_stats(bot_id)
+            rebuilt += 1
+            self.stdout.write(f"Bot {bot_id}: {stats.trade_count} transakcji, {stats.tp_count} TP, "
+                              f"zysk {stats.total_profit}")
+
+        self.stdout.write(self.style.SUCCESS(f"Odbudowano rollup {rebuilt} botów."))
@@ -0,0 +1,41 @@
+# bnbgrid/management/commands/bnb_state_benchmark.py
+# -----------------------------------------------------------------------------
+# Mikrobenchmark odczytu levels_data/runtime_data: stary format (str(dict) + eval)
+# vs. format wersjonowany (JSON). Nie dotyka bazy - dane generuje generate_levels.
+#
+# python manage.py bnb_state_benchmark --levels 50 --number 20000
+# -----------------------------------------------------------------------------
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from bnbgrid.state_codec import JSON_VERSION, LEGACY_VERSION, decode_state, encode_state
+from bnbgrid.views import generate_levels, init_runtime_data
+
+
+class Command(BaseCommand):
+    help = 'Measure decode cost of bot state (legacy eval vs. versioned JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', type=int, default=50, help='Number of grid levels (default: 50)')
+        parser.add_argument('--number', type=int, default=20000, help='Decodes per measurement (default: 20000)')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        levels_data = generate_levels(100, 100 / (options['levels'] + 1), 1000)
+        level_names = [k for k in levels_data if k.startswith("lv")]
+        runtime_data = init_runtime_data(level_names)
+
+        for name, data in (("levels_data", levels_data), ("runtime_data", runtime_data)):
+            legacy = encode_state(data, version=LEGACY_VERSION)
+            current = encode_state(data, version=JSON_VERSION)
+
+            cases = (
+                ("eval (old)", lambda: eval(legacy)),
+                ("decode_state v0", lambda: decode_state(legacy)),
+                ("decode_state v1", lambda: decode_state(current)),
+            )
+            self.stdout.write(f"{name} ({len(level_names)} levels, v0={len(legacy)}B, v1={len(current)}B)")
+            for label, fn in cases:
+                seconds = timeit.timeit(fn, number=number)
+                self.stdout.write(f"  {label:<18} {seconds / number * 1e6:8.2f} us/decode")
@@ -0,0 +1,41 @@
+# bnbgrid/management/commands/run_bnb_worker.py
+# -----------------------------------------------------------------------------
+# Uruchamia worker grid botów jako osobny proces (na pierwszym planie).
+# Z BNB_WORKER_SHARDING = True można uruchomić kilka takich procesów (na wielu
+# rdzeniach/hostach) - każdy prowadzi rozłączny podzbiór botów RUNNING.
+# Histogramy ticków są zbierane w tym procesie: --metrics-port (albo
+# BNB_WORKER_METRICS_PORT) wystawia je na osobnym porcie; przy wspólnym
+# PROMETHEUS_MULTIPROC_DIR pokazuje je też /metrics procesu web.
+#
+# python manage.py run_bnb_worker
+# python manage.py run_bnb_worker --metrics-port 9101
+# -----------------------------------------------------------------------------
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bnbgrid import bnb_logic
+from bnbgrid.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = 'Run the grid bot worker in the foreground (one shard when BNB_WORKER_SHARDING is on)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metrics-port', type=int, help='Expose this worker\'s Prometheus metrics on this port')
+
+    def handle(self, *args, **options):
+        port = options['metrics_port'] or getattr(settings, 'BNB_WORKER_METRICS_PORT', None)
+        if port:
+            start_metrics_server(port)
+        thread = bnb_logic.start_bnb_worker()
+        try:
+            while thread.is_alive():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Oddajemy boty od razu, zamiast czekać aż inne workery uznają nas za martwych
+            if bnb_logic.shard is not None:
+                bnb_logic.shard.release_all()
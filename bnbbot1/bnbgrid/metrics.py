@@ -0,0 +1,135 @@
+# bnbgrid/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+try:
+    # prometheus_client przychodzi z django-prometheus; histogramy trafiają do jego domyślnego rejestru
+    from prometheus_client import Histogram, start_http_server
+except ImportError:  # bez prometheus_client czasy ticków są tylko logowane (wolne ticki)
+    Histogram = start_http_server = None
+
+# Granice kubełków histogramów (sekundy) - od pojedynczych ms do deadline'u bota
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+SLOW_TICK_SECONDS = 2.0  # tick dłuższy niż to trafia do logu (nadpisywane przez BNB_SLOW_TICK_SECONDS)
+
+# Etapy ticka bota mierzone przez span()
+PHASES = ("price_fetch", "decode", "decision", "order", "db_write", "encode")
+
+_local = threading.local()
+
+if Histogram is not None:
+    TICK_PHASE_SECONDS = Histogram("bnb_tick_phase_seconds", "Time spent in one phase of a grid bot tick.",
+                                   ("bot", "symbol", "phase"), buckets=LATENCY_BUCKETS)
+    TICK_SECONDS = Histogram("bnb_tick_seconds",
+                             "Grid bot tick latency from the price snapshot to the committed DB write.",
+                             ("bot", "symbol"), buckets=LATENCY_BUCKETS)
+else:
+    TICK_PHASE_SECONDS = TICK_SECONDS = None
+
+_bot_series = {}  # {bot_id: {(histogram, etykiety)}} - serie do usunięcia przez forget_bot
+_series_lock = threading.Lock()
+
+
+def _observe(histogram, labels: tuple, value: float):
+    if histogram is None:
+        return
+    histogram.labels(*labels).observe(value)
+    with _series_lock:
+        _bot_series.setdefault(labels[0], set()).add((histogram, labels))
+
+
+class TickTimer:
+    """
+    Pomiar jednego ticka bota: czasy etapów (span) sumowane w ramach ticka i czas całkowity
+    liczony od `started` (początek pobierania snapshotu cen w cyklu worker-a).
+    finish() zapisuje je do histogramów i loguje tick wolniejszy niż BNB_SLOW_TICK_SECONDS.
+    """
+
+    def __init__(self, bot_id: int, symbol: str, started: float = None):
+        self.bot_id = bot_id
+        self.symbol = symbol
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}
+        self.finished = False
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def span(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    @contextmanager
+    def activate(self):
+        """
+        Ustawia timer jako bieżący w wątku - span() w bnb_manager mierzy wtedy do niego.
+        """
+        previous = getattr(_local, "timer", None)
+        _local.timer = self
+        try:
+            yield self
+        finally:
+            _local.timer = previous
+
+    def finish(self) -> float:
+        if self.finished:
+            return 0.0
+        self.finished = True
+        total = time.perf_counter() - self.started
+        bot = str(self.bot_id)
+        for phase, seconds in self.phases.items():
+            _observe(TICK_PHASE_SECONDS, (bot, self.symbol, phase), seconds)
+        _observe(TICK_SECONDS, (bot, self.symbol), total)
+
+        threshold = getattr(settings, "BNB_SLOW_TICK_SECONDS", SLOW_TICK_SECONDS)
+        if threshold is not None and total >= threshold:
+            breakdown = " ".join(f"{phase}={self.phases[phase] * 1000:.0f}ms"
+                                 for phase in PHASES if phase in self.phases)
+            print(f"[metrics] Bot {self.bot_id} ({self.symbol}): wolny tick {total * 1000:.0f}ms - {breakdown}")
+        return total
+
+
+def current_timer():
+    return getattr(_local, "timer", None)
+
+
+def span(phase: str):
+    """
+    Mierzy etap ticka bieżącego bota; poza tickiem worker-a (brak aktywnego timera) nic nie robi.
+    """
+    timer = current_timer()
+    return nullcontext() if timer is None else timer.span(phase)
+
+
+def forget_bot(bot_id: int):
+    """
+    Usuwa serie zakończonego bota, żeby /metrics nie rosło o boty, których już nie ma.
+    """
+    with _series_lock:
+        series = _bot_series.pop(str(bot_id), set())
+    for histogram, labels in series:
+        try:
+            histogram.remove(*labels)
+        except KeyError:
+            pass
+
+
+def start_metrics_server(port: int) -> bool:
+    """
+    Wystawia metryki procesu worker-a (run_bnb_worker) na własnym porcie HTTP - histogramy ticków
+    są zbierane w procesie worker-a, a nie w procesie web z /metrics.
+    """
+    if start_http_server is None:
+        print("[metrics] Brak prometheus_client - serwer metryk worker-a nie wystartuje.")
+        return False
+    start_http_server(port, addr="127.0.0.1")
+    print(f"[metrics] Metryki worker-a na http://127.0.0.1:{port}/metrics")
+    return True
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0015_bnbjournalevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bnblevelstate',
+            name='cycle',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0017_bnbbot_order_mode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bnbtrade',
+            index=models.Index(fields=['bot', 'side', 'status', 'level'], name='bnbgrid_bnb_bot_id_bd5b26_idx'),
+        ),
+    ]
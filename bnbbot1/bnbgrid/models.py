@@ -3,6 +3,8 @@ from decimal import Decimal
 import json
 from cryptography.fernet import Fernet
 
+from .state_codec import decode_state, encode_state
+
 # Przykładowy klucz szyfrujący (możesz zmienić)
 FERNET_KEY = "GiLFpoI4-TzsPAheWRYytzPXuOlZVHOz5FrZsjHYZSk="
 fernet = Fernet(FERNET_KEY)
@@ -24,7 +26,7 @@ class BnbBot(models.Model):
         ('STOPPED', 'Stopped'),
     )
 
-    user_id = models.IntegerField()
+    user_id = models.IntegerField(db_index=True)
     name = models.CharField(max_length=100)
     symbol = models.CharField(max_length=50)  # np. BTCUSDT
 
@@ -41,6 +43,24 @@ class BnbBot(models.Model):
     binance_api_secret_enc = models.BinaryField(blank=True, null=True)
 
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='STOPPED')
+
+    # MARKET - zlecenia rynkowe po przekroczeniu poziomu przez cenę z ticka;
+    # LIMIT - zlecenia LIMIT czekające na giełdzie, worker reaguje na wypełnienia ze strumienia użytkownika
+    MARKET_MODE = 'MARKET'
+    LIMIT_MODE = 'LIMIT'
+    ORDER_MODE_CHOICES = (
+        (MARKET_MODE, 'Market orders'),
+        (LIMIT_MODE, 'Resting limit orders'),
+    )
+    order_mode = models.CharField(max_length=10, choices=ORDER_MODE_CHOICES, default=MARKET_MODE)
+
+    # Stan poziomów (caps, flagi, buy_price, buy_volume) w tabeli BnbLevelState zamiast w runtime_data
+    use_level_table = models.BooleanField(default=False)
+
+    # Worker (proces), który prowadzi bota w trybie shardingu (BNB_WORKER_SHARDING)
+    worker_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # Podbijany przy każdej zmianie właściciela - tick sprawdza go przed złożeniem zleceń (sharding.hold_lease)
+    lease_epoch = models.PositiveIntegerField(default=0)
     
     # Dodajemy pola czasowe
     created_at = models.DateTimeField(auto_now_add=True, null=True)
@@ -50,29 +70,106 @@ class BnbBot(models.Model):
         return f"BnbBot(id={self.id}, user={self.user_id}, symbol={self.symbol}, status={self.status})"
 
     def get_levels_data(self) -> dict:
-        if not self.levels_data:
-            return {}
-        # jeśli zapisujesz w formie stringa przez str(data), można używać eval
-        # jeśli w formie JSON, to json.loads()
-        return eval(self.levels_data)
+        # Format wersjonowany (JSON); stare wiersze str(dict) czytamy bez eval()
+        return decode_state(self.levels_data)
 
     def save_levels_data(self, data: dict):
         """
         Ustawia atrybut levels_data, ale NIE wywołuje self.save().
         """
-        self.levels_data = str(data)
+        self.levels_data = encode_state(data)
         # UWAGA: USUWAMY self.save()!
         # Poprawność w asynchronicznym kodzie zapewniamy przez await sync_to_async(bot.save)()
 
     def get_runtime_data(self) -> dict:
-        if not self.runtime_data:
-            return {}
-        return eval(self.runtime_data)  # lub json.loads
+        return decode_state(self.runtime_data)
 
     def save_runtime_data(self, data: dict):
-        self.runtime_data = str(data)
+        self.runtime_data = encode_state(data)
         # nie wywołujemy self.save() tutaj
 
+    def get_state(self):
+        """
+        Zwraca (levels_data, runtime_data) w formacie słowników używanym przez run_grid_bot.
+        Dla botów z use_level_table stan poziomów czytamy jednym zapytaniem z BnbLevelState,
+        a z levels_data bierzemy tylko statyczną konfigurację (ceny lvX, sell_levels).
+        """
+        levels_data = self.get_levels_data()
+        if not self.use_level_table:
+            return levels_data, self.get_runtime_data()
+
+        rows = {s.level: s for s in self.level_states.all()}
+        self._level_state_rows = rows
+
+        levels_data["caps"] = {lv_name: str(s.cap) for lv_name, s in rows.items()}
+        runtime_data = {"flags": {}, "buy_price": {}, "buy_volume": {}, "cycles": {}}
+        for lv_name, s in rows.items():
+            runtime_data["flags"][f"{lv_name}_bought"] = s.bought
+            runtime_data["flags"][f"{lv_name}_sold"] = False
+            runtime_data["flags"][f"{lv_name}_in_progress"] = s.in_progress
+            runtime_data["buy_price"][lv_name] = str(s.buy_price)
+            runtime_data["buy_volume"][lv_name] = str(s.buy_volume)
+            runtime_data["cycles"][lv_name] = s.cycle
+        return levels_data, runtime_data
+
+    def save_state(self, levels_data: dict, runtime_data: dict, levels=None, buffer=None):
+        """
+        Odwrotność get_state(). Bez tabeli ustawia levels_data/runtime_data (NIE wywołuje self.save()).
+        Z tabelą aktualizuje tylko wiersze poziomów z `levels` (update_fields) - od razu,
+        albo przez `buffer` (WriteBuffer), który zapisze je razem z transakcjami ticka.
+        """
+        if not self.use_level_table:
+            self.save_levels_data(levels_data)
+            self.save_runtime_data(runtime_data)
+            return
+
+        levels = list(levels or [])
+        rows = getattr(self, "_level_state_rows", None)
+        if rows is None:
+            rows = {s.level: s for s in self.level_states.filter(level__in=levels)}
+
+        for lv_name in levels:
+            state = rows.get(lv_name)
+            if state is None:
+                continue
+            state.cap = Decimal(str(levels_data["caps"].get(lv_name, state.cap)))
+            state.bought = runtime_data["flags"].get(f"{lv_name}_bought", False)
+            state.in_progress = runtime_data["flags"].get(f"{lv_name}_in_progress", False)
+            state.buy_price = Decimal(str(runtime_data["buy_price"].get(lv_name, "0")))
+            state.buy_volume = Decimal(str(runtime_data["buy_volume"].get(lv_name, "0")))
+            state.cycle = int(runtime_data.get("cycles", {}).get(lv_name, state.cycle))
+            if buffer is not None:
+                buffer.add_level_state(state)
+            else:
+                state.save(update_fields=BnbLevelState.STATE_FIELDS)
+
+    def enable_level_table(self):
+        """
+        Przenosi stan poziomów z levels_data/runtime_data do tabeli BnbLevelState.
+        Nie wywołuje self.save() - wywołujący zapisuje flagę use_level_table.
+        """
+        levels_data = self.get_levels_data()
+        runtime_data = self.get_runtime_data()
+        flags = runtime_data.get("flags", {})
+
+        BnbLevelState.objects.filter(bot=self).delete()
+        BnbLevelState.objects.bulk_create([
+            BnbLevelState(
+                bot=self,
+                level=lv_name,
+                price=Decimal(str(levels_data[lv_name])),
+                cap=Decimal(str(levels_data.get("caps", {}).get(lv_name, 0))),
+                bought=flags.get(f"{lv_name}_bought", False),
+                in_progress=flags.get(f"{lv_name}_in_progress", False),
+                buy_price=Decimal(str(runtime_data.get("buy_price", {}).get(lv_name, 0))),
+                buy_volume=Decimal(str(runtime_data.get("buy_volume", {}).get(lv_name, 0))),
+                cycle=int(runtime_data.get("cycles", {}).get(lv_name, 0)),
+            )
+            for lv_name in levels_data if lv_name.startswith("lv")
+        ])
+        self.use_level_table = True
+        self._level_state_rows = None
+
     def set_binance_api_secret(self, plain_secret: str):
         self.binance_api_secret_enc = fernet.encrypt(plain_secret.encode("utf-8"))
 
@@ -82,6 +179,43 @@ class BnbBot(models.Model):
         return fernet.decrypt(self.binance_api_secret_enc).decode("utf-8")
 
 
+class BnbWorker(models.Model):
+    """
+    Proces worker-a grid botów w trybie shardingu (heartbeat co cykl).
+    """
+    worker_id = models.CharField(max_length=100, unique=True)
+    heartbeat_at = models.DateTimeField(db_index=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"BnbWorker({self.worker_id}, heartbeat={self.heartbeat_at})"
+
+
+class BnbLevelState(models.Model):
+    """
+    Stan pojedynczego poziomu bota (alternatywa dla całego bloba runtime_data).
+    Fill na jednym poziomie aktualizuje tylko jego wiersz.
+    """
+    STATE_FIELDS = ["cap", "bought", "in_progress", "buy_price", "buy_volume", "cycle", "updated_at"]
+
+    bot = models.ForeignKey(BnbBot, on_delete=models.CASCADE, related_name='level_states')
+    level = models.CharField(max_length=10)             # np. "lv1"
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    cap = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    bought = models.BooleanField(default=False)
+    in_progress = models.BooleanField(default=False)
+    buy_price = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    buy_volume = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    cycle = models.PositiveIntegerField(default=0)      # liczba zakończonych cykli KUPNO->SPRZEDAŻ
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('bot', 'level')
+
+    def __str__(self):
+        return f"BnbLevelState(bot_id={self.bot_id}, lv={self.level}, bought={self.bought})"
+
+
 class BnbTrade(models.Model):
     """
     Transakcje zawarte przez BnbBot (kupno/sprzedaż).
@@ -99,6 +233,106 @@ class BnbTrade(models.Model):
     sell_type = models.CharField(max_length=10, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Statystyki poziomów: filter(bot, side, status).values('level').annotate(...)
+            models.Index(fields=['bot', 'side', 'status', 'level']),
+            # Zyski według okresu (get_bot_profits) i ostatnie transakcje bota: filter(bot, created_at zakres)
+            models.Index(fields=['bot', 'created_at']),
+        ]
+
     def __str__(self):
         return f"BnbTrade(bot_id={self.bot_id}, lv={self.level}, side={self.side}, status={self.status})"
 
+
+def encode_level_stats(level_stats: dict) -> str:
+    """
+    {poziom: (liczba TP, zysk)} -> JSON pola BnbBotStats.level_stats (także dla modeli historycznych w migracji).
+    """
+    return json.dumps({lv_name: {"tp": tp, "profit": str(profit)} for lv_name, (tp, profit) in level_stats.items()})
+
+
+class BnbBotStats(models.Model):
+    """
+    Podsumowanie transakcji bota: zysk, liczba TP i liczniki poziomów.
+    Aktualizowane przez stats.apply_trades w transakcji zapisu ticka (WriteBuffer.flush),
+    więc odczyt zysku nie przegląda BnbTrade. Istniejącą historię uzupełnia migracja 0022_backfill_bot_stats,
+    odbudowa po ręcznych poprawkach: manage.py bnb_rebuild_stats.
+    """
+    bot = models.OneToOneField(BnbBot, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_profit = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    tp_count = models.PositiveIntegerField(default=0)     # wypełnione SPRZEDAŻE
+    trade_count = models.PositiveIntegerField(default=0)  # wszystkie transakcje (KUPNO i SPRZEDAŻ)
+    # {"lv1": {"tp": 3, "profit": "1.5"}} - TP i zysk wypełnionych SPRZEDAŻY poziomu
+    level_stats = models.TextField(default="{}")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_level_stats(self) -> dict:
+        """
+        {poziom: (liczba TP, zysk jako Decimal)}
+        """
+        return {lv_name: (int(data["tp"]), Decimal(data["profit"]))
+                for lv_name, data in json.loads(self.level_stats or "{}").items()}
+
+    def set_level_stats(self, level_stats: dict):
+        self.level_stats = encode_level_stats(level_stats)
+
+    def __str__(self):
+        return f"BnbBotStats(bot_id={self.bot_id}, profit={self.total_profit}, tp={self.tp_count})"
+
+
+class BnbBotDailyProfit(models.Model):
+    """
+    Dzienny kubełek zysku bota (data UTC transakcji) - część rollupu BnbBotStats.
+    """
+    bot = models.ForeignKey(BnbBot, on_delete=models.CASCADE, related_name='daily_profits')
+    date = models.DateField()
+    profit = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    tp_count = models.PositiveIntegerField(default=0)
+    trade_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('bot', 'date')
+
+    def __str__(self):
+        return f"BnbBotDailyProfit(bot_id={self.bot_id}, date={self.date}, profit={self.profit})"
+
+
+
+class BnbJournalEvent(models.Model):
+    """
+    Dziennik zleceń bota (tylko dopisywany). INTENT zapisujemy przed wysłaniem zlecenia na giełdę,
+    a ACK, FILL i COMMIT w tej samej transakcji co transakcja BnbTrade i stan poziomu.
+    INTENT bez COMMIT/FAILED oznacza zlecenie, którego wynik trzeba sprawdzić na giełdzie.
+    """
+    INTENT = "INTENT"
+    ACK = "ACK"
+    FILL = "FILL"
+    COMMIT = "COMMIT"
+    FAILED = "FAILED"
+    EVENT_CHOICES = (
+        (INTENT, 'Intent'),
+        (ACK, 'Ack'),
+        (FILL, 'Fill'),
+        (COMMIT, 'Commit'),
+        (FAILED, 'Failed'),
+    )
+
+    bot = models.ForeignKey(BnbBot, on_delete=models.CASCADE, related_name='journal')
+    level = models.CharField(max_length=10)
+    side = models.CharField(max_length=4)
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    client_order_id = models.CharField(max_length=36)   # newClientOrderId (Binance: maks. 36 znaków)
+    binance_order_id = models.CharField(max_length=50, blank=True, null=True)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8, null=True)
+    price = models.DecimalField(max_digits=20, decimal_places=8, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bot', 'client_order_id']),
+            models.Index(fields=['bot', 'event']),
+        ]
+
+    def __str__(self):
+        return f"BnbJournalEvent(bot_id={self.bot_id}, lv={self.level}, {self.event} {self.client_order_id})"
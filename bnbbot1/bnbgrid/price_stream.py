@@ -0,0 +1,193 @@
+# bnbgrid/price_stream.py
+
+import asyncio
+import json
+import threading
+import time
+from decimal import Decimal
+
+import websockets
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"  # combined stream Binance
+STREAM_CHANNEL = "miniTicker"  # miniTicker ("c" = ostatnia cena) lub bookTicker (średnia bid/ask)
+RECONNECT_MIN_DELAY = 1   # sekundy
+RECONNECT_MAX_DELAY = 60  # sekundy
+
+
+class PriceStream:
+    """
+    Strumień cen z Binance przez jedno długo żyjące połączenie WebSocket.
+
+    Działa w osobnym wątku z własną pętlą asyncio i trzyma w pamięci tabelę
+    ostatnich cen {symbol: (cena, czas)}. Worker wywołuje set_symbols() z listą
+    symboli botów RUNNING - strumień sam dosubskrybowuje/odsubskrybowuje kanały,
+    a po zerwaniu połączenia łączy się ponownie i subskrybuje wszystko od nowa.
+    """
+
+    def __init__(self, url: str = STREAM_URL, channel: str = STREAM_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.connected = False
+
+        self._lock = threading.Lock()
+        self._symbols = set()      # symbole, które chcemy śledzić
+        self._subscribed = set()   # strumienie zasubskrybowane na bieżącym połączeniu
+        self._prices = {}          # {symbol: (Decimal, time.monotonic())}
+        self._request_id = 0
+
+        self._loop = None
+        self._wake = None
+        self._stopped = False
+        self._thread = None
+
+    # -------------------------------------------------------
+    # API wywoływane z wątku worker-a
+    # -------------------------------------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._thread_main, daemon=True)
+        self._thread.start()
+        print(f"[price_stream] Strumień cen wystartował ({self.url}).")
+
+    def stop(self):
+        self._stopped = True
+        self._notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def set_symbols(self, symbols):
+        """
+        Ustawia zbiór śledzonych symboli. Zmiany są wysyłane do giełdy asynchronicznie.
+        """
+        symbols = {s.upper() for s in symbols}
+        with self._lock:
+            if symbols == self._symbols:
+                return
+            self._symbols = symbols
+            for symbol in list(self._prices):
+                if symbol not in symbols:
+                    del self._prices[symbol]
+        self._notify()
+
+    def get_price(self, symbol: str, max_age: float = None):
+        """
+        Zwraca ostatnią cenę symbolu albo None, gdy jej nie ma lub jest starsza niż max_age sekund.
+        """
+        with self._lock:
+            entry = self._prices.get(symbol.upper())
+        if entry is None:
+            return None
+        price, received_at = entry
+        if max_age is not None and time.monotonic() - received_at > max_age:
+            return None
+        return price
+
+    def get_prices(self, symbols, max_age: float = None) -> dict:
+        prices = {}
+        for symbol in symbols:
+            price = self.get_price(symbol, max_age)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    # -------------------------------------------------------
+    # Wnętrze - pętla asyncio
+    # -------------------------------------------------------
+    def _notify(self):
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _thread_main(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        delay = RECONNECT_MIN_DELAY
+
+        while not self._stopped:
+            # Bez botów nie trzymamy otwartego połączenia
+            self._wake.clear()
+            if not self._wanted_streams():
+                await self._wake.wait()
+                continue
+
+            try:
+                async with websockets.connect(self.url, ping_interval=20) as ws:
+                    self.connected = True
+                    delay = RECONNECT_MIN_DELAY
+                    self._subscribed = set()
+                    await self._sync_subscriptions(ws)
+                    await self._consume(ws)
+            except Exception as e:
+                print(f"[price_stream] Połączenie przerwane: {e}")
+            finally:
+                self.connected = False
+                self._subscribed = set()
+
+            if self._stopped:
+                break
+            # Ponowne połączenie z rosnącym odstępem
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _consume(self, ws):
+        reader = asyncio.ensure_future(self._read(ws))
+        try:
+            while not self._stopped:
+                waker = asyncio.ensure_future(self._wake.wait())
+                done, _ = await asyncio.wait({reader, waker}, return_when=asyncio.FIRST_COMPLETED)
+                if reader in done:
+                    waker.cancel()
+                    reader.result()  # propaguje wyjątek zamkniętego połączenia
+                    return
+                self._wake.clear()
+                if not self._wanted_streams():
+                    return  # brak botów - zamykamy połączenie
+                await self._sync_subscriptions(ws)
+        finally:
+            reader.cancel()
+
+    async def _read(self, ws):
+        async for message in ws:
+            self._handle_message(message)
+
+    def _wanted_streams(self) -> set:
+        with self._lock:
+            return {f"{s.lower()}@{self.channel}" for s in self._symbols}
+
+    async def _sync_subscriptions(self, ws):
+        wanted = self._wanted_streams()
+        to_remove = sorted(self._subscribed - wanted)
+        to_add = sorted(wanted - self._subscribed)
+
+        if to_remove:
+            await ws.send(self._request("UNSUBSCRIBE", to_remove))
+        if to_add:
+            await ws.send(self._request("SUBSCRIBE", to_add))
+        self._subscribed = wanted
+
+    def _request(self, method: str, params: list) -> str:
+        self._request_id += 1
+        return json.dumps({"method": method, "params": params, "id": self._request_id})
+
+    def _handle_message(self, message):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        # Combined stream opakowuje dane w {"stream": ..., "data": ...}
+        data = payload.get("data", payload) if isinstance(payload, dict) else None
+        if not isinstance(data, dict) or "s" not in data:
+            return  # np. odpowiedź na SUBSCRIBE {"result": null, "id": 1}
+
+        if "c" in data:
+            price = Decimal(data["c"])
+        elif "b" in data and "a" in data:
+            price = (Decimal(data["b"]) + Decimal(data["a"])) / 2
+        else:
+            return
+
+        symbol = data["s"].upper()
+        with self._lock:
+            if symbol in self._symbols:
+                self._prices[symbol] = (price, time.monotonic())
@@ -0,0 +1,63 @@
+# bnbgrid/reconcile.py
+
+import time
+
+from binance.exceptions import BinanceAPIException
+
+from .journal import ORDER_NOT_FOUND_CODES
+
+ALL_ORDERS_LIMIT = 1000                # maks. zleceń w jednej odpowiedzi GET /api/v3/allOrders
+ALL_ORDERS_WINDOW = 24 * 60 * 60 * 1000  # maks. zakres startTime-endTime (ms) dla allOrders
+SWEEP_MARGIN = 60 * 1000               # zapas (ms) na różnicę zegarów przy startTime
+
+
+class OrderSweep:
+    """
+    Statusy zleceń jednego konta i symbolu pobrane jednym zapytaniem allOrders, po newClientOrderId.
+
+    complete == True znaczy, że odpowiedź obejmuje wszystkie zlecenia od początku okna -
+    identyfikatora, którego w niej nie ma, nie ma też na giełdzie. W przeciwnym razie
+    (błąd zapytania, obcięta odpowiedź) pytamy o brakujące zlecenie pojedynczo.
+    """
+
+    def __init__(self, symbol: str, orders: list = (), complete: bool = False):
+        self.symbol = symbol
+        self.complete = complete
+        self.orders = {}
+        for order in sorted(orders, key=lambda o: o.get("orderId", 0)):
+            self.orders[order.get("clientOrderId")] = order  # przy powtórzonym id wygrywa najnowsze
+
+    def lookup(self, client, client_order_id: str):
+        """
+        Zlecenie o danym newClientOrderId albo None, gdy nie dotarło na giełdę.
+        Błędy inne niż "nie ma takiego zlecenia" przepuszcza (BinanceAPIException).
+        """
+        if client_order_id in self.orders:
+            return self.orders[client_order_id]
+        if self.complete:
+            return None
+        try:
+            return client.get_order(symbol=self.symbol, origClientOrderId=client_order_id)
+        except BinanceAPIException as e:
+            if e.code in ORDER_NOT_FOUND_CODES:
+                return None
+            raise
+
+
+def sweep_orders(client, symbol: str, intents: list) -> OrderSweep:
+    """
+    Jedno zapytanie allOrders na symbol, obejmujące wszystkie INTENT-y (od najstarszego).
+    """
+    if not intents:
+        return OrderSweep(symbol, complete=True)
+
+    since = int(min(i.created_at for i in intents).timestamp() * 1000) - SWEEP_MARGIN
+    params = {"symbol": symbol, "limit": ALL_ORDERS_LIMIT}
+    if time.time() * 1000 - since < ALL_ORDERS_WINDOW:
+        params["startTime"] = since
+    try:
+        orders = client.get_all_orders(**params)
+    except BinanceAPIException as e:
+        print(f"[reconcile] {symbol}: nie udało się pobrać zleceń ({e}), sprawdzam pojedynczo.")
+        return OrderSweep(symbol)
+    return OrderSweep(symbol, orders, complete=len(orders) < ALL_ORDERS_LIMIT)
@@ -0,0 +1,154 @@
+# bnbgrid/scheduler.py
+
+import heapq
+import math
+
+MIN_INTERVAL = 0.5    # s - bot tuż przy progu (nadpisywane przez BNB_CADENCE_MIN_INTERVAL)
+MAX_INTERVAL = 300    # s - bot daleko od progów (nadpisywane przez BNB_CADENCE_MAX_INTERVAL)
+DEFAULT_VOLATILITY = 0.0002  # odchylenie log-zwrotu na sqrt(s) (~6% dziennie), zanim zbierzemy własne ceny
+MIN_VOLATILITY = 0.00001     # dolna granica - płaski rynek nie może wydłużyć interwału do nieskończoności
+VOLATILITY_HALFLIFE = 300    # s - po tylu sekundach stara próbka waży połowę
+MIN_SAMPLE_SPACING = 0.2     # s - ceny bliżej siebie nie są osobnymi próbkami zmienności
+SAFETY_FACTOR = 0.25         # ułamek oczekiwanego czasu dojścia ceny do progu
+
+
+def band_distance(price, lo, hi) -> float:
+    """
+    Względna odległość ceny od najbliższego progu pasma (lo, hi); 0, gdy cena jest już poza pasmem.
+    """
+    price = float(price)
+    if price <= 0:
+        return 0.0
+    distance = math.inf
+    if lo is not None:
+        distance = min(distance, (price - float(lo)) / price)
+    if hi is not None:
+        distance = min(distance, (float(hi) - price) / price)
+    return max(distance, 0.0)
+
+
+def outside_band(price, lo, hi) -> bool:
+    return (lo is not None and price < lo) or (hi is not None and price >= hi)
+
+
+class CadenceScheduler:
+    """
+    Harmonogram sprawdzania botów: kolejka priorytetowa (heapq) czasów następnego sprawdzenia
+    zamiast stałego CHECK_INTERVAL dla wszystkich.
+
+    Po ticku bot dostaje pasmo cen (lo, hi), w którym nic się nie wydarzy (bnb_manager.get_trigger_band),
+    a interwał wynika z odległości ceny od brzegu pasma i zmienności symbolu: przy błądzeniu losowym
+    cena pokonuje względną odległość d średnio w (d / sigma)^2 sekund. Bot przy progu jest sprawdzany
+    co MIN_INTERVAL, bezczynny - co MAX_INTERVAL. Cena spoza pasma (np. ze strumienia) wywołuje bota od razu.
+    Używany tylko z wątku worker-a.
+    """
+
+    def __init__(self, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+                 default_volatility: float = DEFAULT_VOLATILITY):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_volatility = default_volatility
+        self._heap = []         # [(due_at, bot_id)] - wpisy nieaktualne pomijamy przy zdejmowaniu
+        self._entries = {}      # {bot_id: (due_at, lo, hi)}
+        self._volatility = {}   # {symbol: (wariancja na sekundę albo None, ostatnia cena, czas)}
+
+    # -------------------------------------------------------
+    # Zmienność
+    # -------------------------------------------------------
+    def observe_price(self, symbol: str, price, now: float):
+        """
+        Próbka ceny symbolu - średnia wykładnicza kwadratu log-zwrotu na sekundę (próbki w dowolnych odstępach).
+        """
+        price = float(price)
+        if price <= 0:
+            return
+        state = self._volatility.get(symbol)
+        if state is None:
+            self._volatility[symbol] = (None, price, now)
+            return
+        variance, last_price, last_time = state
+        dt = now - last_time
+        if dt < MIN_SAMPLE_SPACING:
+            return
+        sample = math.log(price / last_price) ** 2 / dt
+        weight = 1 - 0.5 ** (dt / VOLATILITY_HALFLIFE)
+        variance = sample if variance is None else variance + weight * (sample - variance)
+        self._volatility[symbol] = (variance, price, now)
+
+    def volatility(self, symbol: str) -> float:
+        state = self._volatility.get(symbol)
+        if state is None or state[0] is None:
+            return self.default_volatility
+        return max(math.sqrt(state[0]), MIN_VOLATILITY)
+
+    def interval(self, distance: float, volatility: float) -> float:
+        if distance <= 0:
+            return self.min_interval
+        seconds = SAFETY_FACTOR * (distance / volatility) ** 2
+        return min(self.max_interval, max(self.min_interval, seconds))
+
+    # -------------------------------------------------------
+    # Kolejka
+    # -------------------------------------------------------
+    def schedule(self, bot_id: int, symbol: str, price, band, now: float) -> float:
+        """
+        Planuje następne sprawdzenie bota. band: (lo, hi, urgent) albo None (pasmo nieznane);
+        urgent (np. zlecenie do ponowienia) albo brak pasma -> MIN_INTERVAL.
+        """
+        lo = hi = None
+        if band is None or price is None:
+            delay = self.min_interval
+        else:
+            lo, hi, urgent = band
+            distance = 0.0 if urgent else band_distance(price, lo, hi)
+            delay = self.interval(distance, self.volatility(symbol))
+        due_at = now + delay
+        self._entries[bot_id] = (due_at, lo, hi)
+        heapq.heappush(self._heap, (due_at, bot_id))
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._compact()
+        return due_at
+
+    def pop_due(self, now: float) -> set:
+        """
+        Zdejmuje z kolejki boty, których czas sprawdzenia minął.
+        """
+        due = set()
+        while self._heap and self._heap[0][0] <= now:
+            due_at, bot_id = heapq.heappop(self._heap)
+            entry = self._entries.get(bot_id)
+            if entry is not None and entry[0] == due_at:
+                del self._entries[bot_id]
+                due.add(bot_id)
+        return due
+
+    def is_due(self, bot_id: int, price=None) -> bool:
+        """
+        Bot bez zaplanowanego sprawdzenia (nowy albo zdjęty przez pop_due) albo z ceną poza pasmem.
+        """
+        entry = self._entries.get(bot_id)
+        if entry is None:
+            return True
+        _, lo, hi = entry
+        return price is not None and outside_band(price, lo, hi)
+
+    def next_due(self):
+        while self._heap:
+            due_at, bot_id = self._heap[0]
+            entry = self._entries.get(bot_id)
+            if entry is not None and entry[0] == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    def retain(self, bot_ids):
+        """
+        Zapomina boty spoza bot_ids (zatrzymane, zakończone, przejęte przez inny worker).
+        """
+        bot_ids = set(bot_ids)
+        for bot_id in [bot_id for bot_id in self._entries if bot_id not in bot_ids]:
+            del self._entries[bot_id]
+
+    def _compact(self):
+        self._heap = [(entry[0], bot_id) for bot_id, entry in self._entries.items()]
+        heapq.heapify(self._heap)
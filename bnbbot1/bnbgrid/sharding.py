@@ -0,0 +1,115 @@
+# bnbgrid/sharding.py
+
+import math
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Now
+
+from .models import BnbBot, BnbWorker
+
+WORKER_TTL = 30  # sekundy bez heartbeat-u, po których worker uznawany jest za martwy
+
+
+class LeaseLost(Exception):
+    """
+    Bot przestał należeć do tego workera (przejęty, oddany albo heartbeat wygasł) - zleceń nie składamy.
+    """
+
+
+def lease_cutoff(ttl: int):
+    """
+    Granica ważności heartbeat-u liczona zegarem bazy (Now()), nie zegarem hosta - przesunięty zegar
+    jednego workera nie wydłuża ani nie skraca dzierżawy.
+    """
+    return Now() - timedelta(seconds=ttl)
+
+
+def hold_lease(bot: BnbBot, worker_id: str, ttl: int = None) -> bool:
+    """
+    Sprawdza dzierżawę bota tuż przed złożeniem zleceń - warunkowym UPDATE na (worker_id, lease_epoch)
+    i świeżym heartbeat-cie workera. Wywoływane w transakcji zapisu INTENT-ów: UPDATE blokuje wiersz bota
+    do commitu, więc przejęcie przez inny worker nie wejdzie między sprawdzenie a zapis dziennika
+    (a zlecenie z zapisanym INTENT-em nowy właściciel wyjaśni przez recover_orders).
+    """
+    ttl = ttl if ttl is not None else getattr(settings, "BNB_WORKER_TTL", WORKER_TTL)
+    alive = BnbWorker.objects.filter(worker_id=OuterRef("worker_id"), heartbeat_at__gte=lease_cutoff(ttl))
+    return BnbBot.objects.filter(
+        Exists(alive), id=bot.id, status="RUNNING", worker_id=worker_id, lease_epoch=bot.lease_epoch,
+    ).update(worker_id=worker_id) == 1
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ShardCoordinator:
+    """
+    Podział botów RUNNING między wiele procesów worker-a.
+
+    Każdy worker ma wiersz BnbWorker z heartbeat-em, a bot należy do workera wskazanego
+    w BnbBot.worker_id. Worker przejmuje boty bez właściciela lub należące do martwych
+    workerów warunkowym UPDATE (wygrywa tylko jeden), a gdy ma więcej niż swoją część
+    (ceil(boty / żywe workery)) - oddaje nadmiar. Dzięki temu bot nigdy nie jest
+    prowadzony przez dwa workery naraz, a po śmierci workera jego boty przejmują inni.
+
+    Każda zmiana właściciela podbija BnbBot.lease_epoch, a ważność heartbeat-u liczymy zegarem bazy.
+    Przed wysłaniem zleceń tick sprawdza dzierżawę jeszcze raz (hold_lease) - worker, który się zawiesił
+    dłużej niż TTL, nie złoży zleceń za bota prowadzonego już przez innego.
+    """
+
+    def __init__(self, worker_id: str = None, ttl: int = WORKER_TTL):
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+
+    def heartbeat(self):
+        updated = BnbWorker.objects.filter(worker_id=self.worker_id).update(heartbeat_at=Now())
+        if not updated:
+            BnbWorker.objects.create(worker_id=self.worker_id, heartbeat_at=Now())
+            print(f"[shard] Worker {self.worker_id} dołączył.")
+        # Sprzątamy martwe workery - ich boty staną się wolne
+        BnbWorker.objects.filter(heartbeat_at__lt=lease_cutoff(self.ttl)).delete()
+
+    def rebalance(self, busy=()) -> set:
+        """
+        Odnawia heartbeat, oddaje nadmiar i przejmuje wolne boty.
+        `busy` - boty, których obsługa jeszcze trwa (nie oddajemy ich w tym cyklu).
+        Zwraca zbiór id botów należących do tego workera.
+        """
+        self.heartbeat()
+        live_workers = list(BnbWorker.objects.values_list("worker_id", flat=True))
+        running = BnbBot.objects.filter(status="RUNNING")
+
+        # Zatrzymane/zakończone boty nie muszą mieć właściciela
+        BnbBot.objects.filter(worker_id=self.worker_id).exclude(status="RUNNING").update(
+            worker_id=None, lease_epoch=F("lease_epoch") + 1)
+
+        owned = list(running.filter(worker_id=self.worker_id).order_by("id").values_list("id", flat=True))
+        target = math.ceil(running.count() / max(len(live_workers), 1))
+
+        if len(owned) > target:
+            excess = [bot_id for bot_id in owned[target:] if bot_id not in busy]
+            if excess:
+                BnbBot.objects.filter(worker_id=self.worker_id, id__in=excess).update(
+                    worker_id=None, lease_epoch=F("lease_epoch") + 1)
+                print(f"[shard] Worker {self.worker_id} oddaje boty {excess}.")
+        elif len(owned) < target:
+            free = Q(worker_id__isnull=True) | ~Q(worker_id__in=live_workers)
+            candidates = list(running.filter(free).order_by("id").values_list("id", flat=True)[:target - len(owned)])
+            if candidates:
+                # Warunek "wolny" jest sprawdzany ponownie w UPDATE - przy wyścigu wygrywa jeden worker
+                running.filter(free, id__in=candidates).update(worker_id=self.worker_id,
+                                                               lease_epoch=F("lease_epoch") + 1)
+
+        return set(running.filter(worker_id=self.worker_id).values_list("id", flat=True))
+
+    def release_all(self):
+        """
+        Oddaje wszystkie boty i wyrejestrowuje workera (przy zamykaniu procesu).
+        """
+        BnbBot.objects.filter(worker_id=self.worker_id).update(worker_id=None, lease_epoch=F("lease_epoch") + 1)
+        BnbWorker.objects.filter(worker_id=self.worker_id).delete()
+        print(f"[shard] Worker {self.worker_id} zakończył pracę i oddał boty.")
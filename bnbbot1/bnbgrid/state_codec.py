@@ -0,0 +1,72 @@
+# bnbgrid/state_codec.py
+
+import ast
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+# Wersje formatu pól levels_data / runtime_data:
+#   0 - stary format: str(dict) (repr Pythona), dawniej czytany przez eval()
+#   1 - kompaktowy JSON w kopercie {"v": 1, "d": {...}}, Decimal zapisany jako string
+LEGACY_VERSION = 0
+JSON_VERSION = 1
+CURRENT_VERSION = JSON_VERSION
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Nie można zserializować {type(value).__name__}")
+
+
+class _LegacyDecimalToStr(ast.NodeTransformer):
+    """
+    Zamienia wywołania Decimal('1.23') w starym formacie na zwykły string '1.23',
+    żeby całość dała się odczytać bezpiecznym ast.literal_eval zamiast eval().
+    """
+
+    def visit_Call(self, node):
+        if (isinstance(node.func, ast.Name) and node.func.id == "Decimal" and len(node.args) == 1
+                and not node.keywords and isinstance(node.args[0], ast.Constant)):
+            return ast.copy_location(ast.Constant(str(node.args[0].value)), node)
+        return node
+
+
+def _decode_legacy(text: str) -> dict:
+    try:
+        return ast.literal_eval(text)
+    except ValueError:
+        tree = _LegacyDecimalToStr().visit(ast.parse(text, mode="eval"))
+        return ast.literal_eval(tree)
+
+
+def write_version() -> int:
+    """
+    Wersja używana przy zapisie. Podczas rolling upgrade można ustawić
+    BNB_STATE_WRITE_VERSION = 0, żeby stare instancje (eval) dalej czytały nowe zapisy.
+    """
+    return getattr(settings, "BNB_STATE_WRITE_VERSION", CURRENT_VERSION)
+
+
+def encode_state(data: dict, version: int = None) -> str:
+    if version is None:
+        version = write_version()
+    if version == LEGACY_VERSION:
+        return str(data)
+    return json.dumps({"v": JSON_VERSION, "d": data}, separators=(",", ":"), default=_json_default)
+
+
+def decode_state(text: str) -> dict:
+    """
+    Odczytuje levels_data/runtime_data w dowolnej wersji formatu (bez eval()).
+    """
+    if not text:
+        return {}
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return _decode_legacy(text)
+    if isinstance(payload, dict) and payload.get("v") == JSON_VERSION and "d" in payload:
+        return payload["d"]
+    return payload
@@ -0,0 +1,121 @@
+# bnbgrid/stats.py
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BnbBotDailyProfit, BnbBotStats, BnbTrade, encode_level_stats
+
+ZERO = Decimal("0")
+REBUILD_CHUNK_SIZE = 2000
+
+
+def trade_day(trade: BnbTrade):
+    """
+    Kubełek dzienny transakcji - data UTC created_at (jak w get_bot_profits).
+    """
+    return (trade.created_at or timezone.now()).date()
+
+
+def is_take_profit(trade: BnbTrade) -> bool:
+    return trade.side == "SELL" and trade.status == "FILLED"
+
+
+def _add_trade(stats: BnbBotStats, levels: dict, bucket: BnbBotDailyProfit, trade: BnbTrade):
+    profit = trade.profit or ZERO
+    stats.total_profit += profit
+    stats.trade_count += 1
+    bucket.profit += profit
+    bucket.trade_count += 1
+    if is_take_profit(trade):
+        stats.tp_count += 1
+        bucket.tp_count += 1
+        tp, lv_profit = levels.get(trade.level, (0, ZERO))
+        levels[trade.level] = (tp + 1, lv_profit + profit)
+
+
+def apply_trades(trades):
+    """
+    Dolicza zapisane transakcje do BnbBotStats i kubełków BnbBotDailyProfit.
+    Wywoływane przez WriteBuffer.flush w jego transakcji, więc rollup nigdy nie rozjeżdża się z BnbTrade.
+    Stała liczba zapytań niezależnie od liczby botów w cyklu; wiersze BnbBotStats są blokowane
+    (select_for_update), żeby nie nadpisać równoległej odbudowy (rebuild_bot_stats) ani zapisu
+    innego workera - blokada wiersza bota chroni też jego kubełki dzienne.
+    """
+    if not trades:
+        return
+    bot_ids = {trade.bot_id for trade in trades}
+    now = timezone.now()
+
+    stats = _lock_stats(bot_ids)
+
+    days = {(trade.bot_id, trade_day(trade)) for trade in trades}
+    buckets = {(row.bot_id, row.date): row for row in BnbBotDailyProfit.objects.filter(
+        bot_id__in=bot_ids, date__in={day for _, day in days})}
+    new_buckets = days - buckets.keys()
+    for bot_id, day in new_buckets:
+        buckets[(bot_id, day)] = BnbBotDailyProfit(bot_id=bot_id, date=day, profit=ZERO)
+
+    levels = {bot_id: row.get_level_stats() for bot_id, row in stats.items()}
+    for trade in trades:
+        _add_trade(stats[trade.bot_id], levels[trade.bot_id], buckets[(trade.bot_id, trade_day(trade))], trade)
+
+    for bot_id, row in stats.items():
+        row.set_level_stats(levels[bot_id])
+        row.updated_at = now  # bulk_update nie ustawia auto_now
+
+    BnbBotStats.objects.bulk_update(stats.values(), ["total_profit", "tp_count", "trade_count", "level_stats",
+                                                     "updated_at"])
+    _save_rows(BnbBotDailyProfit, buckets, new_buckets, ["profit", "tp_count", "trade_count"])
+
+
+def _lock_stats(bot_ids: set) -> dict:
+    """
+    Blokuje (select_for_update) wiersze BnbBotStats botów, tworząc brakujące.
+    select_for_update nie blokuje wierszy, których nie ma - dwa równoległe pierwsze zapisy bota
+    wstawiałyby ten sam wiersz (IntegrityError), więc brakujące tworzymy z ignore_conflicts i dopiero blokujemy.
+    """
+    stats = {row.bot_id: row for row in BnbBotStats.objects.select_for_update().filter(bot_id__in=bot_ids)}
+    missing = bot_ids - stats.keys()
+    if missing:
+        BnbBotStats.objects.bulk_create([BnbBotStats(bot_id=bot_id) for bot_id in missing], ignore_conflicts=True)
+        stats.update({row.bot_id: row for row in BnbBotStats.objects.select_for_update().filter(bot_id__in=missing)})
+    return stats
+
+
+def _save_rows(model, rows: dict, new_keys: set, fields: list):
+    created = [row for key, row in rows.items() if key in new_keys]
+    updated = [row for key, row in rows.items() if key not in new_keys]
+    if created:
+        model.objects.bulk_create(created)
+    if updated:
+        model.objects.bulk_update(updated, fields)
+
+
+def rebuild_bot_stats(bot_id: int, models: tuple = None) -> BnbBotStats:
+    """
+    Przelicza rollup bota od zera z całej historii BnbTrade (strumieniowo, bez ładowania wszystkich transakcji).
+    Zablokowany wiersz BnbBotStats wstrzymuje zapis ticka tego bota do końca odbudowy.
+    models: (BnbBotStats, BnbBotDailyProfit, BnbTrade) - w migracji modele historyczne z apps.get_model.
+    """
+    stats_model, daily_model, trade_model = models or (BnbBotStats, BnbBotDailyProfit, BnbTrade)
+    with transaction.atomic():
+        stats, _ = stats_model.objects.select_for_update().get_or_create(bot_id=bot_id)
+        stats.total_profit, stats.tp_count, stats.trade_count = ZERO, 0, 0
+        levels, buckets = {}, {}
+
+        trades = (trade_model.objects.filter(bot_id=bot_id)
+                  .only("bot_id", "level", "side", "status", "profit", "created_at").order_by("id"))
+        for trade in trades.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            day = trade_day(trade)
+            bucket = buckets.get(day)
+            if bucket is None:
+                bucket = buckets[day] = daily_model(bot_id=bot_id, date=day, profit=ZERO)
+            _add_trade(stats, levels, bucket, trade)
+
+        stats.level_stats = encode_level_stats(levels)
+        stats.save()
+        daily_model.objects.filter(bot_id=bot_id).delete()
+        daily_model.objects.bulk_create(buckets.values())
+    return stats
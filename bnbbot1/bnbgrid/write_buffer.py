@@ -0,0 +1,144 @@
+# bnbgrid/write_buffer.py
+
+import threading
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BnbBot, BnbJournalEvent, BnbLevelState, BnbTrade
+from .stats import apply_trades
+
+BOT_STATE_FIELDS = ["levels_data", "runtime_data", "status", "updated_at"]
+
+
+class WriteBuffer:
+    """
+    Bufor zapisów jednego ticka bota: transakcje (BnbTrade), zdarzenia dziennika (BnbJournalEvent),
+    boty i wiersze BnbLevelState.
+
+    flush() zapisuje wszystko w jednej transakcji DB: najpierw transakcje (z binance_order_id),
+    ich rollup (BnbBotStats) i dziennik, potem stan poziomów - flagi nigdy nie są zresetowane
+    bez zapisanego zlecenia.
+    Callbacki z after_flush() wykonują się dopiero po udanym commicie.
+    """
+
+    def __init__(self):
+        self.trades = []
+        self.events = []
+        self.bots = {}          # {bot_id: (bot, fields)}
+        self.level_states = {}  # {pk: BnbLevelState}
+        self.callbacks = []
+
+    def __bool__(self):
+        return bool(self.trades or self.events or self.bots or self.level_states or self.callbacks)
+
+    def add_trade(self, trade: BnbTrade):
+        self.trades.append(trade)
+
+    def add_event(self, event: BnbJournalEvent):
+        self.events.append(event)
+
+    def add_bot(self, bot: BnbBot, fields=None):
+        bot.updated_at = timezone.now()  # bulk_update nie ustawia auto_now
+        self.bots[bot.id] = (bot, tuple(fields or BOT_STATE_FIELDS))
+
+    def add_level_state(self, state: BnbLevelState):
+        state.updated_at = timezone.now()
+        self.level_states[state.pk] = state
+
+    def after_flush(self, callback):
+        self.callbacks.append(callback)
+
+    def extend(self, other: "WriteBuffer"):
+        self.trades.extend(other.trades)
+        self.events.extend(other.events)
+        self.bots.update(other.bots)
+        self.level_states.update(other.level_states)
+        self.callbacks.extend(other.callbacks)
+
+    def flush(self):
+        if not self:
+            return
+        trades, events, bots, states, callbacks = self.trades, self.events, self.bots, self.level_states, self.callbacks
+        self.trades, self.events, self.bots, self.level_states, self.callbacks = [], [], {}, {}, []
+
+        try:
+            with transaction.atomic():
+                if trades:
+                    BnbTrade.objects.bulk_create(trades)
+                    apply_trades(trades)
+                if events:
+                    BnbJournalEvent.objects.bulk_create(events)
+                by_fields = {}
+                for bot, fields in bots.values():
+                    by_fields.setdefault(fields, []).append(bot)
+                for fields, group in by_fields.items():
+                    BnbBot.objects.bulk_update(group, list(fields))
+                if states:
+                    BnbLevelState.objects.bulk_update(list(states.values()), BnbLevelState.STATE_FIELDS)
+        except Exception:
+            # Nic nie zostało zapisane - przywracamy bufor, żeby można było ponowić
+            self.trades, self.events, self.bots, self.level_states, self.callbacks = trades, events, bots, states, callbacks
+            raise
+
+        for callback in callbacks:
+            callback()
+
+
+class CycleWriteBuffer:
+    """
+    Zbiera bufory botów obsłużonych w jednym cyklu worker-a i zapisuje je jedną transakcją.
+    Po flush() bufor jest zamknięty - zadania spóźnione (po deadline) zapisują się same.
+    Timery ticków (metrics.TickTimer) dostają czas zapisu jako etap db_write i są kończone po flush().
+    """
+
+    def __init__(self):
+        self._buffers = []
+        self._timers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def add(self, buffer: WriteBuffer, timer=None) -> bool:
+        with self._lock:
+            if self._closed:
+                return False
+            self._buffers.append(buffer)
+            if timer is not None:
+                self._timers.append(timer)
+            return True
+
+    def flush(self):
+        with self._lock:
+            self._closed = True
+            buffers, self._buffers = self._buffers, []
+            timers, self._timers = self._timers, []
+        if not buffers:
+            return
+
+        started = time.perf_counter()
+        try:
+            self._flush(buffers)
+        finally:
+            elapsed = time.perf_counter() - started
+            for timer in timers:
+                timer.add("db_write", elapsed)
+                timer.finish()
+
+    def _flush(self, buffers):
+        combined = WriteBuffer()
+        for buffer in buffers:
+            combined.extend(buffer)
+        try:
+            combined.flush()
+            return
+        except Exception as e:
+            print(f"[write_buffer] Zapis zbiorczy cyklu nieudany ({e}), zapisuję boty osobno.")
+
+        # Transakcja zbiorcza została wycofana w całości - próbujemy każdego bota osobno,
+        # żeby błąd jednego nie zgubił zleceń pozostałych
+        for buffer in buffers:
+            try:
+                buffer.flush()
+            except Exception as e:
+                print(f"[write_buffer] Zapis nieudany: {e}")
@@ -1,9 +1,35 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Komendy manage.py, w których proces obsługuje boty w tle; pozostałe (bnb_backtest, bnb_sweep, bnb_klines,
+# migrate, test...) nie mogą startować drugiego worker-a handlującego tymi samymi botami RUNNING.
+# run_bnb_worker startuje worker sam.
+WORKER_COMMANDS = ("runserver",)
+MANAGEMENT_SCRIPTS = ("manage.py", "django-admin", "django-admin.py")
+
+
+def should_autostart(argv=None) -> bool:
+    """
+    Czy w tym procesie uruchomić worker w tle: tak w serwerze aplikacji (gunicorn, daphne) i w runserver,
+    nie w pozostałych komendach manage.py.
+    """
+    from django.conf import settings
+    # Przy osobnych procesach worker-a (manage.py run_bnb_worker) można wyłączyć wątek w procesie web
+    if not getattr(settings, "BNB_WORKER_AUTOSTART", True):
+        return False
+    argv = sys.argv if argv is None else argv
+    script = argv[0] if argv else ""
+    if os.path.basename(script) in MANAGEMENT_SCRIPTS or script.endswith(os.path.join("django", "__main__.py")):
+        return len(argv) > 1 and argv[1] in WORKER_COMMANDS
+    return True
+
+
 class BnbgridConfig(AppConfig):
     name = 'bnbgrid'
 
     def ready(self):
-        from .bnb_logic import start_bnb_worker
-        start_bnb_worker()
-
+        if should_autostart():
+            from .bnb_logic import start_bnb_worker
+            start_bnb_worker()
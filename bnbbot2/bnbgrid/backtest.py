@@ -0,0 +1,187 @@
+# bnbgrid/backtest.py
+
+import numpy as np
+
+from .bnb_manager import FEE_RATE
+from .grid_levels import GridLevels
+
+CLOSE_ALL_RATIO = 1.1  # run_grid_bot zamyka wszystko, gdy cena > 110% lv1
+
+# Kolumny (indeksy) w plikach CSV z Binance (data.binance.vision)
+KLINE_COLUMNS = {"open_time": 0, "open": 1, "high": 2, "low": 3, "close": 4}
+TRADE_PRICE_COLUMN = 1
+TRADE_TIME_COLUMNS = {"trades": 4, "aggtrades": 5}
+
+
+class BacktestResult:
+    """
+    Wynik symulacji: lista transakcji i podsumowanie (P&L, kapitał w użyciu, obsunięcie).
+    """
+
+    def __init__(self, trades, open_positions, realized_profit, unrealized_profit,
+                 max_capital_in_use, max_drawdown, finished_at=None):
+        self.trades = trades                    # [{"tick", "level", "side", "price", "quantity", "open_price", "profit"}]
+        self.open_positions = open_positions    # {lv_name: (buy_price, quantity)} - niezamknięte na końcu danych
+        self.realized_profit = realized_profit
+        self.unrealized_profit = unrealized_profit
+        self.max_capital_in_use = max_capital_in_use
+        self.max_drawdown = max_drawdown
+        self.finished_at = finished_at          # tick zamknięcia wszystkiego (cena > 110% lv1) albo None
+
+    @property
+    def buy_count(self) -> int:
+        return sum(1 for t in self.trades if t["side"] == "BUY")
+
+    @property
+    def sell_count(self) -> int:
+        return sum(1 for t in self.trades if t["side"] == "SELL")
+
+    def summary(self) -> dict:
+        return {
+            "buys": self.buy_count,
+            "sells": self.sell_count,
+            "realized_profit": self.realized_profit,
+            "unrealized_profit": self.unrealized_profit,
+            "max_capital_in_use": self.max_capital_in_use,
+            "max_drawdown": self.max_drawdown,
+            "open_positions": len(self.open_positions),
+            "finished_at": self.finished_at,
+        }
+
+
+def run_backtest(levels_data: dict, prices) -> BacktestResult:
+    """
+    Odtwarza serię cen przez reguły run_grid_bot na symulowanej giełdzie (wypełnienie po cenie ticka):
+      - KUPNO poziomu, gdy cena < cena poziomu i poziom nie jest kupiony (za caps poziomu),
+      - SPRZEDAŻ, gdy poziom kupiony w poprzednim ticku lub wcześniej i cena >= cena z sell_levels,
+        zysk jak calculate_profit (prowizja FEE_RATE od zysku); caps poziomu się nie zmienia,
+      - ZAMKNIĘCIE wszystkiego i koniec, gdy cena > 110% lv1.
+
+    Poziomy są od siebie niezależne (każdy to własny automat kup/sprzedaj), więc zamiast pętli
+    po świecach szukamy kolejnych zdarzeń poziomu w tablicach indeksów (flatnonzero + searchsorted).
+    Koszt to O(liczba świec * poziomy) w NumPy plus O(liczba transakcji) w Pythonie.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    grid = GridLevels(levels_data)
+    if "lv1" not in grid.level_names or len(prices) == 0:
+        return BacktestResult([], {}, 0.0, 0.0, 0.0, 0.0)
+
+    fee = float(FEE_RATE)
+    finish_ticks = np.flatnonzero(prices > float(grid.prices["lv1"]) * CLOSE_ALL_RATIO)
+    end = int(finish_ticks[0]) if len(finish_ticks) else len(prices)
+    active = prices[:end]
+
+    trades = []
+    open_positions = {}
+    for lv_name in grid.level_names:
+        cap = float(levels_data["caps"].get(lv_name, 0))
+        if cap <= 0:
+            continue
+        buy_ticks = np.flatnonzero(active < float(grid.prices[lv_name]))
+        target = grid.sell_targets.get(lv_name)
+        sell_ticks = np.flatnonzero(active >= float(target)) if target is not None else buy_ticks[:0]
+
+        tick = 0
+        while True:
+            i = np.searchsorted(buy_ticks, tick)
+            if i == len(buy_ticks):
+                break
+            buy_tick = int(buy_ticks[i])
+            buy_price = float(active[buy_tick])
+            quantity = cap / buy_price
+            trades.append({"tick": buy_tick, "level": lv_name, "side": "BUY", "price": buy_price,
+                           "quantity": quantity, "open_price": buy_price, "profit": None})
+
+            # W ticku kupna poziom nie jest jeszcze sprzedawany (flaga bought sprzed ticka)
+            j = np.searchsorted(sell_ticks, buy_tick + 1)
+            if j == len(sell_ticks):
+                open_positions[lv_name] = (buy_price, quantity)
+                break
+            sell_tick = int(sell_ticks[j])
+            sell_price = float(active[sell_tick])
+            profit = (sell_price - buy_price) * quantity * (1 - fee)
+            trades.append({"tick": sell_tick, "level": lv_name, "side": "SELL", "price": sell_price,
+                           "quantity": quantity, "open_price": buy_price, "profit": profit})
+            tick = sell_tick + 1
+
+    finished_at = None
+    if end < len(prices):
+        finished_at = end
+        close_price = float(prices[end])
+        for lv_name, (buy_price, quantity) in open_positions.items():
+            trades.append({"tick": end, "level": lv_name, "side": "SELL", "price": close_price,
+                           "quantity": quantity, "open_price": buy_price,
+                           "profit": (close_price - buy_price) * quantity * (1 - fee)})
+        open_positions = {}
+
+    # Kolejność jak w run_grid_bot: tick po ticku, w ticku poziomy lv1, lv2, ...
+    trades.sort(key=lambda t: (t["tick"], grid.level_index[t["level"]]))
+
+    last = end if finished_at is not None else len(prices) - 1
+    curve_prices = prices[:last + 1]
+    max_capital, max_drawdown, unrealized = _equity_stats(trades, curve_prices, last + 1)
+    realized = sum(t["profit"] for t in trades if t["profit"] is not None)
+    return BacktestResult(trades, open_positions, realized, unrealized, max_capital, max_drawdown, finished_at)
+
+
+def _equity_stats(trades, prices, length):
+    """
+    Kapitał w pozycjach i krzywa wartości (zrealizowany zysk + wycena otwartych pozycji) dla każdego ticka.
+    """
+    qty, cost, realized = np.zeros(length), np.zeros(length), np.zeros(length)
+    if trades:
+        ticks = np.array([t["tick"] for t in trades])
+        sign = np.array([1.0 if t["side"] == "BUY" else -1.0 for t in trades])
+        quantity = np.array([t["quantity"] for t in trades])
+        open_cost = np.array([t["open_price"] * t["quantity"] for t in trades])
+        profit = np.array([t["profit"] or 0.0 for t in trades])
+        np.add.at(qty, ticks, sign * quantity)
+        np.add.at(cost, ticks, sign * open_cost)
+        np.add.at(realized, ticks, profit)
+
+    qty, cost, realized = np.cumsum(qty), np.cumsum(cost), np.cumsum(realized)
+    equity = realized + qty * prices - cost
+    drawdown = np.maximum.accumulate(equity) - equity
+    unrealized = float(qty[-1] * prices[-1] - cost[-1])
+    return float(cost.max(initial=0.0)), float(drawdown.max(initial=0.0)), unrealized
+
+
+def candle_path(times, o, h, l, c, path_mode: str = "close"):
+    """
+    Ceny ze świec: "close" - jedna cena na świecę, "ohlc" - cztery ceny na świecę w kolejności
+    open, low, high, close (świeca wzrostowa) lub open, high, low, close (spadkowa).
+    """
+    if path_mode == "close":
+        return times, c
+    rising = c >= o
+    steps = np.column_stack([o, np.where(rising, l, h), np.where(rising, h, l), c])
+    return np.repeat(times, 4), steps.ravel()
+
+
+def load_store_series(store, symbol: str, interval: str, start_ms: int = None, end_ms: int = None,
+                      path_mode: str = "close"):
+    """
+    Ceny z lokalnego magazynu świec (bnbgrid.kline_store). Dla "close" zwracane są widoki memmap.
+    """
+    klines = store.read(symbol, interval, start_ms, end_ms)
+    return candle_path(klines.open_time, klines.open, klines.high, klines.low, klines.close, path_mode)
+
+
+def load_price_series(path: str, kind: str = "klines", path_mode: str = "close"):
+    """
+    Wczytuje ceny z pliku CSV Binance. Zwraca (czasy ms, ceny) jako tablice NumPy.
+
+    kind: "klines" (świece), "trades" lub "aggtrades" (pojedyncze transakcje).
+    path_mode dla świec jak w candle_path().
+    """
+    with open(path) as f:
+        first = f.readline().split(",")[0].strip()
+    skiprows = 0 if first.replace(".", "", 1).isdigit() else 1  # opcjonalny nagłówek
+
+    if kind == "klines":
+        data = np.loadtxt(path, delimiter=",", skiprows=skiprows, usecols=list(KLINE_COLUMNS.values()), ndmin=2)
+        return candle_path(data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3], data[:, 4], path_mode)
+
+    data = np.loadtxt(path, delimiter=",", skiprows=skiprows, ndmin=2,
+                      usecols=[TRADE_PRICE_COLUMN, TRADE_TIME_COLUMNS[kind]])
+    return data[:, 1].astype(np.int64), np.ascontiguousarray(data[:, 0])
@@ -1,65 +1,350 @@
 # bnbgrid/bnb_logic.py
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import Decimal
 from django.db import close_old_connections
 from django.utils import timezone
 from django.conf import settings
 
 from .models import BnbBot
-from .bnb_manager import get_binance_client, fetch_symbol_price, run_grid_bot
+from .bnb_manager import (get_binance_client, fetch_symbol_prices, get_trigger_band, needs_recovery, plan_recovery,
+                          request_limit_sync, run_grid_bot)
+from .journal import parse_client_order_id
+from .sharding import LeaseLost
+from .metrics import TickTimer
+from .write_buffer import CycleWriteBuffer, WriteBuffer
 
 CHECK_INTERVAL = 5  # co ile sekund worker sprawdza boty?
+STREAM_CHECK_INTERVAL = 1  # co ile sekund, gdy ceny przychodzą ze strumienia WebSocket
+STREAM_MAX_PRICE_AGE = 30  # starsze ceny ze strumienia uznajemy za nieaktualne (fallback na REST)
 
+WORKER_CONCURRENCY = 4  # ile botów obsługujemy równolegle (nadpisywane przez BNB_WORKER_CONCURRENCY)
+BOT_DEADLINE = 20       # ile sekund cykl czeka na boty (nadpisywane przez BNB_BOT_DEADLINE)
 
-def worker_loop():
+price_stream = None  # PriceStream uruchamiany w start_bnb_worker (jeśli włączony)
+scheduler = None     # CadenceScheduler (BNB_ADAPTIVE_CADENCE); bez niego każdy bot jest sprawdzany co cykl
+user_streams = {}    # {binance_api_key: UserDataStream} dla botów w trybie LIMIT
+shard = None         # ShardCoordinator w trybie shardingu (BNB_WORKER_SHARDING)
+
+_worker_thread = None
+
+_executor = None        # pula wątków obsługujących boty
+_busy_bots = set()      # boty, których obsługa jeszcze trwa (lub czeka w kolejce puli)
+_busy_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, "BNB_WORKER_CONCURRENCY", WORKER_CONCURRENCY)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bnb-bot")
+    return _executor
+
+
+def acquire_bot(bot_id: int) -> bool:
     """
-    Główna pętla worker-a.
+    Blokada per bot: zwraca False, jeśli bot jest jeszcze obsługiwany (np. z poprzedniego cyklu).
     """
-    while True:
-        # Zamykanie połączeń DB przed/po pętli (zapobiega "MySQL has gone away" itp.)
+    with _busy_lock:
+        if bot_id in _busy_bots:
+            return False
+        _busy_bots.add(bot_id)
+        return True
+
+
+def release_bot(bot_id: int):
+    with _busy_lock:
+        _busy_bots.discard(bot_id)
+
+
+def fetch_price_snapshot(bots) -> dict:
+    """
+    Etap snapshotu cen: każdy symbol pobieramy raz na tick (jedno zapytanie zbiorcze),
+    niezależnie od tego, ile botów go używa.
+    """
+    if not bots:
+        return {}
+    try:
+        # Ticker jest publiczny, więc wystarczy klient dowolnego bota
+        client = get_binance_client(bots[0])
+        return fetch_symbol_prices(client, {bot.symbol for bot in bots})
+    except Exception as e:
+        print(f"[worker] Błąd przy pobieraniu snapshotu cen: {e}")
+        return {}
+
+
+def update_user_streams(limit_bots) -> dict:
+    """
+    Strumienie danych użytkownika - jeden na klucz API botów w trybie LIMIT.
+    Zwraca zebrane wypełnienia {bot_id: [executionReport, ...]}. Po (ponownym) połączeniu
+    strumienia boty konta są synchronizowane z giełdą (wypełnienia z przerwy mogły przepaść).
+    Gdy strumienie są wyłączone (BNB_USER_STREAM_ENABLED), boty LIMIT synchronizujemy co cykl.
+    """
+    if not getattr(settings, "BNB_USER_STREAM_ENABLED", True):
+        for bot in limit_bots:
+            request_limit_sync(bot.id)
+        return {}
+
+    from .user_stream import UserDataStream, USER_STREAM_URL
+    accounts = {}
+    for bot in limit_bots:
+        accounts.setdefault(bot.binance_api_key, []).append(bot)
+
+    for api_key in list(user_streams):
+        if api_key not in accounts:
+            user_streams.pop(api_key).stop()
+
+    fills = {}
+    for api_key, bots in accounts.items():
+        stream = user_streams.get(api_key)
+        if stream is None:
+            url = getattr(settings, "BNB_USER_STREAM_URL", USER_STREAM_URL)
+            stream = user_streams[api_key] = UserDataStream(get_binance_client(bots[0]), url)
+            stream.start()
+        if stream.take_reconnected() or not stream.connected:
+            for bot in bots:
+                request_limit_sync(bot.id)
+        for event in stream.drain():
+            parsed = parse_client_order_id(event.get("c"))
+            if parsed is not None:
+                fills.setdefault(parsed[0], []).append(event)
+    return fills
+
+
+def limit_bot_due(bot: BnbBot, current_price: Decimal, fills: dict) -> bool:
+    """
+    Bot LIMIT wymaga obsługi tylko przy wypełnieniu, synchronizacji albo warunku zamknięcia (cena > 110% lv1).
+    """
+    if bot.id in fills or needs_recovery(bot):
+        return True
+    lv1_price = Decimal(str(bot.get_levels_data().get("lv1", "0")))
+    return current_price > lv1_price * Decimal("1.1")
+
+
+def select_due_bots(running_bots, prices: dict, fills: dict) -> list:
+    """
+    Boty do sprawdzenia w tym cyklu: z minionym czasem w harmonogramie, z ceną (ze strumienia)
+    poza pasmem bez akcji, z wypełnieniami albo zleceniami do wyjaśnienia. Bez harmonogramu - wszystkie.
+    """
+    if scheduler is None:
+        return running_bots
+    scheduler.retain(bot.id for bot in running_bots)
+    scheduler.pop_due(time.monotonic())
+    return [bot for bot in running_bots
+            if bot.id in fills or needs_recovery(bot) or scheduler.is_due(bot.id, prices.get(bot.symbol))]
+
+
+def run_worker_cycle():
+    """
+    Jeden przebieg worker-a po botach w statusie RUNNING (z harmonogramem - po tych, na które przyszła kolej).
+    """
+    # 1) Pobierz boty w statusie RUNNING (w trybie shardingu - tylko te należące do tego workera)
+    running_bots = BnbBot.objects.filter(status="RUNNING")
+    if shard is not None:
+        with _busy_lock:
+            busy = set(_busy_bots)
+        running_bots = running_bots.filter(id__in=shard.rebalance(busy))
+    running_bots = list(running_bots)
+
+    # Boty w trybie LIMIT: wypełnienia ze strumieni użytkownika zamiast sprawdzania ceny co tick
+    fills = {}
+    try:
+        fills = update_user_streams([bot for bot in running_bots if bot.order_mode == BnbBot.LIMIT_MODE])
+    except Exception as e:
+        print(f"[worker] Błąd strumieni użytkownika: {e}")
+
+    # Czas ticka liczymy od pobrania cen - tick-to-order obejmuje snapshot, kolejkę puli i zapis
+    tick_started = time.perf_counter()
+
+    # 2) Ceny: najpierw ze strumienia WebSocket (wszystkie symbole - nie kosztują wagi API),
+    #    brakujące/nieaktualne - snapshotem REST, ale tylko dla botów, na które przyszła kolej
+    prices = {}
+    if price_stream is not None:
+        symbols = {bot.symbol for bot in running_bots}
+        price_stream.set_symbols(symbols)
+        prices = price_stream.get_prices(symbols, max_age=STREAM_MAX_PRICE_AGE)
+
+    due_bots = select_due_bots(running_bots, prices, fills)
+    missing = [bot for bot in due_bots if bot.symbol not in prices]
+    if missing:
+        prices.update(fetch_price_snapshot(missing))
+    price_fetch = time.perf_counter() - tick_started
+    if scheduler is not None:
+        now = time.monotonic()
+        for symbol, price in prices.items():
+            scheduler.observe_price(symbol, price, now)
+
+    ready = []
+    for bot in due_bots:
+        if bot.order_mode == BnbBot.LIMIT_MODE and bot.symbol in prices \
+                and not limit_bot_due(bot, prices[bot.symbol], fills):
+            continue
+        if bot.symbol not in prices:
+            print(f"[worker] Bot {bot.id}: brak ceny {bot.symbol} w snapshocie, pomijam w tym cyklu.")
+        elif not acquire_bot(bot.id):
+            print(f"[worker] Bot {bot.id}: poprzednia obsługa jeszcze trwa, pomijam w tym cyklu.")
+        else:
+            ready.append(bot)
+            continue
+        if bot.id in fills:
+            request_limit_sync(bot.id)  # wypełnienia z kolejki przepadają - odczytamy je z giełdy
+
+    # 3) Niewyjaśnione zlecenia (po restarcie lub timeoucie): jedno zapytanie o zlecenia na symbol
+    recovery = {}
+    try:
+        recovery = plan_recovery([bot for bot in ready if needs_recovery(bot)])
+    except Exception as e:
+        print(f"[worker] Błąd przy sprawdzaniu zleceń z dziennika: {e}")
+
+    # 4) Każdy bot w osobnym zadaniu puli - wolny bot/giełda nie opóźnia pozostałych
+    executor = get_executor()
+    cycle_buffer = CycleWriteBuffer()
+    futures = {}
+    for bot in ready:
+        timer = TickTimer(bot.id, bot.symbol, started=tick_started)
+        timer.add("price_fetch", price_fetch)
+        try:
+            future = executor.submit(process_bot, bot, prices[bot.symbol], cycle_buffer, recovery.get(bot.id),
+                                     fills.get(bot.id, ()), timer)
+            futures[future] = bot.id
+        except Exception as e:
+            release_bot(bot.id)
+            print(f"[worker] Nie udało się zlecić obsługi bota {bot.id}: {e}")
+
+    # 5) Czekamy najwyżej BOT_DEADLINE - zawieszony bot nie blokuje cyklu
+    #    (jego zadanie kończy się w tle, a blokada per bot nie pozwala uruchomić go drugi raz)
+    late = set()
+    if futures:
+        deadline = getattr(settings, "BNB_BOT_DEADLINE", BOT_DEADLINE)
+        _, not_done = wait(futures, timeout=deadline)
+        for future in not_done:
+            late.add(futures[future])
+            print(f"[worker] Bot {futures[future]}: przekroczony deadline {deadline}s, cykl idzie dalej.")
+
+    # 6) Zapis wszystkich botów z cyklu w jednej transakcji (bulk_create/bulk_update)
+    cycle_buffer.flush()
+
+    # 7) Następne sprawdzenie botów z tego cyklu - z pasma cen zapisanego przez ich tick
+    #    (bot bez ceny lub jeszcze obsługiwany wraca po MIN_INTERVAL)
+    if scheduler is not None:
+        now = time.monotonic()
+        for bot in due_bots:
+            band = None if bot.id in late else get_trigger_band(bot.id)
+            scheduler.schedule(bot.id, bot.symbol, prices.get(bot.symbol), band, now)
+
+
+def process_bot(bot: BnbBot, current_price: Decimal, cycle_buffer: CycleWriteBuffer = None, recovery: tuple = None,
+                fills=(), timer: TickTimer = None):
+    """
+    Obsługa jednego bota w wątku z puli. Zapisy trafiają do bufora cyklu; jeśli cykl
+    już się zapisał (bot przekroczył deadline), bot zapisuje swój bufor sam.
+    Etapy ticka (bnb_manager: span) mierzone są do `timer`, kończonego po zapisie.
+    """
+    close_old_connections()
+    worker_id = shard.worker_id if shard is not None else None
+    buffer = WriteBuffer()
+    if timer is None:
+        timer = TickTimer(bot.id, bot.symbol)
+    try:
+        # Pobierz lv1 z levels_data
+        levels_data = bot.get_levels_data()
+        lv1_price = Decimal(str(levels_data.get("lv1", "0")))  # domyślnie 0, jeśli brak
+
+        with timer.activate():
+            # Zmieniono logikę: zamiast kończyć gdy cena > lv1, kończymy dopiero gdy cena > lv1 * 1.1
+            # Dodatkowo, zamiast bezpośrednio zmieniać status, przekazujemy flagę do run_grid_bot
+            if current_price > lv1_price * Decimal("1.1"):
+                print(f"[worker] Bot {bot.id}: cena {current_price} przekroczyła 110% lv1={lv1_price}, zlecam zamknięcie pozycji i zakończenie.")
+                # Przekazujemy flagę close_and_finish=True aby najpierw zamknąć pozycje, potem zmienić status
+                run_grid_bot(bot.id, close_and_finish=True, current_price=current_price, worker_id=worker_id,
+                             buffer=buffer, recovery=recovery)
+            else:
+                # W innym wypadku odpalamy standardową logikę grid-bota
+                run_grid_bot(bot.id, current_price=current_price, worker_id=worker_id, buffer=buffer,
+                             recovery=recovery, fills=fills)
+
+    except LeaseLost as e:
+        # Bota prowadzi już inny worker - nie zapisujemy stanu z tego ticka, nowy właściciel
+        # wyjaśni zlecenia z dziennika (recover_orders)
+        print(f"[worker] {e}, pomijam zapis ticka.")
+        buffer = WriteBuffer()
+    except Exception as e:
+        # Obsługa wyjątków, żeby w razie błędu worker się nie zatrzymał
+        print(f"[worker] Błąd przy obsłudze bota {bot.id}: {e}")
+        if fills:
+            request_limit_sync(bot.id)  # wypełnienia odczytamy z giełdy przy następnym ticku
+    finally:
+        # Bufor zapisujemy także po błędzie - mogą w nim być już złożone zlecenia
+        try:
+            if cycle_buffer is None or not cycle_buffer.add(buffer, timer):
+                with timer.span("db_write"):
+                    buffer.flush()
+                timer.finish()
+        except Exception as e:
+            print(f"[worker] Błąd zapisu bota {bot.id}: {e}")
+        release_bot(bot.id)
         close_old_connections()
 
-        # 1) Pobierz boty w statusie RUNNING
-        running_bots = BnbBot.objects.filter(status="RUNNING")
 
-        for bot in running_bots:
-            try:
-                # 2) Pobierz lv1 z levels_data
-                levels_data = bot.get_levels_data()
-                lv1_price = Decimal(str(levels_data.get("lv1", "0")))  # domyślnie 0, jeśli brak
+def next_cycle_delay() -> float:
+    """
+    Czas do następnego przebiegu: ustalony interwał (krótszy, gdy ceny mamy ze strumienia),
+    a z harmonogramem - do najbliższego zaplanowanego sprawdzenia, jeśli wypada wcześniej.
+    """
+    if price_stream is not None and price_stream.connected:
+        interval = STREAM_CHECK_INTERVAL
+    else:
+        interval = CHECK_INTERVAL
+    next_due = scheduler.next_due() if scheduler is not None else None
+    if next_due is None:
+        return interval
+    return min(interval, max(next_due - time.monotonic(), scheduler.min_interval))
 
-                # 3) Pobierz aktualną cenę z Binance
-                client = get_binance_client(bot)
-                current_price = fetch_symbol_price(client, bot.symbol)
 
-                # 4) Zmieniono logikę: zamiast kończyć gdy cena > lv1, kończymy dopiero gdy cena > lv1 * 1.1
-                # Dodatkowo, zamiast bezpośrednio zmieniać status, przekazujemy flagę do run_grid_bot
-                if current_price > lv1_price * Decimal("1.1"):
-                    print(f"[worker] Bot {bot.id}: cena {current_price} przekroczyła 110% lv1={lv1_price}, zlecam zamknięcie pozycji i zakończenie.")
-                    # Przekazujemy flagę close_and_finish=True aby najpierw zamknąć pozycje, potem zmienić status
-                    run_grid_bot(bot.id, close_and_finish=True)
-                else:
-                    # W innym wypadku odpalamy standardową logikę grid-bota
-                    run_grid_bot(bot.id)
+def worker_loop():
+    """
+    Główna pętla worker-a.
+    """
+    while True:
+        # Zamykanie połączeń DB przed/po pętli (zapobiega "MySQL has gone away" itp.)
+        close_old_connections()
 
-            except Exception as e:
-                # Obsługa wyjątków, żeby w razie błędu worker się nie zatrzymał
-                print(f"[worker] Błąd przy obsłudze bota {bot.id}: {e}")
+        try:
+            run_worker_cycle()
+        except Exception as e:
+            # Błąd cyklu (np. baza niedostępna) nie może zabić wątku worker-a - próbujemy w następnym cyklu
+            print(f"[worker] Błąd cyklu: {e}")
+            close_old_connections()
 
-        # Odczekaj ustalony czas
-        time.sleep(CHECK_INTERVAL)
+        time.sleep(next_cycle_delay())
 
 
 def start_bnb_worker():
     """
-    Uruchamia wątek worker-a w tle.
+    Uruchamia wątek worker-a w tle (oraz strumień cen, jeśli włączony w ustawieniach).
+    Wywołanie ponowne w tym samym procesie zwraca już działający wątek.
     """
-    t = threading.Thread(target=worker_loop, daemon=True)
-    t.start()
-    print("[start_bnb_worker] Worker wystartował w tle.")
-
+    global price_stream, scheduler, shard, _worker_thread
+    if _worker_thread is not None:
+        return _worker_thread
 
+    if getattr(settings, "BNB_WORKER_SHARDING", False):
+        from .sharding import ShardCoordinator, WORKER_TTL
+        shard = ShardCoordinator(ttl=getattr(settings, "BNB_WORKER_TTL", WORKER_TTL))
+        print(f"[start_bnb_worker] Tryb shardingu, worker_id={shard.worker_id}.")
 
+    if getattr(settings, "BNB_PRICE_STREAM_ENABLED", False):
+        from .price_stream import PriceStream, STREAM_URL
+        price_stream = PriceStream(getattr(settings, "BNB_PRICE_STREAM_URL", STREAM_URL))
+        price_stream.start()
 
+    if getattr(settings, "BNB_ADAPTIVE_CADENCE", False):
+        from .scheduler import CadenceScheduler, MAX_INTERVAL, MIN_INTERVAL
+        scheduler = CadenceScheduler(getattr(settings, "BNB_CADENCE_MIN_INTERVAL", MIN_INTERVAL),
+                                     getattr(settings, "BNB_CADENCE_MAX_INTERVAL", MAX_INTERVAL))
 
+    _worker_thread = threading.Thread(target=worker_loop, daemon=True)
+    _worker_thread.start()
+    print("[start_bnb_worker] Worker wystartował w tle.")
+    return _worker_thread
@@ -1,25 +1,60 @@
 # bnbgrid/bnb_manager.py
 
-import time
 import math
+import json
 import decimal
 from decimal import Decimal, ROUND_DOWN
+from django.db import transaction
 from django.utils import timezone
 
 from .models import BnbBot, BnbTrade
+from .journal import (ORDER_NOT_FOUND_CODES, group_by_order, new_client_order_id, pending_intents,
+                      pending_intents_by_bot, record_failed, record_fill, record_intents)
+from .grid_levels import GridLevels
+from .metrics import forget_bot as forget_bot_metrics, span
+from .reconcile import sweep_orders
+from .sharding import LeaseLost, hold_lease
+from .user_stream import execution_report_order
+from .write_buffer import WriteBuffer
 from binance.client import Client  # jeśli używamy python-binance
 from binance.exceptions import BinanceAPIException
+from binance_common.client_pool import ClientPool
+from binance_common.exchange_info import get_symbol_filters
+from binance_common.rate_limit import PRIORITY_PRICE, RateLimitExceeded, rate_priority
 
 FEE_RATE = Decimal("0.0011")  # 0.11% = 0.0011 w zapisie dziesiętnym
 
+# Kroki używane, gdy filtrów symbolu nie da się pobrać (dawne stałe z place_market_order)
+FALLBACK_QUOTE_STEP = Decimal("0.01")
+FALLBACK_BASE_STEP = Decimal("0.1")
+
+REQUEST_TIMEOUT = 10  # timeout (s) zapytań HTTP do Binance - zawieszone zlecenie nie blokuje bota w nieskończoność
+
+# Klienci Binance współdzieleni między tickami i botami z tym samym kluczem API
+client_pool = ClientPool(requests_params={"timeout": REQUEST_TIMEOUT})
+
+COMPOUND_PROFIT = False  # zysk ze SPRZEDAŻY poziomu nie powiększa jego caps (tylko przy zamknięciu)
+
+# Statusy zlecenia, po których nic się już w nim nie zmieni
+FINAL_ORDER_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "EXPIRED_IN_MATCH", "REJECTED")
+
+# Stan worker-a w pamięci procesu: skompilowane poziomy, ostatnia cena i poziomy do ponowienia
+_grid_cache = {}       # {bot_id: (klucz, GridLevels)}
+_last_prices = {}      # {bot_id: Decimal} - cena z poprzedniego ticka
+_retry_levels = {}     # {bot_id: set(lv_name)} - poziomy, których zlecenie się nie powiodło
+_recovered_bots = set()  # boty, których dziennik zleceń sprawdzono w tym procesie
+_pending_bots = set()    # boty z INTENT, którego wynik nie jest jeszcze zapisany
+_limit_synced = set()    # boty LIMIT, których zlecenia na giełdzie zgadzają się ze stanem
+_trigger_bands = {}      # {bot_id: (lo, hi, urgent)} - pasmo cen bez akcji po ostatnim ticku (dla scheduler)
+
 
 def get_binance_client(bot: BnbBot) -> Client:
     """
-    Tworzy klienta Binance używając kluczy zapisanych w obiekcie bota.
+    Zwraca klienta Binance dla kluczy zapisanych w obiekcie bota (z puli - sekret jest
+    odszyfrowywany i klient budowany tylko przy pierwszym użyciu lub po zmianie klucza).
+    Klient jest współdzielony przez wątki workerów - patrz ClientPool.
     """
-    api_key = bot.binance_api_key or ""
-    api_secret = bot.get_binance_api_secret() or ""
-    return Client(api_key, api_secret)
+    return client_pool.get(bot.binance_api_key, bot.binance_api_secret_enc, bot.get_binance_api_secret)
 
 
 def fetch_symbol_price(client: Client, symbol: str) -> Decimal:
@@ -37,42 +72,562 @@ def fetch_symbol_price(client: Client, symbol: str) -> Decimal:
     #return 4.511
     #return 3.90
 
+def fetch_symbol_prices(client: Client, symbols) -> dict:
+    """
+    Pobiera aktualne ceny wielu symboli jednym zapytaniem (ticker/price z parametrem symbols).
+    Zwraca słownik {symbol: Decimal}. Waga zapytania nie zależy od liczby botów,
+    tylko od tego, że jest to jedno zapytanie zbiorcze.
 
-def place_market_order(client: Client, symbol: str, side: str, quantity: Decimal) -> dict:
+    Jeśli zapytanie zbiorcze się nie powiedzie (np. jeden z symboli jest niepoprawny),
+    pobieramy ceny pojedynczo i pomijamy symbole, dla których się nie udało.
+    Odświeżanie cen ma najniższy priorytet w governorze - przy wyczerpanym limicie jest pomijane.
     """
-    Składa zlecenie rynkowe (BUY lub SELL).
+    symbols = sorted(set(symbols))
+    if not symbols:
+        return {}
+
+    with rate_priority(PRIORITY_PRICE):
+        try:
+            tickers = client.get_symbol_ticker(symbols=json.dumps(symbols, separators=(",", ":")))
+            return {t["symbol"]: Decimal(t["price"]) for t in tickers}
+        except RateLimitExceeded as e:
+            print(f"[fetch_symbol_prices] {e}")
+            return {}
+        except BinanceAPIException as e:
+            print(f"[fetch_symbol_prices] Zbiorcze zapytanie nieudane ({e}), pobieram ceny pojedynczo.")
+
+        prices = {}
+        for symbol in symbols:
+            try:
+                prices[symbol] = fetch_symbol_price(client, symbol)
+            except BinanceAPIException as e:
+                print(f"[fetch_symbol_prices] Nie udało się pobrać ceny {symbol}: {e}")
+        return prices
+
+
+
+def prepare_market_order(client: Client, symbol: str, side: str, quantity: Decimal, price: Decimal = None) -> dict:
+    """
+    Parametry zlecenia rynkowego (BUY lub SELL) dla client.create_order albo {}, gdy zlecenia nie warto wysyłać.
     - BUY: 'quoteOrderQty' (podajemy kwotę w USDT, np. 100.00)
     - SELL: 'quantity' (podajemy liczbę w walucie bazowej, np. 0.0123 BTC)
     
-    Dla BUY obcinamy do 2 miejsc po przecinku,
-    dla SELL obcinamy do 1 miejsca po przecinku.
+    Ilości zaokrąglamy w dół według filtrów symbolu z cache exchangeInfo:
+    BUY do precyzji waluty kwotowanej, SELL do stepSize z LOT_SIZE.
+    Zlecenie poniżej minQty / MIN_NOTIONAL nie jest wysyłane (Binance by je odrzucił).
+    Gdy filtrów nie da się pobrać, używamy starych kroków: 0.01 dla BUY i 0.1 dla SELL.
     """
-    try:
-        if side.upper() == "BUY":
-            # Market BUY: obcinamy do 2 miejsc po przecinku
-            buy_qty = quantity.quantize(Decimal("0.01"), rounding=ROUND_DOWN)
-            order = client.create_order(
-                symbol=symbol,
-                side="BUY",
-                type="MARKET",
-                quoteOrderQty=str(buy_qty)  # ilość w walucie kwotowanej (np. USDT)
-            )
+    filters = get_symbol_filters(client, symbol)
+    if side.upper() == "BUY":
+        if filters:
+            buy_qty = filters.quantize_quote(quantity)
+            if buy_qty <= 0 or buy_qty < filters.min_notional:
+                print(f"[place_market_order] {symbol}: kwota {buy_qty} poniżej MIN_NOTIONAL {filters.min_notional}.")
+                return {}
         else:
-            # Market SELL: obcinamy wolumen do 1 miejsca po przecinku
-            sell_qty = quantity.quantize(Decimal("0.1"), rounding=ROUND_DOWN)
-            order = client.create_order(
-                symbol=symbol,
-                side="SELL",
-                type="MARKET",
-                quantity=str(sell_qty)  # ilość w walucie bazowej (np. BTC)
-            )
-        return order
-
+            buy_qty = quantity.quantize(FALLBACK_QUOTE_STEP, rounding=ROUND_DOWN)
+        # ilość w walucie kwotowanej (np. USDT)
+        return {"symbol": symbol, "side": "BUY", "type": "MARKET", "quoteOrderQty": str(buy_qty)}
+
+    if filters:
+        sell_qty = filters.quantize_quantity(quantity)
+        if not filters.is_tradable(sell_qty, price):
+            print(f"[place_market_order] {symbol}: ilość {sell_qty} poniżej LOT_SIZE/MIN_NOTIONAL.")
+            return {}
+    else:
+        sell_qty = quantity.quantize(FALLBACK_BASE_STEP, rounding=ROUND_DOWN)
+    # ilość w walucie bazowej (np. BTC)
+    return {"symbol": symbol, "side": "SELL", "type": "MARKET", "quantity": str(sell_qty)}
+
+
+def prepare_limit_order(client: Client, symbol: str, side: str, quantity: Decimal, price: Decimal) -> dict:
+    """
+    Parametry zlecenia LIMIT GTC (ilość w walucie bazowej) albo {}, gdy nie spełnia filtrów symbolu.
+    """
+    filters = get_symbol_filters(client, symbol)
+    if filters:
+        quantity = filters.quantize_quantity(quantity)
+        price = filters.quantize_price(price)
+        if not filters.is_tradable(quantity, price):
+            print(f"[place_limit_order] {symbol}: {side} {quantity} @ {price} poniżej LOT_SIZE/MIN_NOTIONAL.")
+            return {}
+    else:
+        quantity = quantity.quantize(FALLBACK_BASE_STEP, rounding=ROUND_DOWN)
+    return {"symbol": symbol, "side": side.upper(), "type": "LIMIT", "timeInForce": "GTC",
+            "quantity": str(quantity), "price": str(price)}
+
+
+def send_order(client: Client, params: dict, client_order_id: str = None) -> dict:
+    """
+    Wysyła przygotowane zlecenie. Zwraca odpowiedź Binance albo {} przy BinanceAPIException.
+    """
+    if client_order_id:
+        params = dict(params, newClientOrderId=client_order_id)
+    try:
+        return client.create_order(**params)
     except BinanceAPIException as e:
         print(f"[place_market_order] BinanceAPIException: {e}")
         return {}
 
 
+def place_market_order(client: Client, symbol: str, side: str, quantity: Decimal, price: Decimal = None,
+                       client_order_id: str = None) -> dict:
+    """
+    Składa zlecenie rynkowe (BUY lub SELL) - prepare_market_order + send_order.
+    """
+    params = prepare_market_order(client, symbol, side, quantity, price)
+    if not params:
+        return {}
+    return send_order(client, params, client_order_id)
+
+
+def order_fill(order_resp: dict):
+    """
+    (wykonana ilość, średnia cena) zlecenia - z listy fills (odpowiedź create_order)
+    albo z executedQty / cummulativeQuoteQty (odpowiedź get_order).
+    """
+    fills = order_resp.get("fills") or []
+    executed_qty = Decimal("0")
+    fill_cost = Decimal("0")
+    if fills:
+        for f in fills:
+            fill_price = Decimal(f["price"])
+            fill_qty = Decimal(f["qty"])
+            executed_qty += fill_qty
+            fill_cost += fill_price * fill_qty
+    else:
+        executed_qty = Decimal(order_resp.get("executedQty", "0"))
+        fill_cost = Decimal(order_resp.get("cummulativeQuoteQty", "0"))
+
+    average_price = fill_cost / executed_qty if executed_qty > 0 else Decimal("0")
+    return executed_qty, average_price
+
+
+def allocate_fill(order_resp: dict, volumes) -> dict:
+    """
+    Dzieli wypełnienie jednego zlecenia na poziomy proporcjonalnie do ich wolumenów [(lv_name, volume)].
+    Zwraca {lv_name: odpowiedź w formacie get_order} dla apply_sell / resolve_order; ostatni poziom
+    dostaje resztę, więc sumy ilości i kwot zgadzają się z całym zleceniem.
+    """
+    executed_qty, average_price = order_fill(order_resp)
+    total_cost = executed_qty * average_price
+    total_volume = sum(volume for _, volume in volumes)
+    step = Decimal("0.00000001")  # precyzja pól BnbTrade
+
+    parts = {}
+    remaining_qty, remaining_cost = executed_qty, total_cost
+    for i, (lv_name, volume) in enumerate(volumes):
+        if i == len(volumes) - 1:
+            qty, cost = remaining_qty, remaining_cost
+        else:
+            share = volume / total_volume if total_volume > 0 else Decimal("0")
+            qty = (executed_qty * share).quantize(step, rounding=ROUND_DOWN)
+            cost = qty * average_price
+        remaining_qty -= qty
+        remaining_cost -= cost
+        parts[lv_name] = {
+            "orderId": order_resp.get("orderId", ""),
+            "clientOrderId": order_resp.get("clientOrderId", ""),
+            "status": order_resp.get("status", "FILLED"),
+            "executedQty": str(qty),
+            "cummulativeQuoteQty": str(cost),
+        }
+    return parts
+
+
+def apply_buy(bot: BnbBot, runtime_data: dict, lv_name: str, order_resp: dict, buffer: WriteBuffer):
+    """
+    Wypełnione KUPNO poziomu: transakcja BUY i flaga bought z ceną/wolumenem zakupu.
+    """
+    executed_qty, average_price = order_fill(order_resp)
+
+    buffer.add_trade(BnbTrade(
+        bot=bot,
+        level=lv_name,
+        side="BUY",
+        quantity=executed_qty,
+        open_price=average_price,
+        close_price=None,
+        profit=None,
+        binance_order_id=order_resp.get("orderId", ""),
+        status="FILLED",
+        buy_type="MARKET"
+    ))
+
+    runtime_data["flags"][f"{lv_name}_in_progress"] = False
+    runtime_data["flags"][f"{lv_name}_bought"] = True
+    runtime_data["buy_price"][lv_name] = str(average_price)
+    runtime_data["buy_volume"][lv_name] = str(executed_qty)
+    return executed_qty, average_price
+
+
+def apply_sell(bot: BnbBot, levels_data: dict, runtime_data: dict, lv_name: str, order_resp: dict,
+               buffer: WriteBuffer, compound: bool = COMPOUND_PROFIT):
+    """
+    Wypełniona SPRZEDAŻ poziomu: transakcja SELL z zyskiem i reset flag poziomu.
+    compound: czy zysk powiększa kapitał (caps) poziomu.
+    """
+    buy_price_stored = Decimal(runtime_data["buy_price"].get(lv_name, "0"))
+    executed_qty, average_price = order_fill(order_resp)
+    profit = calculate_profit(buy_price_stored, average_price, executed_qty)
+
+    buffer.add_trade(BnbTrade(
+        bot=bot,
+        level=lv_name,
+        side="SELL",
+        quantity=executed_qty,
+        open_price=buy_price_stored,
+        close_price=average_price,
+        profit=profit,
+        binance_order_id=order_resp.get("orderId", ""),
+        status="FILLED",
+        sell_type="MARKET"
+    ))
+
+    if compound:
+        new_cap = Decimal(levels_data["caps"][lv_name]) + profit
+        levels_data["caps"][lv_name] = str(new_cap)
+
+    runtime_data["flags"][f"{lv_name}_in_progress"] = False
+    runtime_data["flags"][f"{lv_name}_bought"] = False
+    runtime_data["buy_price"][lv_name] = "0"
+    runtime_data["buy_volume"][lv_name] = "0"
+    # Cykl poziomu zakończony - następne zlecenia dostaną nowe newClientOrderId
+    cycles = runtime_data.setdefault("cycles", {})
+    cycles[lv_name] = int(cycles.get(lv_name, 0)) + 1
+    return executed_qty, average_price, profit
+
+
+def record_owned_intents(bot: BnbBot, intents: list):
+    """
+    Zapis INTENT-ów przed wysłaniem zleceń. W trybie shardingu (bot prowadzony przez worker - run_grid_bot
+    ustawia bot.lease_owner) w tej samej transakcji sprawdzamy dzierżawę bota; utracona -> LeaseLost.
+    """
+    owner = getattr(bot, "lease_owner", None)
+    if owner is None:
+        record_intents(bot, intents)
+        return
+    with transaction.atomic():
+        if not hold_lease(bot, owner):
+            raise LeaseLost(f"Bot {bot.id} nie należy już do workera {owner}")
+        record_intents(bot, intents)
+
+
+def execute_orders(bot: BnbBot, client: Client, orders: list, runtime_data: dict, current_price: Decimal,
+                   limit: bool = False) -> list:
+    """
+    Składa zlecenia ticka [(lv_name, side, quantity)] - rynkowe albo, gdy limit=True,
+    LIMIT [(lv_name, side, quantity, price)].
+    Najpierw jednym INSERT-em zapisuje INTENT-y (z newClientOrderId dla bieżącego cyklu poziomu)
+    w dzienniku, dopiero potem wysyła zlecenia - po awarii w trakcie wiadomo, o które zlecenia zapytać giełdę.
+    Zwraca [(lv_name, side, client_order_id, order_resp)]; order_resp == {} gdy się nie udało.
+    """
+    results = []
+    prepared = []
+    cycles = runtime_data.get("cycles", {})
+    for order in orders:
+        lv_name, side, quantity = order[:3]
+        if limit:
+            params = prepare_limit_order(client, bot.symbol, side, quantity, order[3])
+        else:
+            params = prepare_market_order(client, bot.symbol, side, quantity, current_price)
+        if params:
+            cid = new_client_order_id(bot.id, lv_name, int(cycles.get(lv_name, 0)), side)
+            prepared.append((lv_name, side, cid, quantity, params))
+        else:
+            results.append((lv_name, side, None, {}))
+    if not prepared:
+        return results
+
+    with span("db_write"):
+        record_owned_intents(bot, [(lv_name, side, cid, quantity) for lv_name, side, cid, quantity, _ in prepared])
+    _pending_bots.add(bot.id)
+
+    for lv_name, side, cid, _, params in prepared:
+        with span("order"):
+            order_resp = send_order(client, params, cid)
+        results.append((lv_name, side, cid, order_resp))
+    return results
+
+
+def execute_close_all(bot: BnbBot, client: Client, orders: list, runtime_data: dict, current_price: Decimal) -> list:
+    """
+    Zamknięcie pozycji jednym zleceniem: SELL sumy wolumenów poziomów [(lv_name, "SELL", volume)],
+    zaokrąglonej raz do LOT_SIZE - jedna podróż do giełdy zamiast zlecenia na poziom.
+    INTENT-y poziomów dzielą newClientOrderId zlecenia (z cyklu pierwszego poziomu), a wypełnienie
+    jest rozdzielane na poziomy przez allocate_fill. Zwraca to samo co execute_orders.
+    """
+    if len(orders) <= 1:
+        return execute_orders(bot, client, orders, runtime_data, current_price)
+
+    total_volume = sum(volume for _, _, volume in orders)
+    params = prepare_market_order(client, bot.symbol, "SELL", total_volume, current_price)
+    if not params:
+        return [(lv_name, side, None, {}) for lv_name, side, _ in orders]
+
+    first_level = orders[0][0]
+    cid = new_client_order_id(bot.id, first_level, int(runtime_data.get("cycles", {}).get(first_level, 0)), "SELL")
+    with span("db_write"):
+        record_owned_intents(bot, [(lv_name, side, cid, volume) for lv_name, side, volume in orders])
+    _pending_bots.add(bot.id)
+
+    with span("order"):
+        order_resp = send_order(client, params, cid)
+    if not order_resp:
+        return [(lv_name, side, cid, {}) for lv_name, side, _ in orders]
+    parts = allocate_fill(order_resp, [(lv_name, volume) for lv_name, _, volume in orders])
+    return [(lv_name, side, cid, parts[lv_name]) for lv_name, side, _ in orders]
+
+
+def needs_recovery(bot: BnbBot) -> bool:
+    """
+    Czy przed tickiem trzeba wyjaśnić zlecenia bota z dziennika (pierwszy tick w procesie
+    albo niezapisany wynik zlecenia; w trybie LIMIT - zlecenia nie są zsynchronizowane ze stanem).
+    """
+    if bot.order_mode == BnbBot.LIMIT_MODE:
+        return bot.id not in _limit_synced
+    return bot.id not in _recovered_bots or bot.id in _pending_bots
+
+
+def get_trigger_band(bot_id: int):
+    """
+    (lo, hi, urgent) z ostatniego zapisanego ticka bota albo None. urgent - bot ma zlecenia
+    do ponowienia lub wyjaśnienia i powinien być sprawdzony jak najszybciej.
+    """
+    return _trigger_bands.get(bot_id)
+
+
+def request_limit_sync(bot_id: int):
+    """
+    Następny tick bota LIMIT porówna jego zlecenia z giełdą (np. po zerwaniu strumienia użytkownika).
+    """
+    _limit_synced.discard(bot_id)
+
+
+def plan_recovery(bots) -> dict:
+    """
+    Przygotowuje wyjaśnianie zleceń dla wielu botów naraz: INTENT-y wszystkich botów jednym
+    zapytaniem do bazy i jedno zapytanie allOrders na (konto, symbol) zamiast get_order na poziom.
+    Zwraca {bot_id: (intents, OrderSweep)} do przekazania do run_grid_bot(recovery=...).
+    """
+    bots = list(bots)
+    pending = pending_intents_by_bot([bot.id for bot in bots])
+    groups = {}
+    for bot in bots:
+        groups.setdefault((bot.binance_api_key, bot.symbol), []).append(bot)
+
+    plan = {}
+    for (_, symbol), group in groups.items():
+        intents = [i for bot in group for i in pending.get(bot.id, [])]
+        sweep = sweep_orders(get_binance_client(group[0]), symbol, intents) if intents else None
+        for bot in group:
+            plan[bot.id] = (pending.get(bot.id, []), sweep)
+    return plan
+
+
+def resolve_order(bot: BnbBot, levels_data: dict, runtime_data: dict, lv_name: str, side: str,
+                  client_order_id: str, order, touched: set, buffer: WriteBuffer) -> bool:
+    """
+    Zapisuje wynik zlecenia z dziennika: wypełnienie (apply_buy/apply_sell + ACK/FILL/COMMIT)
+    albo FAILED, gdy zlecenia nie ma na giełdzie (order is None) lub zamknięto je bez wykonania.
+    Zwraca False, gdy zlecenie jest jeszcze otwarte.
+    """
+    if order is not None and order.get("status") not in FINAL_ORDER_STATUSES:
+        return False
+
+    touched.add(lv_name)
+    if order is None or Decimal(order.get("executedQty", "0")) <= 0:
+        record_failed(buffer, bot, lv_name, side, client_order_id)
+        runtime_data["flags"][f"{lv_name}_in_progress"] = False
+        return True
+
+    if side == "BUY":
+        executed_qty, average_price = apply_buy(bot, runtime_data, lv_name, order, buffer)
+    else:
+        executed_qty, average_price, _ = apply_sell(bot, levels_data, runtime_data, lv_name, order, buffer)
+    record_fill(buffer, bot, lv_name, side, client_order_id, order, executed_qty, average_price)
+    return True
+
+
+def resolve_intents(bot: BnbBot, levels_data: dict, runtime_data: dict, intents: list, order, touched: set,
+                    buffer: WriteBuffer) -> bool:
+    """
+    resolve_order dla INTENT-ów jednego zlecenia (group_by_order). Przy zamknięciu zbiorczym
+    wypełnienie dzielimy na poziomy proporcjonalnie do wolumenów zapisanych w INTENT-ach.
+    """
+    if len(intents) == 1:
+        intent = intents[0]
+        return resolve_order(bot, levels_data, runtime_data, intent.level, intent.side, intent.client_order_id,
+                             order, touched, buffer)
+    if order is not None and order.get("status") not in FINAL_ORDER_STATUSES:
+        return False
+
+    parts = {}
+    if order is not None:
+        parts = allocate_fill(order, [(intent.level, Decimal(intent.quantity or 0)) for intent in intents])
+    for intent in intents:
+        resolve_order(bot, levels_data, runtime_data, intent.level, intent.side, intent.client_order_id,
+                      parts.get(intent.level), touched, buffer)
+    return True
+
+
+def recover_orders(bot: BnbBot, client: Client, levels_data: dict, runtime_data: dict, touched: set,
+                   buffer: WriteBuffer, recovery: tuple = None, open_levels: set = None) -> set:
+    """
+    Wyjaśnia INTENT-y z dziennika bez COMMIT/FAILED: sprawdza status zlecenia po newClientOrderId
+    (w odpowiedzi allOrders dla symbolu) i dopisuje wypełnienie do stanu albo oznacza zlecenie
+    jako nieudane - zamiast składać je ponownie.
+    recovery: (intents, OrderSweep) przygotowane przez plan_recovery; bez niego pobieramy je tutaj.
+    open_levels: gdy podany, dostaje poziomy ze zleceniem nadal otwartym na giełdzie.
+    Zwraca poziomy, których zlecenia nadal nie da się wyjaśnić - w tym ticku ich nie ruszamy.
+    """
+    if recovery is None:
+        intents = pending_intents(bot)
+        sweep = sweep_orders(client, bot.symbol, intents)
+    else:
+        intents, sweep = recovery
+
+    unresolved = set()
+    for client_order_id, group in group_by_order(intents).items():
+        levels = {intent.level for intent in group}
+        try:
+            order = sweep.lookup(client, client_order_id)
+        except BinanceAPIException as e:
+            print(f"[recover_orders] Bot {bot.id}: nie udało się sprawdzić {client_order_id}: {e}")
+            unresolved |= levels
+            continue
+
+        if not resolve_intents(bot, levels_data, runtime_data, group, order, touched, buffer):
+            unresolved |= levels
+            if open_levels is not None:
+                open_levels |= levels
+        elif order is not None and Decimal(order.get("executedQty", "0")) > 0:
+            print(f"[recover_orders] Bot {bot.id}: odtworzono {group[0].side} {', '.join(sorted(levels))} "
+                  f"({client_order_id}).")
+    return unresolved
+
+
+def cancel_resting_orders(bot: BnbBot, client: Client):
+    """
+    Anuluje zlecenia LIMIT bota czekające na giełdzie (INTENT-y bez COMMIT/FAILED).
+    Ich wynik (anulowane, ewentualnie częściowo wykonane) zapisuje potem recover_orders.
+    """
+    for intent in pending_intents(bot):
+        try:
+            with span("order"):
+                client.cancel_order(symbol=bot.symbol, origClientOrderId=intent.client_order_id)
+        except BinanceAPIException as e:
+            if e.code not in ORDER_NOT_FOUND_CODES:
+                print(f"[cancel_resting_orders] Bot {bot.id}: nie udało się anulować {intent.client_order_id}: {e}")
+
+
+def place_resting_orders(bot: BnbBot, client: Client, grid: GridLevels, levels_data: dict, runtime_data: dict,
+                         level_names, touched: set, buffer: WriteBuffer) -> bool:
+    """
+    Tryb LIMIT: wystawia na poziomach czekające zlecenia - KUPNO po cenie poziomu (za caps poziomu),
+    gdy poziom nie jest kupiony, albo SPRZEDAŻ kupionego wolumenu po cenie docelowej z sell_levels.
+    Zwraca False, gdy któregoś zlecenia nie udało się wystawić (spróbujemy przy następnej synchronizacji).
+    """
+    orders = []
+    for lv_name in level_names:
+        if runtime_data["flags"].get(f"{lv_name}_bought", False):
+            sell_target_price = grid.sell_targets.get(lv_name)
+            buy_volume_stored = Decimal(runtime_data["buy_volume"].get(lv_name, "0"))
+            if sell_target_price is not None and buy_volume_stored > 0:
+                orders.append((lv_name, "SELL", buy_volume_stored, sell_target_price))
+        else:
+            level_price = grid.prices[lv_name]
+            capital_for_level = Decimal(levels_data["caps"].get(lv_name, 0))
+            if capital_for_level > 0:
+                orders.append((lv_name, "BUY", capital_for_level / level_price, level_price))
+
+    placed = True
+    for lv_name, side, cid, order_resp in execute_orders(bot, client, orders, runtime_data, None, limit=True):
+        if not order_resp:
+            placed = False
+            continue
+        # Zlecenie po cenie lepszej niż rynek wykonuje się od razu - zapisujemy je jak wypełnienie
+        if order_resp.get("status") in FINAL_ORDER_STATUSES:
+            resolve_order(bot, levels_data, runtime_data, lv_name, side, cid, order_resp, touched, buffer)
+            placed = False  # przeciwne zlecenie poziomu wystawimy przy następnej synchronizacji
+    return placed
+
+
+def sync_limit_bot(bot: BnbBot, client: Client, grid: GridLevels, levels_data: dict, runtime_data: dict,
+                   buffer: WriteBuffer, recovery: tuple = None, fills=()):
+    """
+    Tick bota w trybie LIMIT. Przy pierwszym ticku w procesie (albo po zerwaniu strumienia)
+    porównuje zlecenia z dziennika z giełdą i wystawia brakujące; później reaguje tylko
+    na wypełnienia ze strumienia użytkownika (executionReport), wystawiając przeciwne zlecenie poziomu.
+    """
+    touched = set()
+    synced = bot.id in _limit_synced
+    if not synced:
+        open_levels = set()
+        unresolved = recover_orders(bot, client, levels_data, runtime_data, touched, buffer, recovery, open_levels)
+        to_place = [lv_name for lv_name in grid.level_names if lv_name not in unresolved]
+        synced = unresolved == open_levels
+    else:
+        pending = group_by_order(pending_intents(bot)) if fills else {}
+        to_place = []
+        for event in fills:
+            group = pending.pop(event.get("c"), None)
+            if group is None:
+                continue  # zlecenie już rozliczone (np. przez synchronizację) albo nie z dziennika
+            if resolve_intents(bot, levels_data, runtime_data, group, execution_report_order(event), touched, buffer):
+                to_place.extend(intent.level for intent in group)
+            else:
+                pending[event.get("c")] = group  # częściowe wypełnienie - czekamy na kolejne zdarzenie
+
+    if to_place:
+        synced = place_resting_orders(bot, client, grid, levels_data, runtime_data, to_place, touched, buffer) \
+            and synced
+
+    with span("encode"):
+        bot.save_state(levels_data, runtime_data, touched, buffer=buffer)
+    if not bot.use_level_table and touched:
+        buffer.add_bot(bot)
+
+    # Zlecenia czekają na giełdzie - worker musi tylko pilnować warunku zamknięcia (cena > 110% lv1)
+    band = (None, grid.prices["lv1"] * Decimal("1.1") if "lv1" in grid.prices else None, not synced)
+
+    def remember_sync():
+        if synced:
+            _limit_synced.add(bot.id)
+        else:
+            _limit_synced.discard(bot.id)
+        _trigger_bands[bot.id] = band
+
+    buffer.after_flush(remember_sync)
+
+
+def get_grid_levels(bot: BnbBot, levels_data: dict) -> GridLevels:
+    """
+    Zwraca skompilowane poziomy bota z cache. Ceny poziomów nie zmieniają się po create_bot
+    (zmieniają się tylko caps), więc kompilujemy je ponownie tylko gdy zmieni się konfiguracja.
+    """
+    key = (bot.max_price, bot.percent, len(levels_data))
+    cached = _grid_cache.get(bot.id)
+    if cached is None or cached[0] != key:
+        cached = (key, GridLevels(levels_data))
+        _grid_cache[bot.id] = cached
+    return cached[1]
+
+
+def forget_bot_state(bot_id: int):
+    """
+    Czyści stan bota trzymany w pamięci (np. po zakończeniu bota).
+    """
+    _grid_cache.pop(bot_id, None)
+    _last_prices.pop(bot_id, None)
+    _retry_levels.pop(bot_id, None)
+    _recovered_bots.discard(bot_id)
+    _pending_bots.discard(bot_id)
+    _limit_synced.discard(bot_id)
+    _trigger_bands.pop(bot_id, None)
+    forget_bot_metrics(bot_id)
+
+
 def calculate_profit(buy_price: Decimal, sell_price: Decimal, volume: Decimal) -> Decimal:
     """
     Liczy zysk: (sell_price - buy_price) * volume, następnie odejmuje prowizję 0.11%.
@@ -83,224 +638,197 @@ def calculate_profit(buy_price: Decimal, sell_price: Decimal, volume: Decimal) -
     return net
 
 
-def run_grid_bot(bot_id: int, close_and_finish: bool = False):
+def run_grid_bot(bot_id: int, close_and_finish: bool = False, current_price: Decimal = None,
+                 worker_id: str = None, buffer: WriteBuffer = None, recovery: tuple = None, fills=()):
     """
     Funkcja, która może być wywoływana co pewien interwał (cron, Celery, cokolwiek),
     by aktualizować stany i ewentualnie wykonywać transakcje.
     
     Parametr close_and_finish: gdy True, zamyka wszystkie pozycje i kończy bota
+    Parametr current_price: cena ze snapshotu worker-a; gdy None, pobieramy ją z Binance
+    Parametr worker_id: w trybie shardingu bot musi nadal należeć do tego workera
+    Parametr buffer: bufor zapisów cyklu worker-a; gdy None, zapisujemy na końcu ticka
+    Parametr recovery: zlecenia do wyjaśnienia przygotowane zbiorczo przez plan_recovery
+    Parametr fills: zdarzenia executionReport ze strumienia użytkownika (boty w trybie LIMIT)
     """
-    try:
-        bot = BnbBot.objects.get(id=bot_id, status="RUNNING")
-    except BnbBot.DoesNotExist:
-        return  # Bot nie istnieje lub nie jest w statusie RUNNING
-
-    # 1) Pobierz aktualną cenę z Binance
+    if buffer is None:
+        buffer = WriteBuffer()
+        try:
+            return run_grid_bot(bot_id, close_and_finish, current_price, worker_id, buffer, recovery, fills)
+        finally:
+            # Zapisujemy też to, co zebrało się przed ewentualnym błędem (złożone zlecenia)
+            buffer.flush()
+
+    filters = {"id": bot_id, "status": "RUNNING"}
+    if worker_id is not None:
+        filters["worker_id"] = worker_id
+    with span("decode"):
+        try:
+            bot = BnbBot.objects.get(**filters)
+        except BnbBot.DoesNotExist:
+            return  # Bot nie istnieje, nie jest w statusie RUNNING albo przejął go inny worker
+        bot.lease_owner = worker_id  # execute_orders sprawdzi dzierżawę jeszcze raz przed zleceniami
+
+        # levels_data:  np. {"lv1": 5.655, "lv2": 5.372, ..., "caps": {...}, "sell_levels": {...}}
+        # runtime_data: np. {"flags": {"lv1_bought": False, ...}, "buy_price": {"lv1":0}, "buy_volume": {"lv1":0}}
+        levels_data, runtime_data = bot.get_state()
+
+    # 1) Pobierz aktualną cenę z Binance (o ile worker nie przekazał jej ze snapshotu)
     client = get_binance_client(bot)
-    current_price = fetch_symbol_price(client, bot.symbol)
-
-    levels_data = bot.get_levels_data()    # np. {"lv1": 5.655, "lv2": 5.372, ..., "caps": {...}, "sell_levels": {...}}
-    runtime_data = bot.get_runtime_data()  # np. {"flags": {"lv1_bought": False, ...}, "buy_price": {"lv1":0}, "buy_volume": {"lv1":0}}
+    if current_price is None:
+        with span("price_fetch"):
+            current_price = fetch_symbol_price(client, bot.symbol)
+    touched = set()  # poziomy, których stan zmienił się w tym ticku
 
     if not levels_data or not runtime_data:
         return
 
-    # Wyodrębnij listę poziomów (np. lv1, lv2, lv3...)
-    level_names = sorted([k for k in levels_data.keys() if k.startswith("lv")],
-                         key=lambda x: int(x.replace("lv", "")))
+    # Wyodrębnij listę poziomów (np. lv1, lv2, lv3...) - skompilowaną raz i trzymaną w cache
+    grid = get_grid_levels(bot, levels_data)
+    level_names = grid.level_names
 
     if "lv1" not in level_names:
         # Jeśli nie ma lv1, nie ma sensu kontynuować
         return
 
-    lv1_price = Decimal(str(levels_data["lv1"]))
+    lv1_price = grid.prices["lv1"]
+    closing = close_and_finish or current_price > lv1_price * Decimal("1.1")
+
+    # Tryb LIMIT: zlecenia czekają na giełdzie; przy zamykaniu najpierw je anulujemy
+    if bot.order_mode == BnbBot.LIMIT_MODE:
+        if not closing:
+            return sync_limit_bot(bot, client, grid, levels_data, runtime_data, buffer, recovery, fills)
+        cancel_resting_orders(bot, client)
+        _limit_synced.discard(bot.id)
+        recovery = None
+
+    # Pierwszy tick bota w tym procesie (np. po restarcie) albo niezapisany wynik zlecenia:
+    # wyjaśniamy zlecenia z dziennika, zanim złożymy nowe
+    blocked = set()
+    if needs_recovery(bot):
+        blocked = recover_orders(bot, client, levels_data, runtime_data, touched, buffer, recovery)
+
+    def finish_journal(unresolved):
+        # Po zapisie ticka bot nie ma już niewyjaśnionych zleceń (o ile wszystkie się rozstrzygnęły)
+        if not unresolved:
+            _recovered_bots.add(bot.id)
+            _pending_bots.discard(bot.id)
 
     # -----------------------------------------------------
     # ZAMKNIĘCIE POZYCJI I ZAKOŃCZENIE BOTA (na żądanie lub gdy cena > 110% lv1)
     # -----------------------------------------------------
-    if close_and_finish or current_price > lv1_price * Decimal("1.1"):
+    if closing:
         print(f"[run_grid_bot] Bot {bot.id}: Zamykam wszystkie pozycje i kończę działanie bota.")
-        success = True  # Flaga oznaczająca czy udało się zamknąć wszystkie pozycje
+        success = not blocked  # Flaga oznaczająca czy udało się zamknąć wszystkie pozycje
+
+        orders = []
+        with span("decision"):
+            for lv_name in level_names:
+                lv_bought = runtime_data["flags"].get(f"{lv_name}_bought", False)
+                lv_in_progress = runtime_data["flags"].get(f"{lv_name}_in_progress", False)
+                buy_volume_stored = Decimal(runtime_data["buy_volume"].get(lv_name, "0"))
+
+                # Jeżeli mamy pozycję kupioną (bought == True) i nie jest w trakcie in_progress -> zamykamy SELL
+                if lv_bought and not lv_in_progress and buy_volume_stored > 0 and lv_name not in blocked:
+                    orders.append((lv_name, "SELL", buy_volume_stored))
+
+        # Jedno zbiorcze zlecenie SELL na wszystkie poziomy, wypełnienie rozdzielone na poziomy
+        unresolved = set(blocked)
+        for lv_name, side, cid, order_resp in execute_close_all(bot, client, orders, runtime_data, current_price):
+            touched.add(lv_name)
+            if not order_resp:
+                # Błąd w składaniu zlecenia – przechodzimy dalej
+                if cid:
+                    unresolved.add(lv_name)
+                success = False  # Nie udało się zamknąć wszystkich pozycji
+                continue
 
-        for lv_name in level_names:
-            lv_bought = runtime_data["flags"].get(f"{lv_name}_bought", False)
-            lv_in_progress = runtime_data["flags"].get(f"{lv_name}_in_progress", False)
-            buy_price_stored = Decimal(runtime_data["buy_price"].get(lv_name, "0"))
-            buy_volume_stored = Decimal(runtime_data["buy_volume"].get(lv_name, "0"))
+            # Oblicz średnią cenę sprzedaży i zysk; zwiększamy kapitał poziomu o profit
+            executed_qty, average_price, profit = apply_sell(bot, levels_data, runtime_data, lv_name, order_resp,
+                                                             buffer, compound=True)
+            record_fill(buffer, bot, lv_name, side, cid, order_resp, executed_qty, average_price)
 
-            # Jeżeli mamy pozycję kupioną (bought == True) i nie jest w trakcie in_progress -> zamykamy SELL
-            if lv_bought and not lv_in_progress and buy_volume_stored > 0:
-                runtime_data["flags"][f"{lv_name}_in_progress"] = True
-
-                order_resp = place_market_order(client, bot.symbol, "SELL", buy_volume_stored)
-                if not order_resp:
-                    # Błąd w składaniu zlecenia – reset flag, przechodzimy dalej
-                    runtime_data["flags"][f"{lv_name}_in_progress"] = False
-                    success = False  # Nie udało się zamknąć wszystkich pozycji
-                    continue
-
-                # Dodajemy 0.5s sleep aby dać czas na przetworzenie transakcji
-                time.sleep(0.5)
-
-                # Oblicz średnią cenę sprzedaży i zysk
-                fills = order_resp.get("fills", [])
-                executed_qty = Decimal("0")
-                fill_cost = Decimal("0")
-
-                for f in fills:
-                    fill_price = Decimal(f["price"])
-                    fill_qty = Decimal(f["qty"])
-                    executed_qty += fill_qty
-                    fill_cost += fill_price * fill_qty
-
-                average_price = fill_cost / executed_qty if executed_qty > 0 else Decimal("0")
-                profit = calculate_profit(buy_price_stored, average_price, executed_qty)
-
-                # Zapisz transakcję SELL
-                BnbTrade.objects.create(
-                    bot=bot,
-                    level=lv_name,
-                    side="SELL",
-                    quantity=executed_qty,
-                    open_price=buy_price_stored,
-                    close_price=average_price,
-                    profit=profit,
-                    binance_order_id=order_resp.get("orderId", ""),
-                    status="FILLED",
-                    sell_type="MARKET"
-                )
-
-                # Zwiększamy kapitał poziomu o profit (opcjonalnie)
-                new_cap = Decimal(levels_data["caps"][lv_name]) + profit
-                levels_data["caps"][lv_name] = str(new_cap)
-
-                # Reset flag
-                runtime_data["flags"][f"{lv_name}_in_progress"] = False
-                runtime_data["flags"][f"{lv_name}_bought"] = False
-                runtime_data["buy_price"][lv_name] = "0"
-                runtime_data["buy_volume"][lv_name] = "0"
-
-                print(f"[run_grid_bot] Bot {bot.id}: Zamknięto pozycję {lv_name} z zyskiem {profit}")
+            print(f"[run_grid_bot] Bot {bot.id}: Zamknięto pozycję {lv_name} z zyskiem {profit}")
 
         # Zapisujemy dane, aby nie stracić informacji o zamkniętych pozycjach
-        bot.save_levels_data(levels_data)
-        bot.save_runtime_data(runtime_data)
-        
-        # Dodajemy opóźnienie, aby upewnić się, że wszystkie transakcje zostały przetworzone
-        time.sleep(1)
-        
+        with span("encode"):
+            bot.save_state(levels_data, runtime_data, touched, buffer=buffer)
+
         # Ustawiamy status bota na FINISHED tylko jeśli wszystkie pozycje zostały poprawnie zamknięte
         if success:
             bot.status = "FINISHED"
-            bot.save()
+            buffer.after_flush(lambda: forget_bot_state(bot.id))
             print(f"[run_grid_bot] Bot {bot.id}: Wszystkie pozycje zamknięte, status zmieniony na FINISHED.")
         else:
             print(f"[run_grid_bot] Bot {bot.id}: Nie udało się zamknąć wszystkich pozycji, bot pozostaje RUNNING.")
-        
+
+        buffer.add_bot(bot, ["status", "updated_at"] if bot.use_level_table else None)
+        buffer.after_flush(lambda: finish_journal(unresolved))
         return  # Koniec działania
 
     # -----------------------------------------------
     # STANDARDOWA LOGIKA GRID TRADING
     # -----------------------------------------------
 
-    # 2) Przejrzyj pozostałe poziomy
-    for lv_name in level_names:
-        level_price = Decimal(levels_data[lv_name])
-        capital_for_level = Decimal(levels_data["caps"].get(lv_name, 0))  # kapitał w USDT (zakładam)
+    # 2) Sprawdź tylko poziomy, których progi zostały przekroczone od ostatniej ceny
+    #    (plus te, których zlecenie nie powiodło się w poprzednim ticku)
+    prev_price = _last_prices.get(bot.id)
+    retry = set(blocked)
+    orders = []
 
-        lv_bought = runtime_data["flags"].get(f"{lv_name}_bought", False)
-        lv_in_progress = runtime_data["flags"].get(f"{lv_name}_in_progress", False)
-        buy_price_stored = Decimal(runtime_data["buy_price"].get(lv_name, "0"))
-        buy_volume_stored = Decimal(runtime_data["buy_volume"].get(lv_name, "0"))
+    with span("decision"):
+        to_check = set(grid.crossed(prev_price, current_price)) | _retry_levels.get(bot.id, set())
+        for lv_name in sorted(to_check - blocked, key=grid.level_index.get):
+            level_price = grid.prices[lv_name]
+            capital_for_level = Decimal(levels_data["caps"].get(lv_name, 0))  # kapitał w USDT (zakładam)
 
-        # -----------------------------------------------------
-        # A) Logika KUPNA
-        # -----------------------------------------------------
-        if current_price < level_price and not lv_bought and not lv_in_progress:
-            runtime_data["flags"][f"{lv_name}_in_progress"] = True
+            lv_bought = runtime_data["flags"].get(f"{lv_name}_bought", False)
+            lv_in_progress = runtime_data["flags"].get(f"{lv_name}_in_progress", False)
+            buy_volume_stored = Decimal(runtime_data["buy_volume"].get(lv_name, "0"))
+            sell_target_price = grid.sell_targets.get(lv_name)
 
-            order_resp = place_market_order(client, bot.symbol, "BUY", capital_for_level)
-            if not order_resp:
-                runtime_data["flags"][f"{lv_name}_in_progress"] = False
-                continue
+            # A) Logika KUPNA
+            if current_price < level_price and not lv_bought and not lv_in_progress:
+                orders.append((lv_name, "BUY", capital_for_level))
 
-            fills = order_resp.get("fills", [])
-            executed_qty = Decimal("0")
-            fill_cost = Decimal("0")
-
-            for f in fills:
-                fill_price = Decimal(f["price"])
-                fill_qty = Decimal(f["qty"])
-                executed_qty += fill_qty
-                fill_cost += fill_price * fill_qty
-
-            average_price = fill_cost / executed_qty if executed_qty > 0 else Decimal("0")
-
-            BnbTrade.objects.create(
-                bot=bot,
-                level=lv_name,
-                side="BUY",
-                quantity=executed_qty,
-                open_price=average_price,
-                close_price=None,
-                profit=None,
-                binance_order_id=order_resp.get("orderId", ""),
-                status="FILLED",
-                buy_type="MARKET"
-            )
+            # B) Logika SPRZEDAŻY
+            elif lv_bought and not lv_in_progress and sell_target_price is not None:
+                if current_price >= sell_target_price:
+                    orders.append((lv_name, "SELL", buy_volume_stored))
 
+    unresolved = set(blocked)
+    for lv_name, side, cid, order_resp in execute_orders(bot, client, orders, runtime_data, current_price):
+        touched.add(lv_name)
+        if not order_resp:
             runtime_data["flags"][f"{lv_name}_in_progress"] = False
-            runtime_data["flags"][f"{lv_name}_bought"] = True
-            runtime_data["buy_price"][lv_name] = str(average_price)
-            runtime_data["buy_volume"][lv_name] = str(executed_qty)
-
-        # -----------------------------------------------------
-        # B) Logika SPRZEDAŻY
-        # -----------------------------------------------------
-        sell_lv_name = levels_data["sell_levels"].get(lv_name) if "sell_levels" in levels_data else None
-        if lv_bought and not lv_in_progress and sell_lv_name:
-            sell_target_price = Decimal(levels_data[sell_lv_name])
-
-            if current_price >= sell_target_price:
-                runtime_data["flags"][f"{lv_name}_in_progress"] = True
-
-                order_resp = place_market_order(client, bot.symbol, "SELL", buy_volume_stored)
-                if not order_resp:
-                    runtime_data["flags"][f"{lv_name}_in_progress"] = False
-                    continue
-
-                fills = order_resp.get("fills", [])
-                executed_qty = Decimal("0")
-                fill_cost = Decimal("0")
-
-                for f in fills:
-                    fill_price = Decimal(f["price"])
-                    fill_qty = Decimal(f["qty"])
-                    executed_qty += fill_qty
-                    fill_cost += fill_price * fill_qty
-
-                average_price = fill_cost / executed_qty if executed_qty > 0 else Decimal("0")
-                profit = calculate_profit(buy_price_stored, average_price, executed_qty)
-
-                BnbTrade.objects.create(
-                    bot=bot,
-                    level=lv_name,
-                    side="SELL",
-                    quantity=executed_qty,
-                    open_price=buy_price_stored,
-                    close_price=average_price,
-                    profit=profit,
-                    binance_order_id=order_resp.get("orderId", ""),
-                    status="FILLED",
-                    sell_type="MARKET"
-                )
-
-                runtime_data["flags"][f"{lv_name}_in_progress"] = False
-                runtime_data["flags"][f"{lv_name}_bought"] = False
-                runtime_data["buy_price"][lv_name] = "0"
-                runtime_data["buy_volume"][lv_name] = "0"
-
-    # 3) Zapisz zmodyfikowane dane w bazie
-    bot.save_levels_data(levels_data)
-    bot.save_runtime_data(runtime_data)
-    bot.save()
+            retry.add(lv_name)
+            if cid:
+                # Wynik nieznany (np. timeout) - następny tick zapyta giełdę o status zlecenia
+                # (po jego deterministycznym newClientOrderId) zamiast składać je ponownie
+                unresolved.add(lv_name)
+            continue
+
+        if side == "BUY":
+            executed_qty, average_price = apply_buy(bot, runtime_data, lv_name, order_resp, buffer)
+        else:
+            executed_qty, average_price, _ = apply_sell(bot, levels_data, runtime_data, lv_name, order_resp, buffer)
+        record_fill(buffer, bot, lv_name, side, cid, order_resp, executed_qty, average_price)
+
+    # 3) Zapisz zmodyfikowane dane w bazie (przez bufor - jedna transakcja razem z transakcjami BnbTrade)
+    # (z tabelą BnbLevelState zapisujemy tylko wiersze zmienionych poziomów, bez całego bota)
+    with span("encode"):
+        bot.save_state(levels_data, runtime_data, touched, buffer=buffer)
+    if not bot.use_level_table:
+        buffer.add_bot(bot)
+
+    # 4) Zapamiętaj cenę dopiero po zapisie - jeśli tick lub zapis się wywróci, następny sprawdzi cały zakres od nowa
+    lo, hi = grid.trigger_band(current_price, runtime_data["flags"])
+    band = (lo, hi, bool(retry or unresolved))
+
+    def remember_tick():
+        _last_prices[bot.id] = current_price
+        _retry_levels[bot.id] = retry
+        _trigger_bands[bot.id] = band
+        finish_journal(unresolved)
+
+    buffer.after_flush(remember_tick)
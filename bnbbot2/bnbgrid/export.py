@@ -0,0 +1,176 @@
+# bnbgrid/export.py
+
+import csv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # bez pyarrow dostępny jest tylko eksport CSV
+    pa = pq = None
+
+CHUNK_SIZE = 2000  # wierszy na partię: pobranie z bazy (.iterator) i jeden kawałek odpowiedzi
+
+# format: (content type, rozszerzenie pliku)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Pola BnbTrade potrzebne w eksporcie (.only) - bez id bota i innych kolumn
+TRADE_FIELDS = ("id", "level", "side", "quantity", "open_price", "close_price", "profit", "binance_order_id",
+                "buy_type", "sell_type", "status", "created_at")
+
+# Definicja nagłówka CSV - pomijamy pola związane z id
+CSV_HEADER = [
+    "Level",
+    "Side",
+    "Quantity",
+    "Open Price",
+    "Close Price",
+    "Profit",
+    "Binance Order Id",
+    "Buy Type",
+    "Sell Type",
+    "Status",
+    "Open Time",
+    "Close Time",
+]
+
+
+def available_formats() -> list:
+    return [fmt for fmt in FORMATS if fmt == "csv" or pa is not None]
+
+
+def _chunks(trades, size: int = None):
+    size = size or CHUNK_SIZE
+    chunk = []
+    for trade in trades:
+        chunk.append(trade)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# -------------------------------------------------------
+# CSV
+# -------------------------------------------------------
+class _Echo:
+    """
+    Plik-atrapa dla csv.writer: write() zwraca sformatowany wiersz zamiast go buforować.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_decimal(value) -> str:
+    return str(value).replace('.', ',') if value is not None else ""
+
+
+def csv_row(trade) -> list:
+    open_time = trade.created_at.strftime("%Y-%m-%d %H:%M") if trade.created_at else ""
+    # Jeżeli posiadasz pole 'filled_at' (np. jako moment zamknięcia transakcji)
+    close_time = ""
+    if hasattr(trade, 'filled_at') and trade.filled_at:
+        close_time = trade.filled_at.strftime("%Y-%m-%d %H:%M")
+
+    return [
+        trade.level,
+        trade.side or "",
+        _csv_decimal(trade.quantity),
+        _csv_decimal(trade.open_price),
+        _csv_decimal(trade.close_price),
+        _csv_decimal(trade.profit),
+        trade.binance_order_id or "",
+        trade.buy_type or "",
+        trade.sell_type or "",
+        trade.status,
+        open_time,
+        close_time,
+    ]
+
+
+def iter_csv(trades):
+    """
+    CSV (separator ';', przecinek dziesiętny) w kawałkach po CHUNK_SIZE wierszy.
+    """
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield writer.writerow(CSV_HEADER)
+    for chunk in _chunks(trades):
+        yield "".join(writer.writerow(csv_row(trade)) for trade in chunk)
+
+
+# -------------------------------------------------------
+# Parquet / Arrow (pyarrow)
+# -------------------------------------------------------
+class _ByteSink:
+    """
+    Plik wyjściowy dla writerów pyarrow: bajty zapisane od ostatniego drain() trafiają do odpowiedzi,
+    więc w pamięci jest najwyżej jedna partia.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def arrow_schema():
+    money = pa.decimal128(20, 8)
+    return pa.schema([
+        ("id", pa.int64()),
+        ("level", pa.string()),
+        ("side", pa.string()),
+        ("quantity", money),
+        ("open_price", money),
+        ("close_price", money),
+        ("profit", money),
+        ("binance_order_id", pa.string()),
+        ("buy_type", pa.string()),
+        ("sell_type", pa.string()),
+        ("status", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def iter_arrow(trades, fmt: str):
+    """
+    Parquet (jedna grupa wierszy na partię) albo strumień Arrow IPC, wysyłane partiami po CHUNK_SIZE wierszy.
+    """
+    schema = arrow_schema()
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    for chunk in _chunks(trades):
+        columns = {name: [getattr(trade, name) for trade in chunk] for name in schema.names}
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(trades, fmt: str):
+    if fmt == "csv":
+        return iter_csv(trades)
+    return iter_arrow(trades, fmt)
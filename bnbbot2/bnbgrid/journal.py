@@ -0,0 +1,107 @@
+# bnbgrid/journal.py
+
+import re
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from .models import BnbBot, BnbJournalEvent
+
+# Kody błędów Binance oznaczające, że zlecenia o danym newClientOrderId nie ma na giełdzie
+ORDER_NOT_FOUND_CODES = (-2013, -2011)
+
+# Przestrzeń nazw usługi w newClientOrderId - bnbbot1 i bnbbot2 mają własne numeracje botów,
+# a mogą handlować na tym samym koncie. Prefiks nie może kończyć się cyfrą (oddziela go od bot_id).
+CLIENT_ORDER_PREFIX = "bnb"
+
+
+def client_order_prefix() -> str:
+    return getattr(settings, "BNB_CLIENT_ORDER_PREFIX", CLIENT_ORDER_PREFIX)
+
+
+def new_client_order_id(bot_id: int, lv_name: str, cycle: int, side: str) -> str:
+    """
+    newClientOrderId zlecenia poziomu - deterministyczny dla (usługa, bot, poziom, cykl, strona), np. "bnb12-lv3-7B".
+    Ponowienie tego samego zlecenia ma ten sam identyfikator, więc po timeoucie można zapytać giełdę o jego status.
+    """
+    return f"{client_order_prefix()}{bot_id}-{lv_name}-{cycle}{side[0].upper()}"[:36]
+
+
+def parse_client_order_id(client_order_id: str):
+    """
+    Odwrotność new_client_order_id: (bot_id, lv_name, cycle, side) albo None dla obcych zleceń
+    (w tym zleceń drugiej usługi z innym prefiksem).
+    """
+    pattern = rf"^{re.escape(client_order_prefix())}(\d+)-(lv\d+)-(\d+)([BS])$"
+    match = re.match(pattern, client_order_id or "")
+    if match is None:
+        return None
+    bot_id, lv_name, cycle, side = match.groups()
+    return int(bot_id), lv_name, int(cycle), "BUY" if side == "B" else "SELL"
+
+
+def record_intents(bot: BnbBot, intents: list):
+    """
+    Zapisuje od razu (poza buforem ticka) zamiary złożenia zleceń [(lv_name, side, client_order_id, quantity)].
+    Jeden INSERT na tick - musi trafić do bazy przed wysłaniem zleceń na giełdę.
+    """
+    if not intents:
+        return
+    BnbJournalEvent.objects.bulk_create([
+        BnbJournalEvent(bot=bot, level=lv_name, side=side, event=BnbJournalEvent.INTENT,
+                        client_order_id=client_order_id, quantity=quantity)
+        for lv_name, side, client_order_id, quantity in intents
+    ])
+
+
+def record_fill(buffer, bot: BnbBot, lv_name: str, side: str, client_order_id: str, order_resp: dict,
+                quantity: Decimal, price: Decimal):
+    """
+    ACK, FILL i COMMIT zlecenia - przez bufor ticka, czyli w jednej transakcji z BnbTrade i stanem poziomu.
+    """
+    order_id = str(order_resp.get("orderId", ""))
+    for event, qty, px in ((BnbJournalEvent.ACK, None, None),
+                           (BnbJournalEvent.FILL, quantity, price),
+                           (BnbJournalEvent.COMMIT, None, None)):
+        buffer.add_event(BnbJournalEvent(bot=bot, level=lv_name, side=side, event=event,
+                                         client_order_id=client_order_id, binance_order_id=order_id,
+                                         quantity=qty, price=px))
+
+
+def record_failed(buffer, bot: BnbBot, lv_name: str, side: str, client_order_id: str):
+    buffer.add_event(BnbJournalEvent(bot=bot, level=lv_name, side=side, event=BnbJournalEvent.FAILED,
+                                     client_order_id=client_order_id))
+
+
+def pending_intents_by_bot(bot_ids) -> dict:
+    """
+    {bot_id: [INTENT, ...]} - INTENT-y bez późniejszego COMMIT/FAILED z tym samym newClientOrderId,
+    czyli zlecenia wysłane (albo nie) przed awarią lub nieudanym zapisem. Jedno zapytanie dla wszystkich botów.
+    """
+    resolved = BnbJournalEvent.objects.filter(
+        bot=OuterRef("bot"), client_order_id=OuterRef("client_order_id"), id__gt=OuterRef("id"),
+        event__in=[BnbJournalEvent.COMMIT, BnbJournalEvent.FAILED],
+    )
+    pending = {}
+    intents = (BnbJournalEvent.objects.filter(bot_id__in=list(bot_ids), event=BnbJournalEvent.INTENT)
+               .exclude(Exists(resolved)).order_by("id"))
+    for intent in intents:
+        pending.setdefault(intent.bot_id, []).append(intent)
+    return pending
+
+
+def pending_intents(bot: BnbBot) -> list:
+    return pending_intents_by_bot([bot.id]).get(bot.id, [])
+
+
+def group_by_order(intents) -> dict:
+    """
+    {client_order_id: [INTENT, ...]} - zwykle jeden poziom na zlecenie; zamknięcie zbiorcze
+    (execute_close_all) zapisuje jeden INTENT na każdy zamykany poziom z tym samym newClientOrderId.
+    Powtórzony INTENT tego samego poziomu liczy się raz (ostatni).
+    """
+    groups = {}
+    for intent in intents:
+        groups.setdefault(intent.client_order_id, {})[intent.level] = intent
+    return {client_order_id: list(by_level.values()) for client_order_id, by_level in groups.items()}
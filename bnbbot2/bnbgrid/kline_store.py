@@ -0,0 +1,210 @@
+# bnbgrid/kline_store.py
+
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from binance_common.rate_limit import PRIORITY_PRICE, rate_priority
+
+try:
+    import fcntl
+except ImportError:  # Windows - blokada między procesami niedostępna
+    fcntl = None
+
+# Kolumny świecy: każda w osobnym pliku (surowe little-endian, bez nagłówka) - dopisywanie
+# to zwykły append bajtów, a odczyt to np.memmap bez kopiowania danych.
+COLUMNS = (
+    ("open_time", "<i8"),   # ms od epoki - indeks czasu, rosnący
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+)
+# open_time zapisujemy jako ostatni - wiersz istnieje dopiero, gdy jest w indeksie czasu
+WRITE_ORDER = [name for name, _ in COLUMNS[1:]] + ["open_time"]
+
+KLINES_PAGE_LIMIT = 1000  # maks. świec w jednym zapytaniu GET /api/v3/klines
+
+
+class KlineRange:
+    """
+    Zakres świec [start, stop) jednego symbolu. Kolumny to widoki memmap na pliki magazynu.
+    """
+
+    def __init__(self, columns: dict, start: int, stop: int):
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+        for name, values in columns.items():
+            setattr(self, name, values)
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+class KlineStore:
+    """
+    Lokalny magazyn świec OHLCV: katalog <root>/<SYMBOL>/<interwał>/ z plikiem na kolumnę.
+
+    Pliki są tylko dopisywane (świece starsze lub równe ostatniej zapisanej są pomijane),
+    więc wielokrotny import tego samego zakresu jest bezpieczny. Odczyt zakresu czasu to
+    searchsorted po open_time i wycinek memmap - bez kopiowania i bez zapytań do Binance.
+    Jeden zapisujący na serię (blokada pliku), dowolnie wielu czytających.
+    """
+
+    def __init__(self, root=None):
+        if root is None:
+            root = getattr(settings, "BNB_KLINE_STORE_DIR", None) or Path(settings.BASE_DIR) / "klines"
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def series_dir(self, symbol: str, interval: str) -> Path:
+        return self.root / symbol.upper() / interval
+
+    def column_path(self, symbol: str, interval: str, column: str) -> Path:
+        return self.series_dir(symbol, interval) / f"{column}.bin"
+
+    def count(self, symbol: str, interval: str) -> int:
+        """
+        Liczba kompletnych wierszy (po przerwanym zapisie kolumny mogą mieć różne długości).
+        """
+        sizes = []
+        for name, dtype in COLUMNS:
+            path = self.column_path(symbol, interval, name)
+            sizes.append(path.stat().st_size // np.dtype(dtype).itemsize if path.exists() else 0)
+        return min(sizes)
+
+    def _column(self, symbol: str, interval: str, name: str, dtype: str, rows: int):
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.column_path(symbol, interval, name), dtype=dtype, mode="r", shape=(rows,))
+
+    def last_open_time(self, symbol: str, interval: str):
+        rows = self.count(symbol, interval)
+        if rows == 0:
+            return None
+        return int(self._column(symbol, interval, "open_time", "<i8", rows)[-1])
+
+    def read(self, symbol: str, interval: str, start_ms: int = None, end_ms: int = None) -> KlineRange:
+        """
+        Świece z open_time w [start_ms, end_ms) jako widoki memmap (zero-copy).
+        """
+        rows = self.count(symbol, interval)
+        columns = {name: self._column(symbol, interval, name, dtype, rows) for name, dtype in COLUMNS}
+        times = columns["open_time"]
+        start = 0 if start_ms is None else int(np.searchsorted(times, start_ms, side="left"))
+        stop = rows if end_ms is None else int(np.searchsorted(times, end_ms, side="left"))
+        stop = max(start, stop)
+        return KlineRange({name: values[start:stop] for name, values in columns.items()}, start, stop)
+
+    def append(self, symbol: str, interval: str, klines: dict) -> int:
+        """
+        Dopisuje świece (słownik kolumna -> tablica, posortowane po open_time).
+        Zwraca liczbę dopisanych wierszy.
+        """
+        directory = self.series_dir(symbol, interval)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with self._lock, open(directory / ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            rows = self._repair(symbol, interval)
+
+            times = np.asarray(klines["open_time"], dtype="<i8")
+            last = self.last_open_time(symbol, interval) if rows else None
+            keep = np.ones(len(times), dtype=bool) if last is None else times > last
+            keep[1:] &= times[1:] > times[:-1]  # duplikaty w samych danych wejściowych
+            if not keep.any():
+                return 0
+
+            dtypes = dict(COLUMNS)
+            for name in WRITE_ORDER:
+                values = np.ascontiguousarray(np.asarray(klines[name], dtype=dtypes[name])[keep])
+                with open(self.column_path(symbol, interval, name), "ab") as f:
+                    f.write(values.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            return int(keep.sum())
+
+    def _repair(self, symbol: str, interval: str) -> int:
+        """
+        Obcina kolumny do liczby kompletnych wierszy (po zapisie przerwanym w połowie).
+        """
+        rows = self.count(symbol, interval)
+        for name, dtype in COLUMNS:
+            path = self.column_path(symbol, interval, name)
+            size = rows * np.dtype(dtype).itemsize
+            if path.exists() and path.stat().st_size != size:
+                os.truncate(path, size)
+        return rows
+
+
+def klines_to_columns(klines: list) -> dict:
+    """
+    Odpowiedź GET /api/v3/klines (listy [open_time, open, high, low, close, volume, ...]) -> kolumny.
+    """
+    data = np.array([k[:6] for k in klines], dtype=np.float64).reshape(-1, 6)
+    return {
+        "open_time": data[:, 0].astype(np.int64),
+        "open": data[:, 1], "high": data[:, 2], "low": data[:, 3], "close": data[:, 4], "volume": data[:, 5],
+    }
+
+
+def download_klines(client, store: KlineStore, symbol: str, interval: str, start_ms: int, end_ms: int = None) -> int:
+    """
+    Pobiera świece z Binance stronami po KLINES_PAGE_LIMIT od ostatniej zapisanej (albo od start_ms)
+    i dopisuje je do magazynu. Zwraca liczbę dopisanych świec.
+    """
+    last = store.last_open_time(symbol, interval)
+    cursor = start_ms if last is None else max(start_ms, last + 1)
+    appended = 0
+    while end_ms is None or cursor < end_ms:
+        params = {"symbol": symbol.upper(), "interval": interval, "startTime": cursor, "limit": KLINES_PAGE_LIMIT}
+        if end_ms is not None:
+            params["endTime"] = end_ms - 1
+        with rate_priority(PRIORITY_PRICE):
+            page = client.get_klines(**params)
+        if not page:
+            break
+        appended += store.append(symbol, interval, klines_to_columns(page))
+        cursor = int(page[-1][0]) + 1
+        if len(page) < KLINES_PAGE_LIMIT:
+            break
+    return appended
+
+
+def ingest_csv(store: KlineStore, symbol: str, interval: str, path: str) -> int:
+    """
+    Import pliku CSV ze świecami z data.binance.vision (opcjonalny nagłówek).
+    """
+    with open(path) as f:
+        first = f.readline().split(",")[0].strip()
+    skiprows = 0 if first.replace(".", "", 1).isdigit() else 1
+    data = np.loadtxt(path, delimiter=",", skiprows=skiprows, usecols=range(6), ndmin=2)
+    data = data[np.argsort(data[:, 0], kind="stable")]
+    open_time = data[:, 0].astype(np.int64)
+    if len(open_time) and open_time[0] > 10 ** 14:
+        open_time //= 1000  # nowsze pliki spot mają czas w mikrosekundach
+    return store.append(symbol, interval, {
+        "open_time": open_time,
+        "open": data[:, 1], "high": data[:, 2], "low": data[:, 3], "close": data[:, 4], "volume": data[:, 5],
+    })
+
+
+def parse_time_ms(text):
+    """
+    "1704067200000" albo data ISO ("2024-01-01", "2024-01-01T12:00") w UTC -> ms od epoki.
+    """
+    if text is None:
+        return None
+    if str(text).isdigit():
+        return int(text)
+    moment = datetime.fromisoformat(str(text))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
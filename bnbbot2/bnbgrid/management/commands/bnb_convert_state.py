@@ -0,0 +1,50 @@
+# bnbgrid/management/commands/bnb_convert_state.py
+# -----------------------------------------------------------------------------
+# Przepisuje levels_data/runtime_data botów do formatu z BNB_STATE_WRITE_VERSION
+# (albo --format-version). Migracja 0012 pomija konwersję, gdy podczas rolling upgrade
+# zapis jest w starym formacie (0) - po aktualizacji wszystkich instancji ustaw
+# BNB_STATE_WRITE_VERSION = 1 i uruchom tę komendę.
+#
+# python manage.py bnb_convert_state --bots 3 7
+# python manage.py bnb_convert_state --all --format-version 1
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bnbgrid.models import BnbBot
+from bnbgrid.state_codec import JSON_VERSION, LEGACY_VERSION, decode_state, encode_state, write_version
+
+
+class Command(BaseCommand):
+    help = 'Rewrite bot levels_data/runtime_data in the given state format version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bots', type=int, nargs='+', help='Bot ids to convert')
+        parser.add_argument('--all', action='store_true', help='Convert every bot')
+        parser.add_argument('--format-version', type=int, choices=[LEGACY_VERSION, JSON_VERSION],
+                            help='Target format (default: BNB_STATE_WRITE_VERSION)')
+
+    def handle(self, *args, **options):
+        if not options['bots'] and not options['all']:
+            raise CommandError('Podaj --bots <id ...> albo --all')
+        version = options['format_version'] if options['format_version'] is not None else write_version()
+
+        bot_ids = BnbBot.objects.order_by('id').values_list('id', flat=True)
+        if options['bots']:
+            bot_ids = bot_ids.filter(id__in=options['bots'])
+
+        converted = 0
+        for bot_id in bot_ids:
+            with transaction.atomic():
+                # Blokujemy wiersz bota, żeby worker nie zapisał w międzyczasie stanu w drugim formacie
+                bot = BnbBot.objects.select_for_update().only('id', 'levels_data', 'runtime_data').get(pk=bot_id)
+                levels_data = encode_state(decode_state(bot.levels_data), version=version)
+                runtime_data = encode_state(decode_state(bot.runtime_data), version=version)
+                if (levels_data, runtime_data) == (bot.levels_data, bot.runtime_data):
+                    continue
+                bot.levels_data, bot.runtime_data = levels_data, runtime_data
+                bot.save(update_fields=['levels_data', 'runtime_data'])
+            converted += 1
+            self.stdout.write(f"Bot {bot_id}: stan zapisany w wersji {version}")
+
+        self.stdout.write(self.style.SUCCESS(f"Przekonwertowano {converted} botów."))
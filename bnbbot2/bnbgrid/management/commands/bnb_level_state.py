@@ -0,0 +1,39 @@
+# bnbgrid/management/commands/bnb_level_state.py
+# -----------------------------------------------------------------------------
+# Przenosi stan poziomów istniejących botów z runtime_data do tabeli BnbLevelState.
+#
+# python manage.py bnb_level_state --bots 3 7
+# python manage.py bnb_level_state --all
+# -----------------------------------------------------------------------------
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bnbgrid.models import BnbBot
+
+
+class Command(BaseCommand):
+    help = 'Move per-level bot state from runtime_data into the BnbLevelState table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bots', type=int, nargs='+', help='Bot ids to convert')
+        parser.add_argument('--all', action='store_true', help='Convert every bot not using the table yet')
+
+    def handle(self, *args, **options):
+        if not options['bots'] and not options['all']:
+            raise CommandError('Podaj --bots <id ...> albo --all')
+
+        bots = BnbBot.objects.filter(use_level_table=False)
+        if options['bots']:
+            bots = bots.filter(id__in=options['bots'])
+
+        converted = 0
+        for bot in bots:
+            with transaction.atomic():
+                # Blokujemy wiersz bota, żeby worker nie zapisał w międzyczasie starego bloba
+                bot = BnbBot.objects.select_for_update().get(pk=bot.pk)
+                bot.enable_level_table()
+                bot.save(update_fields=['use_level_table'])
+            converted += 1
+            self.stdout.write(f"Bot {bot.id}: stan poziomów przeniesiony do BnbLevelState")
+
+        self.stdout.write(self.style.SUCCESS(f"Przeniesiono {converted} botów."))
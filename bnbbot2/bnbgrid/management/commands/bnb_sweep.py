@@ -0,0 +1,89 @@
+# bnbgrid/management/commands/bnb_sweep.py
+# -----------------------------------------------------------------------------
+# Przegląd parametrów siatki: każda kombinacja max_price / percent / decimals /
+# max_levels jest symulowana (bnbgrid.backtest) na tej samej historii cen
+# w puli procesów, a wynik to ranking wg zysku, obsunięcia lub liczby wypełnień.
+#
+# python manage.py bnb_sweep BTCUSDT-1m-2024.csv --capital 1000 \
+#     --max-price 60000:70000:2000 --percent 0.5:3:0.5 --decimals 2 --max-levels 20,30,50
+# python manage.py bnb_sweep --symbol BTCUSDT --start 2024-01-01 --capital 1000 --max-price 70000 --percent 1,2
+# -----------------------------------------------------------------------------
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bnbgrid.backtest import load_price_series, load_store_series
+from bnbgrid.kline_store import KlineStore, parse_time_ms
+from bnbgrid.sweep import SORT_KEYS, build_candidates, parse_range, run_sweep
+from bnbgrid.views import MAX_GRID_LEVELS
+
+
+class Command(BaseCommand):
+    help = 'Simulate a range of grid configurations over a price history and rank them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='Binance CSV with klines or trades')
+        parser.add_argument('--capital', type=float, required=True)
+        parser.add_argument('--max-price', required=True, help='List "a,b,c" or range "start:stop:step"')
+        parser.add_argument('--percent', required=True, help='List "a,b,c" or range "start:stop:step"')
+        parser.add_argument('--decimals', default='3', help='List or range (default: 3)')
+        parser.add_argument('--max-levels', default=str(MAX_GRID_LEVELS),
+                            help=f'List or range of level caps (default: {MAX_GRID_LEVELS})')
+        parser.add_argument('--min-price', type=float, default=None)
+        parser.add_argument('--kind', choices=['klines', 'trades', 'aggtrades'], default='klines')
+        parser.add_argument('--symbol', help='Read klines from the local store (bnb_klines) instead of a file')
+        parser.add_argument('--interval', default='1m')
+        parser.add_argument('--start', help='Store range start (ms or ISO date, UTC)')
+        parser.add_argument('--end', help='Store range end (ms or ISO date, UTC, exclusive)')
+        parser.add_argument('--path', choices=['close', 'ohlc'], default='close')
+        parser.add_argument('--workers', type=int, default=None, help='Processes (default: all cores)')
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='profit')
+        parser.add_argument('--top', type=int, default=20, help='Rows to print (default: 20)')
+
+    def handle(self, *args, **options):
+        try:
+            candidates = build_candidates(
+                parse_range(options['max_price']),
+                parse_range(options['percent']),
+                parse_range(options['decimals'], int),
+                parse_range(options['max_levels'], int),
+            )
+        except ValueError as e:
+            raise CommandError(f'Niepoprawny zakres: {e}')
+
+        prices_file = None
+        if options['symbol']:
+            store = KlineStore()
+            symbol, interval = options['symbol'], options['interval']
+            start_ms, end_ms = parse_time_ms(options['start']), parse_time_ms(options['end'])
+            _, prices = load_store_series(store, symbol, interval, start_ms, end_ms, options['path'])
+            if options['path'] == 'close':
+                # Procesy robocze mapują bezpośrednio kolumnę close z magazynu
+                klines = store.read(symbol, interval, start_ms, end_ms)
+                prices_file = (str(store.column_path(symbol, interval, 'close')), klines.start, klines.stop)
+        elif options['file']:
+            try:
+                _, prices = load_price_series(options['file'], options['kind'], options['path'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Nie udało się wczytać {options["file"]}: {e}')
+        else:
+            raise CommandError('Podaj plik CSV albo --symbol')
+        if not len(prices):
+            raise CommandError('Brak cen w podanym zakresie')
+
+        started = time.perf_counter()
+        rows = run_sweep(prices, candidates, options['capital'], options['min_price'],
+                         options['workers'], options['sort'], prices_file)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{len(candidates)} kandydatów x {len(prices)} cen w {elapsed:.2f}s")
+
+        header = f"{'#':>3} {'max_price':>12} {'percent':>8} {'dec':>3} {'cap':>4} {'lv':>3} " \
+                 f"{'profit':>12} {'realized':>12} {'drawdown':>12} {'buys':>6} {'sells':>6} {'max_cap':>12}"
+        self.stdout.write(header)
+        for rank, row in enumerate(rows[:options['top']], start=1):
+            self.stdout.write(
+                f"{rank:>3} {row['max_price']:>12.8g} {row['percent']:>8.4g} {row['decimals']:>3} "
+                f"{row['max_levels']:>4} {row['levels']:>3} {row['total_profit']:>12.4f} "
+                f"{row['realized_profit']:>12.4f} {row['max_drawdown']:>12.4f} {row['buys']:>6} "
+                f"{row['sells']:>6} {row['max_capital_in_use']:>12.4f}"
+            )
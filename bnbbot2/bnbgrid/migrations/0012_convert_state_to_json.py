@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from bnbgrid.state_codec import LEGACY_VERSION, decode_state, encode_state, write_version
+
+
+def convert_rows(apps, version):
+    BnbBot = apps.get_model('bnbgrid', 'BnbBot')
+    for bot in BnbBot.objects.only('id', 'levels_data', 'runtime_data').iterator():
+        bot.levels_data = encode_state(decode_state(bot.levels_data), version=version)
+        bot.runtime_data = encode_state(decode_state(bot.runtime_data), version=version)
+        bot.save(update_fields=['levels_data', 'runtime_data'])
+
+
+def forwards(apps, schema_editor):
+    # Przy rolling upgrade (BNB_STATE_WRITE_VERSION = 0) stare instancje muszą dalej czytać wiersze -
+    # zostają w starym formacie, a po aktualizacji wszystkich instancji konwertuje je bnb_convert_state
+    if write_version() == LEGACY_VERSION:
+        return
+    convert_rows(apps, write_version())
+
+
+def backwards(apps, schema_editor):
+    convert_rows(apps, LEGACY_VERSION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0011_bnbbot_created_at_bnbbot_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
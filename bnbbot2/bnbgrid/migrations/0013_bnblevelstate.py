@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0012_convert_state_to_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bnbbot',
+            name='use_level_table',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BnbLevelState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=10)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('cap', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('bought', models.BooleanField(default=False)),
+                ('in_progress', models.BooleanField(default=False)),
+                ('buy_price', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('buy_volume', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_states', to='bnbgrid.bnbbot')),
+            ],
+            options={
+                'unique_together': {('bot', 'level')},
+            },
+        ),
+    ]
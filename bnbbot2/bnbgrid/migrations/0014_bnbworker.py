@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0013_bnblevelstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BnbWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker_id', models.CharField(max_length=100, unique=True)),
+                ('heartbeat_at', models.DateTimeField(db_index=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bnbbot',
+            name='worker_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0014_bnbworker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BnbJournalEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=10)),
+                ('side', models.CharField(max_length=4)),
+                ('event', models.CharField(choices=[('INTENT', 'Intent'), ('ACK', 'Ack'), ('FILL', 'Fill'), ('COMMIT', 'Commit'), ('FAILED', 'Failed')], max_length=10)),
+                ('client_order_id', models.CharField(max_length=36)),
+                ('binance_order_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=20, null=True)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='journal', to='bnbgrid.bnbbot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bot', 'client_order_id'], name='bnbgrid_bnb_bot_id_80be37_idx'), models.Index(fields=['bot', 'event'], name='bnbgrid_bnb_bot_id_a360de_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0016_bnblevelstate_cycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bnbbot',
+            name='order_mode',
+            field=models.CharField(choices=[('MARKET', 'Market orders'), ('LIMIT', 'Resting limit orders')], default='MARKET', max_length=10),
+        ),
+    ]
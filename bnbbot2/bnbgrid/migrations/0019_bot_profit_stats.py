@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0018_bnbtrade_level_stats_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BnbBotStats',
+            fields=[
+                ('bot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bnbgrid.bnbbot')),
+                ('total_profit', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('tp_count', models.PositiveIntegerField(default=0)),
+                ('trade_count', models.PositiveIntegerField(default=0)),
+                ('level_stats', models.TextField(default='{}')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BnbBotDailyProfit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('profit', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('tp_count', models.PositiveIntegerField(default=0)),
+                ('trade_count', models.PositiveIntegerField(default=0)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_profits', to='bnbgrid.bnbbot')),
+            ],
+            options={
+                'unique_together': {('bot', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0019_bot_profit_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bnbbot',
+            name='user_id',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='bnbtrade',
+            index=models.Index(fields=['bot', 'created_at'], name='bnbgrid_bnb_bot_id_841817_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0020_profit_period_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bnbbot',
+            name='lease_epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from bnbgrid.stats import rebuild_bot_stats
+
+
+def forwards(apps, schema_editor):
+    # Rollup z 0019 liczy tylko nowe transakcje - uzupełniamy go z istniejącej historii (jak bnb_rebuild_stats)
+    BnbBot = apps.get_model('bnbgrid', 'BnbBot')
+    models = (apps.get_model('bnbgrid', 'BnbBotStats'), apps.get_model('bnbgrid', 'BnbBotDailyProfit'),
+              apps.get_model('bnbgrid', 'BnbTrade'))
+    for bot_id in BnbBot.objects.order_by('id').values_list('id', flat=True).iterator():
+        rebuild_bot_stats(bot_id, models)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bnbgrid', '0021_bot_lease_epoch'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
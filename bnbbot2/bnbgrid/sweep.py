@@ -0,0 +1,106 @@
+# bnbgrid/sweep.py
+
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .backtest import run_backtest
+from .views import generate_levels
+
+SORT_KEYS = {
+    "profit": lambda row: row["total_profit"],
+    "drawdown": lambda row: -row["max_drawdown"],
+    "fills": lambda row: row["sells"],
+    "ratio": lambda row: row["total_profit"] / row["max_drawdown"] if row["max_drawdown"] else row["total_profit"],
+}
+
+# Seria cen otwarta w procesie roboczym (memmap - strony pliku współdzielone przez page cache)
+_prices = None
+
+
+def parse_range(text: str, cast=float) -> list:
+    """
+    "1,2,5" -> [1, 2, 5];  "0.5:2:0.5" -> [0.5, 1.0, 1.5, 2.0] (koniec włącznie).
+    """
+    if ":" not in text:
+        return [cast(v) for v in text.split(",") if v.strip()]
+    start, stop, step = (float(v) for v in text.split(":"))
+    if step <= 0:
+        raise ValueError(f"Krok musi być dodatni: {text}")
+    count = int(round((stop - start) / step)) + 1
+    return [cast(round(start + i * step, 10)) for i in range(max(count, 0))]
+
+
+def build_candidates(max_prices, percents, decimals, max_levels) -> list:
+    return [
+        {"max_price": m, "percent": p, "decimals": d, "max_levels": n}
+        for m, p, d, n in itertools.product(max_prices, percents, decimals, max_levels)
+    ]
+
+
+def _init_worker(prices_path: str, start: int, stop: int):
+    global _prices
+    _prices = np.memmap(prices_path, dtype="<f8", mode="r")[start:stop]
+
+
+def simulate_candidate(candidate: dict, capital: float, min_price=None, prices=None) -> dict:
+    """
+    Jeden kandydat siatki: generate_levels z jego parametrami i backtest na serii cen.
+    """
+    prices = _prices if prices is None else prices
+    levels_data = generate_levels(candidate["max_price"], candidate["percent"], capital, min_price,
+                                  candidate["decimals"], candidate["max_levels"])
+    result = run_backtest(levels_data, prices)
+    row = dict(candidate)
+    row.update(result.summary())
+    row["levels"] = sum(1 for k in levels_data if k.startswith("lv"))
+    row["total_profit"] = result.realized_profit + result.unrealized_profit
+    return row
+
+
+def _simulate(args):
+    return simulate_candidate(*args)
+
+
+def run_sweep(prices, candidates: list, capital: float, min_price=None, workers: int = None,
+              sort: str = "profit", prices_file: tuple = None) -> list:
+    """
+    Symuluje wszystkie kandydaty i zwraca wiersze posortowane od najlepszego.
+
+    Procesy robocze otwierają serię cen jako memmap pliku - nie jest kopiowana do każdego
+    procesu ani przesyłana z każdym zadaniem. prices_file = (ścieżka, start, stop) wskazuje
+    surowy plik float64 z ceną (np. kolumnę close z bnbgrid.kline_store); bez niego seria
+    jest raz zapisywana do pliku tymczasowego. Procesy startują przez fork (już skonfigurowany
+    Django, bez ponownego ready() i wątku worker-a); gdzie fork jest niedostępny, kandydaty
+    liczone są w bieżącym procesie.
+    """
+    if not candidates:
+        return []
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        rows = [simulate_candidate(c, capital, min_price, prices) for c in candidates]
+    else:
+        tmp_dir = None
+        try:
+            if prices_file is None:
+                tmp_dir = tempfile.mkdtemp(prefix="bnb_sweep_")
+                prices_path = os.path.join(tmp_dir, "prices.bin")
+                np.asarray(prices, dtype="<f8").tofile(prices_path)
+                prices_file = (prices_path, 0, len(prices))
+            with ProcessPoolExecutor(max_workers=min(workers, len(candidates)),
+                                     mp_context=multiprocessing.get_context("fork"),
+                                     initializer=_init_worker, initargs=prices_file) as pool:
+                chunksize = max(1, len(candidates) // (workers * 4))
+                rows = list(pool.map(_simulate, [(c, capital, min_price) for c in candidates], chunksize=chunksize))
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    rows.sort(key=SORT_KEYS[sort], reverse=True)
+    return rows
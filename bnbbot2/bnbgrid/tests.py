@@ -1,3 +1,1644 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import numpy as np
+import websockets
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from binance.exceptions import BinanceAPIException
+from binance_common.client_pool import ClientPool
+from binance_common.exchange_info import exchange_info_cache
+from binance_common.rate_limit import (PRIORITY_ORDER, PRIORITY_PRICE, PRIORITY_SYNC, GovernedClient,
+                                       LocalBucketStore, RateGovernor, RateLimitExceeded, rate_priority, request_cost)
+
+from .models import (BnbBot, BnbBotDailyProfit, BnbBotStats, BnbJournalEvent, BnbLevelState, BnbTrade, BnbWorker,
+                     UserProfile)
+from . import bnb_logic
+from .bnb_logic import run_worker_cycle
+from . import bnb_manager
+from .apps import should_autostart
+from .backtest import load_price_series, run_backtest
+from .bnb_manager import fetch_symbol_prices, place_market_order, run_grid_bot
+from .grid_levels import GridLevels
+from .kline_store import KlineStore, download_klines
+from . import export as bnb_export
+from . import journal
+from . import metrics
+from . import views
+from .metrics import TickTimer, span
+from .price_stream import PriceStream
+from .scheduler import CadenceScheduler
+from .sharding import LeaseLost, ShardCoordinator
+from .stats import rebuild_bot_stats
+from .sweep import build_candidates, parse_range, run_sweep
+from .state_codec import JSON_VERSION, LEGACY_VERSION, decode_state, encode_state
+from .user_stream import UserDataStream, execution_report_order
+from .write_buffer import CycleWriteBuffer, WriteBuffer
+
+
+class FakeTickerClient:
+    """
+    Minimalny klient udający python-binance: zlicza zapytania o ticker.
+    """
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def get_symbol_ticker(self, **params):
+        self.calls.append(params)
+        if "symbol" in params:
+            return {"symbol": params["symbol"], "price": self.prices[params["symbol"]]}
+        return [{"symbol": s, "price": p} for s, p in self.prices.items()]
+
+
+def api_error(message="Invalid symbol.", code=-1121):
+    response = mock.Mock(status_code=400, text=json.dumps({"code": code, "msg": message}))
+    return BinanceAPIException(response, 400, response.text)
+
+
+class FakeExchangeClient(FakeTickerClient):
+    """
+    Klient giełdy wykonujący zlecenia MARKET po bieżącej cenie z self.prices.
+    """
+
+    def __init__(self, prices):
+        super().__init__(prices)
+        self.orders = []
+        self.fail = False
+        self.lose_response = False  # zlecenie wykonane, ale odpowiedź nie dociera (np. timeout)
+        self.exchange_info_calls = 0
+        self.by_client_id = {}
+        self.all_orders_calls = []
+
+    def get_exchange_info(self):
+        self.exchange_info_calls += 1
+        return {"symbols": [{
+            "symbol": "BTCUSDT", "status": "TRADING", "baseAsset": "BTC", "quoteAsset": "USDT",
+            "quoteAssetPrecision": 8,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000", "tickSize": "0.01"},
+                {"filterType": "LOT_SIZE", "minQty": "0.001", "maxQty": "9000", "stepSize": "0.001"},
+                {"filterType": "NOTIONAL", "minNotional": "5.00", "maxNotional": "9000000"},
+            ],
+        }]}
+
+    def create_order(self, **params):
+        if self.fail:
+            raise api_error("Timeout")
+        self.orders.append(params)
+        if params["type"] == "LIMIT":
+            order = {"orderId": len(self.orders), "clientOrderId": params["newClientOrderId"], "status": "NEW",
+                     "side": params["side"], "price": params["price"], "origQty": params["quantity"],
+                     "executedQty": "0", "cummulativeQuoteQty": "0"}
+            self.by_client_id[order["clientOrderId"]] = order
+            return dict(order)
+        price = Decimal(self.prices[params["symbol"]])
+        if "quoteOrderQty" in params:
+            qty = (Decimal(params["quoteOrderQty"]) / price).quantize(Decimal("0.001"))
+        else:
+            qty = Decimal(params["quantity"])
+        order = {"orderId": len(self.orders), "fills": [{"price": str(price), "qty": str(qty)}]}
+        if "newClientOrderId" in params:
+            self.by_client_id[params["newClientOrderId"]] = {
+                "orderId": order["orderId"], "clientOrderId": params["newClientOrderId"],
+                "status": "FILLED", "executedQty": str(qty),
+                "cummulativeQuoteQty": str(price * qty),
+            }
+        if self.lose_response:
+            raise api_error("Timeout", code=-1007)
+        return order
+
+    def get_order(self, symbol, origClientOrderId):
+        if origClientOrderId not in self.by_client_id:
+            raise api_error("Order does not exist.", code=-2013)
+        return self.by_client_id[origClientOrderId]
+
+    def get_all_orders(self, **params):
+        self.all_orders_calls.append(params)
+        return list(self.by_client_id.values())
+
+    def cancel_order(self, symbol, origClientOrderId):
+        self.by_client_id[origClientOrderId]["status"] = "CANCELED"
+
+    def fill(self, client_order_id):
+        """
+        Wypełnia czekające zlecenie LIMIT i zwraca zdarzenie executionReport ze strumienia użytkownika.
+        """
+        order = self.by_client_id[client_order_id]
+        order["status"] = "FILLED"
+        order["executedQty"] = order["origQty"]
+        order["cummulativeQuoteQty"] = str(Decimal(order["origQty"]) * Decimal(order["price"]))
+        return {"e": "executionReport", "s": "BTCUSDT", "c": client_order_id, "S": order["side"],
+                "i": order["orderId"], "X": "FILLED", "z": order["executedQty"], "Z": order["cummulativeQuoteQty"]}
+
+
+def make_bot(symbol="BTCUSDT", **kwargs):
+    bot = BnbBot.objects.create(
+        user_id=1,
+        name="TestBot",
+        symbol=symbol,
+        max_price=Decimal("100"),
+        percent=Decimal("2"),
+        capital=Decimal("100"),
+        status=kwargs.pop("status", "RUNNING"),
+        **kwargs
+    )
+    bot.save_levels_data({"lv1": 100.0, "lv2": 98.0, "caps": {"lv1": 50.0, "lv2": 50.0}, "sell_levels": {"lv2": "lv1"}})
+    bot.save_runtime_data({
+        "flags": {"lv1_bought": False, "lv1_in_progress": False, "lv2_bought": False, "lv2_in_progress": False},
+        "buy_price": {"lv1": 0.0, "lv2": 0.0},
+        "buy_volume": {"lv1": 0.0, "lv2": 0.0},
+    })
+    bot.save()
+    return bot
+
+
+class PriceSnapshotTests(TestCase):
+
+    def test_fetch_symbol_prices_uses_one_bulk_call(self):
+        client = FakeTickerClient({"BTCUSDT": "101.5", "BNBUSDT": "600"})
+        prices = fetch_symbol_prices(client, ["BTCUSDT", "BNBUSDT", "BTCUSDT"])
+
+        self.assertEqual(prices, {"BTCUSDT": Decimal("101.5"), "BNBUSDT": Decimal("600")})
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(client.calls[0], {"symbols": '["BNBUSDT","BTCUSDT"]'})
+
+    def test_fetch_symbol_prices_falls_back_to_single_calls(self):
+        client = FakeTickerClient({"BTCUSDT": "101.5"})
+        error = api_error()
+
+        def ticker(**params):
+            if "symbols" in params or params.get("symbol") == "FOOUSDT":
+                raise error
+            return {"symbol": params["symbol"], "price": "101.5"}
+
+        client.get_symbol_ticker = ticker
+        prices = fetch_symbol_prices(client, ["BTCUSDT", "FOOUSDT"])
+
+        self.assertEqual(prices, {"BTCUSDT": Decimal("101.5")})
+
+    def test_worker_cycle_fetches_each_symbol_once(self):
+        for _ in range(3):
+            make_bot("BTCUSDT")
+        make_bot("BNBUSDT")
+        client = FakeTickerClient({"BTCUSDT": "99", "BNBUSDT": "99"})
+
+        with mock.patch("bnbgrid.bnb_logic.price_stream", None), \
+                mock.patch("bnbgrid.bnb_logic.scheduler", None), \
+                mock.patch("bnbgrid.bnb_logic.get_binance_client", return_value=client), \
+                mock.patch("bnbgrid.bnb_logic.run_grid_bot") as run_grid_bot:
+            run_worker_cycle()
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(run_grid_bot.call_count, 4)
+        for call in run_grid_bot.call_args_list:
+            self.assertEqual(call.kwargs["current_price"], Decimal("99"))
+
+
+class WorkerAutostartTests(SimpleTestCase):
+
+    OFFLINE_COMMANDS = (["bnb_backtest", "--help"], ["bnb_sweep", "--help"], ["bnb_klines", "--help"],
+                        ["bnb_rebuild_stats", "--help"], ["migrate"], ["run_bnb_worker"])
+
+    def test_offline_commands_do_not_start_worker(self):
+        # Proces testów (manage.py test) też nie wystartował worker-a
+        self.assertIsNone(bnb_logic._worker_thread)
+        for command in self.OFFLINE_COMMANDS:
+            self.assertFalse(should_autostart(["manage.py"] + command), command)
+
+        with mock.patch("bnbgrid.bnb_logic.start_bnb_worker") as start, \
+                mock.patch.object(sys, "argv", ["manage.py", "bnb_backtest", "--help"]):
+            apps.get_app_config("bnbgrid").ready()
+        start.assert_not_called()
+
+        self.assertTrue(should_autostart(["manage.py", "runserver"]))
+        self.assertTrue(should_autostart(["/usr/bin/gunicorn", "bnbbot1.wsgi"]))
+        with override_settings(BNB_WORKER_AUTOSTART=False):
+            self.assertFalse(should_autostart(["manage.py", "runserver"]))
+
+    def test_offline_command_process_has_no_worker(self):
+        result = subprocess.run([sys.executable, "manage.py", "bnb_backtest", "--help"], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn("start_bnb_worker", result.stdout)
+        self.assertNotIn("price_stream", result.stdout)
+
+
+class WorkerPoolTests(TestCase):
+
+    def setUp(self):
+        self.slow = make_bot("BTCUSDT")
+        self.fast = make_bot("BNBUSDT")
+        self.client = FakeTickerClient({"BTCUSDT": "99", "BNBUSDT": "99"})
+        self.release = threading.Event()
+        self.calls = []
+
+        def fake_run_grid_bot(bot_id, **kwargs):
+            self.calls.append(bot_id)
+            if bot_id == self.slow.id:
+                self.release.wait(5)
+
+        for patcher in (
+            mock.patch("bnbgrid.bnb_logic.price_stream", None),
+            mock.patch("bnbgrid.bnb_logic.scheduler", None),
+            mock.patch("bnbgrid.bnb_logic.get_binance_client", return_value=self.client),
+            mock.patch("bnbgrid.bnb_logic.run_grid_bot", side_effect=fake_run_grid_bot),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    @override_settings(BNB_BOT_DEADLINE=0.2)
+    def test_stuck_bot_does_not_hold_cycle_or_overlap(self):
+        started = time.monotonic()
+        run_worker_cycle()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertIn(self.fast.id, self.calls)
+
+        # Drugi cykl: wolny bot wciąż trwa, więc nie jest uruchamiany ponownie
+        run_worker_cycle()
+        self.assertEqual(self.calls.count(self.slow.id), 1)
+        self.assertEqual(self.calls.count(self.fast.id), 2)
+
+        self.release.set()
+        self.assertTrue(wait_for(lambda: self.slow.id not in bnb_logic._busy_bots))
+
+
+class TickMetricsTests(TestCase):
+
+    def setUp(self):
+        self.bot = make_bot("BTCUSDT")
+        metrics.forget_bot(self.bot.id)
+        self.addCleanup(metrics.forget_bot, self.bot.id)
+
+        def fake_run_grid_bot(bot_id, **kwargs):
+            with span("order"):
+                time.sleep(0.01)
+
+        for patcher in (
+            mock.patch("bnbgrid.bnb_logic.price_stream", None),
+            mock.patch("bnbgrid.bnb_logic.scheduler", None),
+            mock.patch("bnbgrid.bnb_logic.get_binance_client", return_value=FakeTickerClient({"BTCUSDT": "99"})),
+            mock.patch("bnbgrid.bnb_logic.run_grid_bot", side_effect=fake_run_grid_bot),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sample(self, name, phase=None):
+        from prometheus_client import REGISTRY
+        labels = {"bot": str(self.bot.id), "symbol": "BTCUSDT"}
+        if phase:
+            labels["phase"] = phase
+        return REGISTRY.get_sample_value(name, labels)
+
+    @unittest.skipIf(metrics.Histogram is None, "prometheus_client not installed")
+    def test_worker_cycle_records_tick_and_phases(self):
+        run_worker_cycle()
+
+        self.assertEqual(self.sample("bnb_tick_seconds_count"), 1)
+        for phase in ("price_fetch", "order", "db_write"):
+            self.assertEqual(self.sample("bnb_tick_phase_seconds_count", phase), 1, phase)
+        order_time = self.sample("bnb_tick_phase_seconds_sum", "order")
+        self.assertGreaterEqual(order_time, 0.01)
+        self.assertGreaterEqual(self.sample("bnb_tick_seconds_sum"), order_time)
+
+    def test_slow_tick_is_logged(self):
+        with override_settings(BNB_SLOW_TICK_SECONDS=0), mock.patch("builtins.print") as printed:
+            run_worker_cycle()
+        logged = [call.args[0] for call in printed.call_args_list if "wolny tick" in call.args[0]]
+        self.assertEqual(len(logged), 1)
+        self.assertIn("order=", logged[0])
+
+    @unittest.skipIf(metrics.Histogram is None, "prometheus_client not installed")
+    def test_metrics_endpoint_is_local_only(self):
+        timer = TickTimer(self.bot.id, "BTCUSDT")
+        timer.add("order", 0.02)
+        timer.finish()
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(f'bnb_tick_seconds_count{{bot="{self.bot.id}",symbol="BTCUSDT"}} 1.0', body)
+        self.assertIn(f'bnb_tick_phase_seconds_bucket{{bot="{self.bot.id}",le="0.025",phase="order",symbol="BTCUSDT"}} 1.0',
+                      body)
+
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.7").status_code, 403)
+
+        metrics.forget_bot(self.bot.id)
+        self.assertNotIn(f'bot="{self.bot.id}"', self.client.get("/metrics").content.decode())
+
+
+class ShardingTests(TestCase):
+
+    def setUp(self):
+        self.bots = [make_bot("BTCUSDT") for _ in range(5)]
+        self.a = ShardCoordinator("worker-a")
+        self.b = ShardCoordinator("worker-b")
+
+    def test_workers_split_bots_disjointly_and_take_over_dead_worker(self):
+        self.assertEqual(len(self.a.rebalance()), 5)
+
+        # Nowy worker: A oddaje nadmiar, B go przejmuje
+        self.assertEqual(self.b.rebalance(), set())
+        owned_a = self.a.rebalance()
+        owned_b = self.b.rebalance()
+        self.assertEqual((len(owned_a), len(owned_b)), (3, 2))
+        self.assertFalse(owned_a & owned_b)
+
+        # A przestaje wysyłać heartbeat - B przejmuje jego boty
+        BnbWorker.objects.filter(worker_id="worker-a").update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(len(self.b.rebalance()), 5)
+        self.assertFalse(BnbWorker.objects.filter(worker_id="worker-a").exists())
+
+    def test_busy_bots_are_not_released(self):
+        owned = self.a.rebalance()
+        self.b.rebalance()
+        self.assertEqual(self.a.rebalance(busy=owned), owned)
+
+    def test_run_grid_bot_skips_bot_owned_by_other_worker(self):
+        self.b.rebalance()
+        with mock.patch("bnbgrid.bnb_manager.get_binance_client") as get_client:
+            run_grid_bot(self.bots[0].id, current_price=Decimal("99"), worker_id="worker-a")
+        get_client.assert_not_called()
+
+    def run_after_stall(self, stall):
+        """
+        Tick worker-a, który między wczytaniem bota a złożeniem zleceń "zawiesza się" na czas `stall()`.
+        """
+        for state in (bnb_manager._grid_cache, bnb_manager._last_prices, bnb_manager._retry_levels,
+                      bnb_manager._recovered_bots, bnb_manager._pending_bots):
+            state.clear()
+        exchange_info_cache.clear()
+        self.a.rebalance()
+        client = FakeExchangeClient({"BTCUSDT": "99"})
+
+        def stalled_client(bot):
+            stall()
+            return client
+
+        with mock.patch("bnbgrid.bnb_manager.get_binance_client", side_effect=stalled_client):
+            run_grid_bot(self.bots[0].id, current_price=Decimal("99"), worker_id="worker-a")
+        return client
+
+    def test_orders_sent_while_lease_is_held(self):
+        client = self.run_after_stall(lambda: None)
+        self.assertEqual(len(client.orders), 1)
+
+    def test_no_orders_after_bot_taken_over(self):
+        def takeover():
+            BnbWorker.objects.filter(worker_id="worker-a").update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+            self.b.rebalance()
+
+        with self.assertRaises(LeaseLost):
+            self.run_after_stall(takeover)
+        self.assertEqual(BnbBot.objects.get(id=self.bots[0].id).worker_id, "worker-b")
+        self.assertFalse(BnbJournalEvent.objects.filter(bot_id=self.bots[0].id).exists())
+
+    def test_no_orders_after_heartbeat_expired(self):
+        # Nikt jeszcze nie przejął bota, ale dzierżawa wygasła według zegara bazy
+        def expire():
+            BnbWorker.objects.filter(worker_id="worker-a").update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+
+        with self.assertRaises(LeaseLost):
+            self.run_after_stall(expire)
+        self.assertFalse(BnbJournalEvent.objects.filter(bot_id=self.bots[0].id).exists())
+
+    def test_worker_loop_survives_cycle_error(self):
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(bnb_logic, "run_worker_cycle", side_effect=[RuntimeError("db down"), None]) as cycle, \
+                mock.patch.object(bnb_logic, "next_cycle_delay", return_value=0), \
+                mock.patch.object(bnb_logic.time, "sleep", side_effect=[None, Stop()]):
+            with self.assertRaises(Stop):
+                bnb_logic.worker_loop()
+        self.assertEqual(cycle.call_count, 2)
+
+
+class CadenceSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.scheduler = CadenceScheduler(min_interval=0.5, max_interval=300, default_volatility=0.0002)
+
+    def test_interval_grows_with_distance_to_band(self):
+        near = self.scheduler.schedule(1, "BTCUSDT", Decimal("100"), (Decimal("99.99"), Decimal("110"), False), 0)
+        mid = self.scheduler.schedule(2, "BTCUSDT", Decimal("100"), (Decimal("99.9"), Decimal("110"), False), 0)
+        far = self.scheduler.schedule(3, "BTCUSDT", Decimal("100"), (Decimal("70"), Decimal("130"), False), 0)
+        urgent = self.scheduler.schedule(4, "BTCUSDT", Decimal("100"), (Decimal("70"), Decimal("130"), True), 0)
+
+        self.assertEqual(near, 0.5)
+        self.assertAlmostEqual(mid, 6.25)
+        self.assertEqual(far, 300)
+        self.assertEqual(urgent, 0.5)
+        self.assertEqual(self.scheduler.next_due(), 0.5)
+        self.assertEqual(self.scheduler.pop_due(10), {1, 2, 4})
+        self.assertFalse(self.scheduler.is_due(3))
+
+    def test_volatility_shortens_interval(self):
+        band = (Decimal("99"), Decimal("110"), False)
+        calm = self.scheduler.schedule(1, "BTCUSDT", Decimal("100"), band, 0)
+        for i, price in enumerate([100, 100.5, 99.8, 100.4, 99.6]):
+            self.scheduler.observe_price("BTCUSDT", price, i * 10.0)
+        busy = self.scheduler.schedule(1, "BTCUSDT", Decimal("100"), band, 0)
+
+        self.assertGreater(self.scheduler.volatility("BTCUSDT"), 0.0002)
+        self.assertLess(busy, calm)
+
+    def test_price_outside_band_is_due_immediately(self):
+        self.assertTrue(self.scheduler.is_due(7))  # nowy bot
+        self.scheduler.schedule(7, "BTCUSDT", Decimal("100"), (Decimal("98"), Decimal("102"), False), 0)
+        self.assertFalse(self.scheduler.is_due(7, Decimal("99")))
+        self.assertTrue(self.scheduler.is_due(7, Decimal("97.9")))
+        self.assertTrue(self.scheduler.is_due(7, Decimal("102")))
+
+        self.scheduler.retain([])
+        self.assertIsNone(self.scheduler.next_due())
+
+    def test_worker_fetches_prices_only_for_due_bots(self):
+        bot = make_bot("BTCUSDT")
+        client = FakeTickerClient({"BTCUSDT": "99"})
+        band = (Decimal("90"), Decimal("110"), False)
+
+        with mock.patch("bnbgrid.bnb_logic.price_stream", None), \
+                mock.patch("bnbgrid.bnb_logic.scheduler", self.scheduler), \
+                mock.patch("bnbgrid.bnb_logic.needs_recovery", return_value=False), \
+                mock.patch("bnbgrid.bnb_logic.get_trigger_band", return_value=band), \
+                mock.patch("bnbgrid.bnb_logic.get_binance_client", return_value=client), \
+                mock.patch("bnbgrid.bnb_logic.run_grid_bot") as run_grid_bot:
+            run_worker_cycle()
+            run_worker_cycle()
+            self.assertLess(bnb_logic.next_cycle_delay(), bnb_logic.CHECK_INTERVAL + 0.001)
+
+        self.assertEqual(run_grid_bot.call_count, 1)
+        self.assertEqual(len(client.calls), 1)
+        self.assertGreater(self.scheduler.next_due(), time.monotonic() + 60)
+        self.assertFalse(self.scheduler.is_due(bot.id))
+
+
+class StateCodecTests(SimpleTestCase):
+
+    def setUp(self):
+        self.data = {"flags": {"lv1_bought": True}, "buy_price": {"lv1": Decimal("101.25")}, "buy_volume": {"lv1": 0.5}}
+
+    def test_round_trip_is_json_and_decimal_safe(self):
+        encoded = encode_state(self.data)
+        self.assertTrue(encoded.startswith('{"v":1,'))
+        self.assertEqual(decode_state(encoded), {
+            "flags": {"lv1_bought": True}, "buy_price": {"lv1": "101.25"}, "buy_volume": {"lv1": 0.5},
+        })
+
+    def test_reads_legacy_rows_without_eval(self):
+        legacy = encode_state(self.data, version=LEGACY_VERSION)
+        self.assertIn("Decimal('101.25')", legacy)
+        self.assertEqual(decode_state(legacy)["buy_price"], {"lv1": "101.25"})
+        self.assertEqual(decode_state(""), {})
+        self.assertEqual(decode_state("{}"), {})
+
+    def test_rejects_code_in_legacy_rows(self):
+        with self.assertRaises(ValueError):
+            decode_state("{'lv1': __import__('os').getcwd()}")
+
+    def test_legacy_write_version_for_rolling_upgrade(self):
+        with self.settings(BNB_STATE_WRITE_VERSION=LEGACY_VERSION):
+            self.assertEqual(encode_state({"lv1": 1.5}), "{'lv1': 1.5}")
+
+
+class StateConversionTests(TestCase):
+
+    def setUp(self):
+        self.bot = make_bot("BTCUSDT")
+        levels_data, runtime_data = self.bot.get_state()
+        BnbBot.objects.filter(pk=self.bot.pk).update(levels_data=encode_state(levels_data, version=LEGACY_VERSION),
+                                                     runtime_data=encode_state(runtime_data, version=LEGACY_VERSION))
+        self.state = (levels_data, runtime_data)
+        self.migration = importlib.import_module("bnbgrid.migrations.0012_convert_state_to_json")
+
+    def stored(self):
+        return BnbBot.objects.values_list("levels_data", "runtime_data").get(pk=self.bot.pk)
+
+    def test_migration_keeps_legacy_rows_during_rolling_upgrade(self):
+        legacy = self.stored()
+        with self.settings(BNB_STATE_WRITE_VERSION=LEGACY_VERSION):
+            self.migration.forwards(apps, None)
+        self.assertEqual(self.stored(), legacy)
+
+        with self.settings(BNB_STATE_WRITE_VERSION=JSON_VERSION):
+            self.migration.forwards(apps, None)
+        self.assertTrue(all(blob.startswith('{"v":1,') for blob in self.stored()))
+        self.assertEqual(tuple(decode_state(blob) for blob in self.stored()), self.state)
+
+    def test_command_converts_to_write_version(self):
+        out = StringIO()
+        with self.settings(BNB_STATE_WRITE_VERSION=JSON_VERSION):
+            call_command("bnb_convert_state", "--all", stdout=out)
+            call_command("bnb_convert_state", "--all", stdout=out)
+        self.assertTrue(all(blob.startswith('{"v":1,') for blob in self.stored()))
+        self.assertEqual(out.getvalue().count(f"Bot {self.bot.id}:"), 1)
+
+        call_command("bnb_convert_state", "--bots", str(self.bot.id), "--format-version", "0", stdout=out)
+        self.assertEqual(self.stored()[1], encode_state(self.state[1], version=LEGACY_VERSION))
+
+
+class GridLevelsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.grid = GridLevels({
+            "lv1": 100.0, "lv2": 98.0, "lv3": 96.0,
+            "caps": {}, "sell_levels": {"lv2": "lv1", "lv3": "lv2"},
+        })
+
+    def test_first_tick_checks_every_reached_threshold(self):
+        self.assertEqual(self.grid.crossed(None, Decimal("97")), ["lv1", "lv2"])
+        self.assertEqual(self.grid.sell_crossed(None, Decimal("99")), ["lv3"])
+
+    def test_only_crossed_thresholds_are_returned(self):
+        self.assertEqual(self.grid.buy_crossed(Decimal("97"), Decimal("95")), ["lv3"])
+        self.assertEqual(self.grid.sell_crossed(Decimal("95"), Decimal("98.5")), ["lv3"])
+        self.assertEqual(self.grid.crossed(Decimal("97"), Decimal("97.5")), [])
+        # Cena równa progowi: kupno wymaga ceny poniżej, sprzedaż wystarcza równa
+        self.assertEqual(self.grid.crossed(Decimal("99"), Decimal("98")), [])
+        self.assertEqual(self.grid.sell_crossed(Decimal("99"), Decimal("100")), ["lv2"])
+
+    def test_trigger_band_follows_level_state(self):
+        flags = {"lv1_bought": True, "lv2_bought": False, "lv3_bought": False}
+        # lv1 kupiony bez sell_levels: górą tylko zamknięcie (110% lv1), dołem kupno lv2
+        self.assertEqual(self.grid.trigger_band(Decimal("99"), flags), (Decimal("98"), Decimal("110.0")))
+
+        flags = {"lv1_bought": True, "lv2_bought": True, "lv3_bought": False}
+        self.assertEqual(self.grid.trigger_band(Decimal("97"), flags), (Decimal("96"), Decimal("100")))
+        flags["lv3_in_progress"] = True
+        self.assertEqual(self.grid.trigger_band(Decimal("97"), flags), (None, Decimal("100")))
+
+
+class ExchangeInfoTests(SimpleTestCase):
+
+    def setUp(self):
+        exchange_info_cache.clear()
+        self.client = FakeExchangeClient({"BTCUSDT": "99"})
+
+    def test_filters_are_fetched_once_per_ttl(self):
+        place_market_order(self.client, "BTCUSDT", "SELL", Decimal("0.51789"), Decimal("99"))
+        place_market_order(self.client, "BTCUSDT", "BUY", Decimal("50.123456789"))
+        self.assertEqual(self.client.exchange_info_calls, 1)
+        self.assertEqual(self.client.orders[0]["quantity"], "0.517")
+        self.assertEqual(self.client.orders[1]["quoteOrderQty"], "50.12345678")
+
+    def test_undersized_sell_is_not_sent(self):
+        self.assertEqual(place_market_order(self.client, "BTCUSDT", "SELL", Decimal("0.0009"), Decimal("99")), {})
+        self.assertEqual(place_market_order(self.client, "BTCUSDT", "SELL", Decimal("0.04"), Decimal("99")), {})
+        self.assertEqual(self.client.orders, [])
+
+    def test_falls_back_to_fixed_steps_without_filters(self):
+        self.client.get_exchange_info = mock.Mock(side_effect=api_error("Timeout"))
+        place_market_order(self.client, "BTCUSDT", "SELL", Decimal("0.51789"), Decimal("99"))
+        place_market_order(self.client, "BTCUSDT", "SELL", Decimal("0.51789"), Decimal("99"))
+        self.assertEqual(self.client.orders[0]["quantity"], "0.5")
+        self.assertEqual(self.client.get_exchange_info.call_count, 1)  # bez ponawiania przy każdym zleceniu
+
+
+class ClientPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.built = []
+        self.decrypt = mock.Mock(return_value="secret")
+
+        def factory(api_key, api_secret, requests_params):
+            self.built.append((api_key, api_secret))
+            return mock.Mock(name=api_key)
+
+        self.pool = ClientPool(max_size=2, ttl=60, client_factory=factory)
+
+    def test_client_is_reused_and_secret_decrypted_once(self):
+        first = self.pool.get("key1", b"enc1", self.decrypt)
+        self.assertIs(self.pool.get("key1", b"enc1", self.decrypt), first)
+        self.assertEqual(self.decrypt.call_count, 1)
+        self.assertEqual(len(self.built), 1)
+
+    def test_rotated_secret_rebuilds_client(self):
+        first = self.pool.get("key1", b"enc1", self.decrypt)
+        self.assertIsNot(self.pool.get("key1", b"enc2", self.decrypt), first)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_least_recently_used_client_is_evicted(self):
+        first = self.pool.get("key1", b"enc", self.decrypt)
+        self.pool.get("key2", b"enc", self.decrypt)
+        self.pool.get("key1", b"enc", self.decrypt)
+        self.pool.get("key3", b"enc", self.decrypt)
+        self.assertEqual(len(self.pool), 2)
+        self.assertIs(self.pool.get("key1", b"enc", self.decrypt), first)
+        self.assertEqual([key for key, _ in self.built], ["key1", "key2", "key3"])
+
+    def test_credentials_expire_after_ttl(self):
+        self.pool.get("key1", b"enc", self.decrypt)
+        with mock.patch("binance_common.client_pool.time.monotonic", return_value=time.monotonic() + 61):
+            self.pool.get("key1", b"enc", self.decrypt)
+        self.assertEqual(self.decrypt.call_count, 2)
+
+    def test_pooled_client_serves_parallel_threads(self):
+        pool = ClientPool(ttl=60, client_factory=lambda key, secret, params: GovernedClient(key, secret, ping=False))
+        client = pool.get("key1", b"enc", self.decrypt)
+        btc_received = threading.Event()
+        eth_done = threading.Event()
+        responses = {}
+        for symbol, price in (("BTCUSDT", "100"), ("ETHUSDT", "5")):
+            response = mock.Mock(status_code=200, headers={}, text="{}")
+            response.json.return_value = {"symbol": symbol, "price": price}
+            responses[symbol] = response
+
+        def send(uri, headers=None, data=None, params=None, **kwargs):
+            symbol = params.split("=")[1]
+            if symbol == "ETHUSDT":
+                btc_received.wait(5)  # ETH dostaje odpowiedź, gdy BTC jest w trakcie obsługi swojej
+            return responses[symbol]
+
+        def observe(response, api_key):
+            if response is responses["BTCUSDT"]:
+                btc_received.set()
+                eth_done.wait(5)  # BTC kończy dopiero po zakończeniu ETH na tym samym kliencie
+
+        client.session = mock.Mock(get=mock.Mock(side_effect=send))
+        prices = {}
+
+        def fetch(symbol):
+            prices[symbol] = pool.get("key1", b"enc", self.decrypt).get_symbol_ticker(symbol=symbol)["price"]
+            if symbol == "ETHUSDT":
+                eth_done.set()
+
+        with mock.patch("binance_common.rate_limit.governor") as governor:
+            governor.observe.side_effect = observe
+            threads = [threading.Thread(target=fetch, args=(symbol,)) for symbol in ("BTCUSDT", "ETHUSDT")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(prices, {"BTCUSDT": "100", "ETHUSDT": "5"})
+        self.assertEqual(self.decrypt.call_count, 1)
+
+
+class RunGridBotTests(TestCase):
+
+    def setUp(self):
+        for state in (bnb_manager._grid_cache, bnb_manager._last_prices, bnb_manager._retry_levels,
+                      bnb_manager._recovered_bots, bnb_manager._pending_bots):
+            state.clear()
+        exchange_info_cache.clear()
+        self.bot = make_bot("BTCUSDT")
+        self.client = FakeExchangeClient({"BTCUSDT": "99"})
+        patcher = mock.patch("bnbgrid.bnb_manager.get_binance_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tick(self, price):
+        self.client.prices["BTCUSDT"] = price
+        run_grid_bot(self.bot.id, current_price=Decimal(price))
+        self.bot.refresh_from_db()
+        return self.bot.get_state()[1]
+
+    def test_buys_and_sells_on_crossed_levels(self):
+        runtime = self.tick("99")
+        self.assertTrue(runtime["flags"]["lv1_bought"])
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+
+        self.tick("99.5")
+        self.assertEqual(len(self.client.orders), 1)
+
+        runtime = self.tick("97")
+        self.assertTrue(runtime["flags"]["lv2_bought"])
+
+        runtime = self.tick("100")
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+        self.assertEqual([o["side"] for o in self.client.orders], ["BUY", "BUY", "SELL"])
+        self.assertEqual(self.bot.trades.filter(side="SELL", level="lv2").count(), 1)
+
+    def test_sell_updates_profit_rollup(self):
+        self.tick("99")
+        self.tick("97")
+        self.tick("100")
+
+        sell = self.bot.trades.get(side="SELL")
+        stats = BnbBotStats.objects.get(bot=self.bot)
+        self.assertEqual((stats.trade_count, stats.tp_count, stats.total_profit), (3, 1, sell.profit))
+        self.assertEqual(stats.get_level_stats(), {"lv2": (1, sell.profit)})
+        bucket = BnbBotDailyProfit.objects.get(bot=self.bot)
+        self.assertEqual((bucket.date, bucket.profit, bucket.tp_count, bucket.trade_count),
+                         (sell.created_at.date(), sell.profit, 1, 3))
+
+        # Odbudowa z historii daje ten sam rollup
+        rebuilt = rebuild_bot_stats(self.bot.id)
+        self.assertEqual((rebuilt.trade_count, rebuilt.tp_count, rebuilt.total_profit), (3, 1, sell.profit))
+        self.assertEqual(rebuilt.get_level_stats(), stats.get_level_stats())
+        self.assertEqual(BnbBotDailyProfit.objects.get(bot=self.bot).profit, sell.profit)
+
+    def test_failed_order_is_retried_without_new_crossing(self):
+        self.tick("99")
+        self.client.fail = True
+        runtime = self.tick("97")
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+
+        self.client.fail = False
+        runtime = self.tick("97.5")
+        self.assertTrue(runtime["flags"]["lv2_bought"])
+
+
+    def test_journal_records_intent_and_commit(self):
+        self.tick("99")
+        events = list(BnbJournalEvent.objects.filter(bot=self.bot).order_by("id").values_list("event", flat=True))
+        self.assertEqual(events, ["INTENT", "ACK", "FILL", "COMMIT"])
+        intent = BnbJournalEvent.objects.get(bot=self.bot, event="INTENT")
+        self.assertEqual(self.client.orders[0]["newClientOrderId"], intent.client_order_id)
+
+    def test_client_order_ids_are_namespaced_per_service(self):
+        with override_settings(BNB_CLIENT_ORDER_PREFIX="bnb"):
+            first = journal.new_client_order_id(3, "lv1", 7, "BUY")
+        with override_settings(BNB_CLIENT_ORDER_PREFIX="bnb2_"):
+            second = journal.new_client_order_id(3, "lv1", 7, "BUY")
+            self.assertEqual(journal.parse_client_order_id(second), (3, "lv1", 7, "BUY"))
+            self.assertIsNone(journal.parse_client_order_id(first))
+        self.assertEqual((first, second), ("bnb3-lv1-7B", "bnb2_3-lv1-7B"))
+        with override_settings(BNB_CLIENT_ORDER_PREFIX="bnb"):
+            self.assertIsNone(journal.parse_client_order_id(second))
+            # bot 23 pierwszej usługi nie jest mylony z botem 3 drugiej
+            self.assertEqual(journal.parse_client_order_id("bnb23-lv1-7B"), (23, "lv1", 7, "BUY"))
+
+    def test_lost_response_is_recovered_without_new_order(self):
+        self.tick("99")
+        self.client.lose_response = True
+        runtime = self.tick("97")
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+        self.assertEqual(len(self.client.orders), 2)
+
+        # Następny tick pyta giełdę o zlecenie zamiast składać je ponownie
+        self.client.lose_response = False
+        runtime = self.tick("97.5")
+        self.assertTrue(runtime["flags"]["lv2_bought"])
+        self.assertEqual(len(self.client.orders), 2)
+        self.assertEqual(self.bot.trades.filter(side="BUY", level="lv2").count(), 1)
+        self.assertEqual(BnbJournalEvent.objects.filter(bot=self.bot, event="COMMIT").count(), 2)
+
+    def close_all(self, price):
+        self.client.prices["BTCUSDT"] = price
+        run_grid_bot(self.bot.id, close_and_finish=True, current_price=Decimal(price))
+        self.bot.refresh_from_db()
+        return self.bot.get_state()[1]
+
+    def test_close_all_sends_one_sell_and_allocates_fill_per_level(self):
+        self.tick("99")
+        self.tick("97")
+        volumes = {lv: Decimal(v) for lv, v in self.bot.get_state()[1]["buy_volume"].items()}
+
+        runtime = self.close_all("99")
+
+        sells = [o for o in self.client.orders if o["side"] == "SELL"]
+        self.assertEqual(len(sells), 1)
+        self.assertEqual(Decimal(sells[0]["quantity"]), volumes["lv1"] + volumes["lv2"])
+        self.assertEqual(self.bot.status, "FINISHED")
+        self.assertFalse(runtime["flags"]["lv1_bought"] or runtime["flags"]["lv2_bought"])
+
+        trades = {t.level: t for t in self.bot.trades.filter(side="SELL")}
+        self.assertEqual(set(trades), {"lv1", "lv2"})
+        self.assertEqual(trades["lv1"].quantity, volumes["lv1"])
+        self.assertEqual(trades["lv2"].quantity, volumes["lv2"])
+        self.assertEqual(trades["lv2"].close_price, Decimal("99"))
+        intents = BnbJournalEvent.objects.filter(bot=self.bot, event="INTENT", side="SELL")
+        self.assertEqual({i.client_order_id for i in intents}, {sells[0]["newClientOrderId"]})
+
+    def test_lost_close_all_response_is_split_back_to_levels(self):
+        self.tick("99")
+        self.tick("97")
+        self.client.lose_response = True
+        self.close_all("99")
+        self.assertEqual(self.bot.status, "RUNNING")
+
+        self.client.lose_response = False
+        runtime = self.close_all("99")
+        self.assertEqual(len([o for o in self.client.orders if o["side"] == "SELL"]), 1)
+        self.assertEqual(self.bot.status, "FINISHED")
+        self.assertFalse(runtime["flags"]["lv1_bought"] or runtime["flags"]["lv2_bought"])
+        self.assertEqual(self.bot.trades.filter(side="SELL").count(), 2)
+
+    def test_client_order_ids_are_deterministic_per_level_cycle(self):
+        self.tick("99")
+        self.tick("97")
+        self.tick("100")
+        self.tick("97")
+        ids = [o["newClientOrderId"] for o in self.client.orders]
+        prefix = f"{journal.client_order_prefix()}{self.bot.id}"
+        self.assertEqual(ids, [f"{prefix}-lv1-0B", f"{prefix}-lv2-0B", f"{prefix}-lv2-0S", f"{prefix}-lv2-1B"])
+
+    def test_restart_reconciles_orders_lost_in_crash(self):
+        # Zlecenie złożone, ale proces padł przed zapisem stanu
+        with mock.patch.object(WriteBuffer, "flush"):
+            self.tick("99")
+        self.assertFalse(self.bot.get_state()[1]["flags"]["lv1_bought"])
+        bnb_manager.forget_bot_state(self.bot.id)
+
+        runtime = self.tick("99")
+        self.assertTrue(runtime["flags"]["lv1_bought"])
+        self.assertEqual(len(self.client.orders), 1)
+        self.assertEqual(len(self.client.all_orders_calls), 1)
+
+    def test_order_missing_on_exchange_is_marked_failed(self):
+        self.tick("99")
+        self.client.fail = True
+        self.tick("97")
+        # INTENT bez zlecenia na giełdzie -> FAILED, poziom kupiony normalnie przy ponowieniu
+        self.client.fail = False
+        runtime = self.tick("97.5")
+        self.assertTrue(runtime["flags"]["lv2_bought"])
+        self.assertEqual(BnbJournalEvent.objects.filter(bot=self.bot, event="FAILED").count(), 1)
+        # Ponowienie z tym samym newClientOrderId, zakończone COMMIT
+        self.assertEqual(len({o["newClientOrderId"] for o in self.client.orders}), 2)
+        self.assertFalse(bnb_manager.pending_intents(self.bot))
+
+    def test_worker_reconciles_with_one_call_per_symbol(self):
+        bots = [self.bot, make_bot("BTCUSDT"), make_bot("BTCUSDT")]
+        with mock.patch.object(WriteBuffer, "flush"):
+            for bot in bots:
+                run_grid_bot(bot.id, current_price=Decimal("99"))
+        for bot in bots:
+            bnb_manager.forget_bot_state(bot.id)
+
+        plan = bnb_manager.plan_recovery(BnbBot.objects.filter(id__in=[b.id for b in bots]))
+        self.assertEqual(len(self.client.all_orders_calls), 1)
+        for bot in bots:
+            run_grid_bot(bot.id, current_price=Decimal("99"), recovery=plan[bot.id])
+            bot.refresh_from_db()
+            self.assertTrue(bot.get_state()[1]["flags"]["lv1_bought"])
+        self.assertEqual(len(self.client.orders), 3)
+        self.assertEqual(len(self.client.all_orders_calls), 1)
+
+
+class LimitModeTests(TestCase):
+
+    def setUp(self):
+        for state in (bnb_manager._grid_cache, bnb_manager._last_prices, bnb_manager._retry_levels,
+                      bnb_manager._recovered_bots, bnb_manager._pending_bots, bnb_manager._limit_synced):
+            state.clear()
+        exchange_info_cache.clear()
+        self.bot = make_bot("BTCUSDT", order_mode=BnbBot.LIMIT_MODE)
+        self.client = FakeExchangeClient({"BTCUSDT": "101"})
+        patcher = mock.patch("bnbgrid.bnb_manager.get_binance_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tick(self, price, fills=()):
+        self.client.prices["BTCUSDT"] = price
+        run_grid_bot(self.bot.id, current_price=Decimal(price), fills=fills)
+        self.bot.refresh_from_db()
+        return self.bot.get_state()[1]
+
+    def cid(self, level, cycle, side):
+        return journal.new_client_order_id(self.bot.id, level, cycle, side)
+
+    def test_places_resting_buys_and_then_waits(self):
+        self.tick("101")
+        self.assertEqual([(o["type"], o["side"], o["price"], o["quantity"]) for o in self.client.orders],
+                         [("LIMIT", "BUY", "100.00", "0.500"), ("LIMIT", "BUY", "98.00", "0.510")])
+
+        runtime = self.tick("97")
+        self.assertEqual(len(self.client.orders), 2)
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+
+    def test_fill_places_opposite_order(self):
+        self.tick("101")
+        runtime = self.tick("98", [self.client.fill(self.cid("lv2", 0, "B"))])
+        self.assertTrue(runtime["flags"]["lv2_bought"])
+        self.assertEqual(self.client.orders[-1]["newClientOrderId"], self.cid("lv2", 0, "S"))
+        self.assertEqual((self.client.orders[-1]["side"], self.client.orders[-1]["price"]), ("SELL", "100.00"))
+
+        sell_fill = self.client.fill(self.cid("lv2", 0, "S"))
+        runtime = self.tick("100", [sell_fill])
+        self.assertFalse(runtime["flags"]["lv2_bought"])
+        self.assertEqual(runtime["cycles"]["lv2"], 1)
+        self.assertEqual(self.client.orders[-1]["newClientOrderId"], self.cid("lv2", 1, "B"))
+        self.assertGreater(self.bot.trades.get(side="SELL").profit, 0)
+
+        # Powtórzone zdarzenie nie tworzy drugiej transakcji ani zlecenia
+        self.tick("100", [sell_fill])
+        self.assertEqual(self.bot.trades.filter(side="SELL").count(), 1)
+        self.assertEqual(len(self.client.orders), 4)
+
+    def test_restart_picks_up_fills_missed_while_offline(self):
+        self.tick("101")
+        self.client.fill(self.cid("lv1", 0, "B"))
+        bnb_manager.forget_bot_state(self.bot.id)
+
+        runtime = self.tick("99.5")
+        self.assertTrue(runtime["flags"]["lv1_bought"])
+        self.assertEqual(len(self.client.orders), 2)  # lv1 nie ma poziomu sprzedaży, lv2 wciąż czeka
+        self.assertEqual(len(self.client.all_orders_calls), 1)
+
+    def test_close_cancels_resting_orders_and_sells(self):
+        self.tick("101")
+        self.tick("99.5", [self.client.fill(self.cid("lv1", 0, "B"))])
+
+        self.tick("111")
+        self.assertEqual(self.bot.status, "FINISHED")
+        self.assertEqual(self.client.by_client_id[self.cid("lv2", 0, "B")]["status"], "CANCELED")
+        self.assertEqual((self.client.orders[-1]["type"], self.client.orders[-1]["side"]), ("MARKET", "SELL"))
+        self.assertFalse(bnb_manager.pending_intents(self.bot))
+
+
+class LevelTableRunGridBotTests(RunGridBotTests):
+    """
+    Te same scenariusze co RunGridBotTests, ale ze stanem poziomów w BnbLevelState.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.bot.enable_level_table()
+        self.bot.save()
+        self.runtime_blob = self.bot.runtime_data
+
+    def test_fill_updates_only_touched_level_row(self):
+        self.tick("99")
+        self.bot.refresh_from_db()
+
+        self.assertEqual(self.bot.runtime_data, self.runtime_blob)
+        lv1 = BnbLevelState.objects.get(bot=self.bot, level="lv1")
+        lv2 = BnbLevelState.objects.get(bot=self.bot, level="lv2")
+        self.assertTrue(lv1.bought)
+        self.assertEqual(lv1.buy_price, Decimal("99"))
+        self.assertFalse(lv2.bought)
+
+        with self.assertNumQueries(1):
+            levels_data, runtime_data = self.bot.get_state()
+        self.assertEqual(levels_data["caps"]["lv2"], "50.00000000")
+        self.assertTrue(runtime_data["flags"]["lv1_bought"])
+
+
+class RateGovernorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.governor = RateGovernor(store=LocalBucketStore())
+        patcher = mock.patch.object(self.governor, "limits", return_value=(100.0, 10.0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_request_cost_uses_endpoint_weights(self):
+        self.assertEqual(request_cost("GET", "https://api.binance.com/api/v3/ticker/price", {"symbol": "BTCUSDT"}),
+                         (2, 0, PRIORITY_SYNC))
+        self.assertEqual(request_cost("GET", "https://api.binance.com/api/v3/ticker/price", {"symbols": "[]"})[0], 4)
+        self.assertEqual(request_cost("POST", "https://api.binance.com/api/v3/order", {}), (1, 1, PRIORITY_ORDER))
+        self.assertEqual(request_cost("GET", "https://api.binance.com/api/v3/allOrders", {"symbol": "X"})[0], 20)
+
+    def test_low_priority_is_shed_before_orders(self):
+        # 100 tokenów, ceny nie schodzą poniżej 30% rezerwy
+        for _ in range(35):
+            self.governor.acquire(2, priority=PRIORITY_PRICE, max_wait=0)
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            self.governor.acquire(2, priority=PRIORITY_PRICE, max_wait=0)
+        self.assertEqual(ctx.exception.code, -1003)
+
+        self.governor.acquire(1, "key", orders=1, priority=PRIORITY_ORDER, max_wait=0)
+
+    def test_order_bucket_is_per_api_key(self):
+        for _ in range(10):
+            self.governor.acquire(1, "key-a", orders=1, priority=PRIORITY_ORDER, max_wait=0)
+        with self.assertRaises(RateLimitExceeded):
+            self.governor.acquire(1, "key-a", orders=1, priority=PRIORITY_ORDER, max_wait=0)
+        self.governor.acquire(1, "key-b", orders=1, priority=PRIORITY_ORDER, max_wait=0)
+
+    def test_used_weight_header_and_ban_are_respected(self):
+        self.governor.observe(mock.Mock(status_code=200, headers={"X-MBX-USED-WEIGHT-1M": "95"}))
+        with self.assertRaises(RateLimitExceeded):
+            self.governor.acquire(10, priority=PRIORITY_ORDER, max_wait=0)
+
+        self.governor.observe(mock.Mock(status_code=429, headers={"Retry-After": "30"}))
+        with self.assertRaises(RateLimitExceeded):
+            self.governor.acquire(1, priority=PRIORITY_ORDER, max_wait=1)
+
+    def test_governed_client_acquires_and_reads_headers(self):
+        client = GovernedClient("key", "secret", ping=False)
+        response = mock.Mock(status_code=200, headers={"X-MBX-USED-WEIGHT-1M": "7"}, text='{"price": "1"}')
+        response.json.return_value = {"symbol": "BTCUSDT", "price": "1"}
+        client.session = mock.Mock(get=mock.Mock(return_value=response))
+
+        with mock.patch("binance_common.rate_limit.governor") as governor, rate_priority(PRIORITY_PRICE):
+            client.get_symbol_ticker(symbol="BTCUSDT")
+        governor.acquire.assert_called_once_with(2, "key", 0, PRIORITY_PRICE)
+        governor.observe.assert_called_once_with(response, "key")
+
+    def test_governed_client_reads_headers_of_its_own_response(self):
+        # Klient z puli jest współdzielony - równoległe zapytanie nadpisuje client.response
+        client = GovernedClient("key", "secret", ping=False)
+        response = mock.Mock(status_code=200, headers={"X-MBX-USED-WEIGHT-1M": "7"}, text='{"price": "1"}')
+        other = mock.Mock(status_code=200, headers={"X-MBX-USED-WEIGHT-1M": "90"})
+
+        def parse():
+            client.response = other
+            return {"symbol": "BTCUSDT", "price": "1"}
+
+        response.json.side_effect = parse
+        client.session = mock.Mock(get=mock.Mock(return_value=response))
+
+        with mock.patch("binance_common.rate_limit.governor") as governor:
+            client.get_symbol_ticker(symbol="BTCUSDT")
+        governor.observe.assert_called_once_with(response, "key")
+
+    def test_governed_client_sends_signed_order_without_shared_response(self):
+        client = GovernedClient("key", "secret", ping=False)
+        response = mock.Mock(status_code=200, headers={}, text='{"orderId": 1}')
+        response.json.return_value = {"orderId": 1}
+        client.session = mock.Mock(post=mock.Mock(return_value=response))
+
+        with mock.patch("binance_common.rate_limit.governor") as governor:
+            result = client.create_order(symbol="BTCUSDT", side="BUY", type="LIMIT", timeInForce="GTC",
+                                         quantity="1", price="100", newClientOrderId="bnb1-lv1-1B")
+
+        self.assertEqual(result, {"orderId": 1})
+        self.assertIsNone(client.response)
+        governor.acquire.assert_called_once_with(1, "key", 1, PRIORITY_ORDER)
+        args, kwargs = client.session.post.call_args
+        self.assertTrue(args[0].endswith("/order"))
+        self.assertEqual(kwargs["headers"], {"Content-Type": "application/x-www-form-urlencoded"})
+        self.assertEqual([key for key, _ in kwargs["data"]][-1], "signature")
+        self.assertIn(("newClientOrderId", "bnb1-lv1-1B"), kwargs["data"])
+
+
+class BotDetailsViewTests(TestCase):
+
+    def setUp(self):
+        UserProfile.objects.create(user_id=1, auth_token="test-token")
+        self.auth = {"HTTP_AUTHORIZATION": "Token test-token"}
+
+    def make_big_bot(self, levels=50, sells_per_level=20):
+        bot = make_bot("BTCUSDT")
+        names = [f"lv{i}" for i in range(1, levels + 1)]
+        levels_data = {lv: 100.0 - i for i, lv in enumerate(names)}
+        levels_data["caps"] = {lv: 10.0 for lv in names}
+        levels_data["sell_levels"] = {names[i]: names[i - 1] for i in range(1, levels)}
+        bot.save_levels_data(levels_data)
+        bot.save()
+        BnbTrade.objects.bulk_create([
+            BnbTrade(bot=bot, level=lv, side=side, quantity=Decimal("0.1"), profit=Decimal("0.5") if side == "SELL" else None,
+                     status="FILLED")
+            for lv in names for _ in range(sells_per_level) for side in ("BUY", "SELL")
+        ])
+        return bot
+
+    def test_level_stats_use_constant_number_of_queries(self):
+        small = make_bot("BTCUSDT")
+        BnbTrade.objects.create(bot=small, level="lv2", side="SELL", quantity=Decimal("0.1"), profit=Decimal("1.25"),
+                                status="FILLED")
+        big = self.make_big_bot()
+        for bot in (small, big):
+            rebuild_bot_stats(bot.id)
+
+        for bot in (small, big):
+            # autoryzacja, bot z rollupem
+            with self.assertNumQueries(2):
+                details = self.client.get(f"/get_bot_details/{bot.id}/", **self.auth).json()
+            # autoryzacja, bot z rollupem, ostatnie transakcje
+            with self.assertNumQueries(3):
+                full = self.client.get(f"/get_bot_full_data/{bot.id}/", **self.auth).json()
+
+        self.assertEqual(details["levels"]["lv7"]["tp"], 20)
+        self.assertEqual(details["levels"]["lv7"]["profit"], 10.0)
+        self.assertEqual(details["total_profit"], 500.0)
+        self.assertEqual(full["total_profit"], 500.0)
+        self.assertEqual({lv["tp"] for lv in full["trading_levels"]}, {20})
+
+        small_details = self.client.get(f"/get_bot_details/{small.id}/", **self.auth).json()
+        self.assertEqual(small_details["levels"]["lv1"], {"price": 100.0, "capital": 50.0, "tp": 0, "profit": 0.0})
+        self.assertEqual(small_details["levels"]["lv2"]["tp"], 1)
+        self.assertEqual(small_details["total_profit"], 1.25)
+
+    def test_batch_details_use_constant_number_of_queries(self):
+        first = self.make_big_bot(levels=5, sells_per_level=2)
+        rebuild_bot_stats(first.id)
+
+        def batch(payload):
+            return self.client.post("/get_bots_batch/", payload, content_type="application/json", **self.auth)
+
+        # autoryzacja, boty z rollupem, stan poziomów (prefetch)
+        with self.assertNumQueries(3):
+            one = batch({"bot_ids": [first.id]}).json()
+
+        others = [make_bot("BTCUSDT") for _ in range(4)]
+        others[0].enable_level_table()
+        others[0].save()
+        foreign = make_bot("BTCUSDT")
+        BnbBot.objects.filter(pk=foreign.pk).update(user_id=2)
+        with self.assertNumQueries(3):
+            many = batch({"bot_ids": [first.id, foreign.id, 999] + [bot.id for bot in others]}).json()
+
+        self.assertEqual(one["bots"][0]["total_profit"], 5.0)
+        self.assertEqual(one["bots"][0]["levels"]["lv1"]["tp"], 2)
+        self.assertEqual([bot["bot_id"] for bot in many["bots"]], [first.id] + [bot.id for bot in others])
+        self.assertEqual(many["bots"][1]["levels"]["lv1"], {"price": 100.0, "capital": 50.0, "tp": 0, "profit": 0.0})
+        self.assertEqual(many["missing"], [foreign.id, 999])
+
+        # Wszystkie boty użytkownika, tylko status - bez rollupu i poziomów
+        with self.assertNumQueries(2):
+            statuses = batch({"user_id": 1, "fields": ["status"]}).json()
+        self.assertEqual(statuses["bots"][0], {"bot_id": first.id, "symbol": "BTCUSDT", "status": "RUNNING"})
+        self.assertEqual(len(statuses["bots"]), 5)
+
+        self.assertEqual(batch({"user_id": 2}).status_code, 403)
+        self.assertEqual(batch({"bot_ids": [first.id], "fields": ["trades"]}).status_code, 400)
+        self.assertEqual(batch({}).status_code, 400)
+
+    def test_batch_rejects_fields_and_bot_ids_that_are_not_lists(self):
+        bot = make_bot("BTCUSDT")
+
+        def batch(payload):
+            return self.client.post("/get_bots_batch/", payload, content_type="application/json", **self.auth)
+
+        for payload in ({"bot_ids": [bot.id], "fields": "status"}, {"bot_ids": [bot.id], "fields": 5},
+                        {"bot_ids": [bot.id], "fields": [["status"]]}, {"bot_ids": str(bot.id)},
+                        {"bot_ids": bot.id}, {"bot_ids": {"id": bot.id}}):
+            with self.subTest(payload=payload):
+                response = batch(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("must be a list", response.json()["error"])
+        self.assertEqual(batch({"bot_ids": [bot.id], "fields": []}).status_code, 200)
+
+    def test_profit_endpoints_read_rollup(self):
+        big = self.make_big_bot(levels=5, sells_per_level=4)
+        empty = make_bot("ETHUSDT")
+        rebuild_bot_stats(big.id)
+
+        # autoryzacja, boty z rollupem
+        with self.assertNumQueries(2):
+            bots = self.client.get("/get_user_bots/1/", **self.auth).json()
+        self.assertEqual({bot["id"]: bot["total_profit"] for bot in bots}, {big.id: "10.00000000", empty.id: "0.0"})
+
+        trades = self.client.get(f"/get_bot_trades/{big.id}/", **self.auth).json()
+        self.assertEqual(trades["total_profit"], 10.0)
+
+        # autoryzacja, kubełki zgrupowane po (dzień, bot)
+        with self.assertNumQueries(2):
+            profits = self.client.get("/get_bot_profits/user/1/", **self.auth).json()
+        self.assertEqual(len(profits["profits"]), 1)
+        self.assertEqual(profits["summary"]["trade_count"], 40)
+        self.assertEqual(profits["summary"]["bots"][0]["bot_id"], big.id)
+        self.assertEqual(float(profits["summary"]["total_profit"]), 10.0)
+
+    def test_profits_grouped_in_sql_by_granularity_and_timezone(self):
+        big = self.make_big_bot(levels=5, sells_per_level=4)
+        rebuild_bot_stats(big.id)
+
+        # autoryzacja, jedno zapytanie zgrupowane po (godzina, bot) na BnbTrade
+        with self.assertNumQueries(2):
+            hourly = self.client.get("/get_bot_profits/user/1/?granularity=hour&tz=Europe/Warsaw&days=365",
+                                     **self.auth).json()
+        self.assertEqual(len(hourly["profits"]), 1)
+        self.assertRegex(hourly["profits"][0]["date"], r"T\d\d:00:00\+0[12]:00$")
+        self.assertEqual(hourly["summary"]["timezone"], "Europe/Warsaw")
+        self.assertEqual(hourly["summary"]["trade_count"], 40)
+        self.assertEqual(float(hourly["summary"]["total_profit"]), 10.0)
+
+        # Tydzień w UTC - z dziennych kubełków rollupu; data poniedziałku
+        weekly = self.client.get(f"/get_bot_profits/user/1/{big.id}/?granularity=week", **self.auth).json()
+        monday = timezone.now().date() - timedelta(days=timezone.now().weekday())
+        self.assertEqual(weekly["profits"][0]["date"], monday.isoformat())
+        self.assertEqual(weekly["summary"]["bots"][0]["trade_count"], 40)
+
+        weekly_local = self.client.get("/get_bot_profits/user/1/?granularity=week&tz=Asia/Tokyo", **self.auth).json()
+        self.assertRegex(weekly_local["profits"][0]["date"], r"^\d{4}-\d\d-\d\d$")
+
+        self.assertEqual(self.client.get("/get_bot_profits/user/1/?granularity=month", **self.auth).status_code, 400)
+        self.assertEqual(self.client.get("/get_bot_profits/user/1/?tz=Mars/Base", **self.auth).status_code, 400)
+
+    def test_rollup_and_trade_paths_share_start_boundary(self):
+        bot = make_bot("BTCUSDT")
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        for hours, profit in ((2, "1"), (8, "2"), (20, "4")):
+            trade = BnbTrade.objects.create(bot=bot, level="lv1", side="SELL", quantity=1, open_price=1,
+                                            profit=Decimal(profit), status="FILLED")
+            BnbTrade.objects.filter(id=trade.id).update(created_at=day + timedelta(hours=hours))
+        rebuild_bot_stats(bot.id)
+
+        # start_date w połowie dnia: kubełki (UTC) i BnbTrade (Etc/UTC) liczą ten sam pełny dzień
+        start, end = day + timedelta(hours=12), timezone.now()
+        for granularity in ("day", "week"):
+            rollup = views.profit_rows(1, bot.id, start, end, granularity, ZoneInfo("UTC"))
+            trades = views.profit_rows(1, bot.id, start, end, granularity, ZoneInfo("Etc/UTC"))
+            self.assertEqual(rollup, trades, granularity)
+        self.assertEqual(rollup[0][3:], (Decimal("7"), 3))
+        self.assertEqual(views.profit_rows(1, bot.id, start, end, "day", ZoneInfo("UTC"))[0][0], day.date())
+
+        hourly = views.profit_rows(1, bot.id, start, end, "hour", ZoneInfo("UTC"))
+        self.assertEqual(sum(row[3] for row in hourly), Decimal("4"))
+
+
+class TradeExportTests(TestCase):
+
+    def setUp(self):
+        UserProfile.objects.create(user_id=1, auth_token="test-token")
+        self.auth = {"HTTP_AUTHORIZATION": "Token test-token"}
+        self.bot = make_bot("BTCUSDT")
+        BnbTrade.objects.bulk_create([
+            BnbTrade(bot=self.bot, level=f"lv{i % 2 + 1}", side="SELL" if i % 2 else "BUY", quantity=Decimal("0.125"),
+                     open_price=Decimal("97.5"), profit=Decimal("0.25") if i % 2 else None, status="FILLED")
+            for i in range(5)
+        ])
+        self.ids = list(BnbTrade.objects.order_by("id").values_list("id", flat=True))
+
+    def export(self, query=""):
+        return self.client.get(f"/export_bnb_trades_csv/{self.bot.id}/{query}", **self.auth)
+
+    def test_csv_is_streamed_in_chunks(self):
+        with mock.patch.object(bnb_export, "CHUNK_SIZE", 2):
+            response = self.export()
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+
+        self.assertEqual(len(chunks), 4)  # nagłówek + 3 partie po 2 wiersze
+        rows = b"".join(chunks).decode().splitlines()
+        self.assertEqual(rows[0].split(";")[:3], ["Level", "Side", "Quantity"])
+        self.assertEqual(rows[2].split(";")[:6], ["lv2", "SELL", "0,12500000", "97,50000000", "", "0,25000000"])
+        self.assertEqual(len(rows), 6)
+
+    def test_keyset_pagination(self):
+        first = self.export("?limit=3")
+        self.assertEqual(first["X-Next-After-Id"], str(self.ids[2]))
+        self.assertEqual(len(b"".join(first.streaming_content).decode().splitlines()), 4)
+
+        rest = self.export(f"?limit=3&after_id={first['X-Next-After-Id']}")
+        self.assertFalse(rest.has_header("X-Next-After-Id"))
+        self.assertEqual(len(b"".join(rest.streaming_content).decode().splitlines()), 3)
+
+        # Pełna strona kończąca eksport - bez nagłówka, żeby klient nie pytał o pustą stronę
+        exact = self.export(f"?limit=2&after_id={self.ids[2]}")
+        self.assertFalse(exact.has_header("X-Next-After-Id"))
+        self.assertEqual(len(b"".join(exact.streaming_content).decode().splitlines()), 3)
+        self.assertFalse(self.export("?limit=5").has_header("X-Next-After-Id"))
+
+        self.assertEqual(self.export("?after_id=abc").status_code, 400)
+        self.assertEqual(self.export("?limit=0").status_code, 400)
+        self.assertEqual(self.export("?file_format=xlsx").status_code, 400)
+
+    @unittest.skipIf(bnb_export.pa is None, "pyarrow not installed")
+    def test_parquet_and_arrow_exports(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with mock.patch.object(bnb_export, "CHUNK_SIZE", 2):
+            parquet = self.export("?file_format=parquet")
+            table = pq.read_table(pa.BufferReader(b"".join(parquet.streaming_content)))
+        self.assertEqual(parquet["Content-Disposition"], f'attachment; filename="bot_{self.bot.id}_trades.parquet"')
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(pq.ParquetFile(pa.BufferReader(b"".join(self.export("?file_format=parquet")
+                                                                   .streaming_content))).num_row_groups, 1)
+        self.assertEqual(table.column("id").to_pylist(), self.ids)
+        self.assertEqual(table.column("profit").to_pylist()[1], Decimal("0.25"))
+
+        arrow = self.export(f"?file_format=arrow&after_id={self.ids[1]}")
+        table = pa.ipc.open_stream(b"".join(arrow.streaming_content)).read_all()
+        self.assertEqual(table.column("id").to_pylist(), self.ids[2:])
+
+
+class BacktestTests(TestCase):
+
+    PRICES = ["99", "99.5", "97", "100", "97.5", "101", "100", "111", "97"]
+
+    def test_replay_matches_run_grid_bot(self):
+        bot = make_bot("BTCUSDT")
+        levels_data, _ = bot.get_state()
+        client = FakeExchangeClient({"BTCUSDT": "99"})
+        exchange_info_cache.clear()
+        with mock.patch("bnbgrid.bnb_manager.get_binance_client", return_value=client):
+            for price in self.PRICES:
+                client.prices["BTCUSDT"] = price
+                run_grid_bot(bot.id, current_price=Decimal(price))
+
+        result = run_backtest(levels_data, [float(p) for p in self.PRICES])
+        live = list(bot.trades.order_by("id").values_list("level", "side", "profit"))
+        self.assertEqual([(t["level"], t["side"]) for t in result.trades], [(lv, side) for lv, side, _ in live])
+        self.assertAlmostEqual(result.realized_profit, float(sum(p for _, _, p in live if p is not None)), places=1)
+        self.assertEqual(result.finished_at, 7)
+        self.assertEqual(result.open_positions, {})
+
+    def test_year_of_minute_candles_runs_in_seconds(self):
+        rng = np.random.default_rng(7)
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, 365 * 24 * 60)))
+        levels_data = {f"lv{i}": 105 - i for i in range(1, 51)}
+        levels_data["caps"] = {f"lv{i}": 20 for i in range(1, 51)}
+        levels_data["sell_levels"] = {f"lv{i}": f"lv{i - 1}" for i in range(2, 51)}
+
+        started = time.perf_counter()
+        result = run_backtest(levels_data, prices)
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertGreater(result.sell_count, 0)
+        self.assertGreaterEqual(result.max_capital_in_use, 20)
+
+    def test_ohlc_path_visits_low_before_high_on_rising_candle(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("open_time,open,high,low,close,volume\n0,10,12,9,11,1\n60000,11,11.5,8,9,1\n")
+        self.addCleanup(os.remove, f.name)
+        times, prices = load_price_series(f.name, path_mode="ohlc")
+        self.assertEqual(prices.tolist(), [10, 9, 12, 11, 11, 11.5, 8, 9])
+        self.assertEqual(times.tolist(), [0] * 4 + [60000] * 4)
+
+
+class SweepTests(SimpleTestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("0.5:2:0.5"), [0.5, 1.0, 1.5, 2.0])
+        self.assertEqual(parse_range("20,50", int), [20, 50])
+
+    def test_pool_results_match_serial_run_and_are_ranked(self):
+        rng = np.random.default_rng(3)
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, 20000)))
+        candidates = build_candidates([100, 105], [1, 2], [2], [10, 50])
+
+        serial = run_sweep(prices, candidates, 1000, workers=1)
+        pooled = run_sweep(prices, candidates, 1000, workers=2)
+        self.assertEqual(serial, pooled)
+        profits = [row["total_profit"] for row in pooled]
+        self.assertEqual(profits, sorted(profits, reverse=True))
+        self.assertEqual({row["levels"] for row in pooled if row["max_levels"] == 10}, {10})
+
+
+def make_klines(start_ms, count, step=60000):
+    return [[start_ms + i * step, "1", "2", "0.5", str(100 + i), "10", start_ms + i * step + step - 1]
+            for i in range(count)]
+
+
+class KlineStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.store = KlineStore(self.root)
+
+    def test_download_is_paged_and_append_only(self):
+        client = mock.Mock()
+        klines = make_klines(0, 2500)
+        client.get_klines.side_effect = lambda startTime, limit, **kw: [k for k in klines if k[0] >= startTime][:limit]
+
+        self.assertEqual(download_klines(client, self.store, "btcusdt", "1m", 0), 2500)
+        self.assertEqual(client.get_klines.call_count, 3)
+        # Ponowne pobranie zaczyna od ostatniej świecy - nic nie jest dublowane
+        self.assertEqual(download_klines(client, self.store, "BTCUSDT", "1m", 0), 0)
+        self.assertEqual(self.store.count("BTCUSDT", "1m"), 2500)
+
+    def test_range_read_is_zero_copy_view(self):
+        self.store.append("BTCUSDT", "1m", {name: np.asarray(values) for name, values in zip(
+            ("open_time", "open", "high", "low", "close", "volume"), np.array(make_klines(0, 10), dtype=float).T[:6])})
+        klines = self.store.read("BTCUSDT", "1m", 120000, 300000)
+        self.assertEqual((klines.start, klines.stop), (2, 5))
+        self.assertEqual(klines.close.tolist(), [102, 103, 104])
+        self.assertIsInstance(klines.close, np.memmap)
+        self.assertFalse(klines.close.flags.owndata)
+
+    def test_torn_append_is_repaired(self):
+        client = mock.Mock(get_klines=mock.Mock(return_value=make_klines(0, 5)))
+        download_klines(client, self.store, "BTCUSDT", "1m", 0)
+        with open(self.store.column_path("BTCUSDT", "1m", "close"), "ab") as f:
+            f.write(b"\0" * 12)  # zapis przerwany przed open_time
+        self.assertEqual(self.store.count("BTCUSDT", "1m"), 5)
+
+        client.get_klines.return_value = make_klines(300000, 2)
+        download_klines(client, self.store, "BTCUSDT", "1m", 0)
+        self.assertEqual(self.store.read("BTCUSDT", "1m").close.tolist(), [100, 101, 102, 103, 104, 100, 101])
+
+
+class WriteBufferTests(TestCase):
+
+    def setUp(self):
+        for state in (bnb_manager._grid_cache, bnb_manager._last_prices, bnb_manager._retry_levels,
+                      bnb_manager._recovered_bots, bnb_manager._pending_bots):
+            state.clear()
+        exchange_info_cache.clear()
+        self.bots = [make_bot("BTCUSDT") for _ in range(3)]
+        self.client = FakeExchangeClient({"BTCUSDT": "97"})
+        patcher = mock.patch("bnbgrid.bnb_manager.get_binance_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_ticks(self):
+        cycle = CycleWriteBuffer()
+        for bot in self.bots:
+            buffer = WriteBuffer()
+            run_grid_bot(bot.id, current_price=Decimal("97"), buffer=buffer)
+            cycle.add(buffer)
+        return cycle
+
+    def test_cycle_is_written_with_bulk_queries(self):
+        cycle = self.run_ticks()
+        self.assertEqual(BnbTrade.objects.count(), 0)
+
+        # savepoint + bulk_create (transakcje) + rollup (stats: select + insert + select + update,
+        # kubełki: select + insert) + bulk_create (dziennik) + bulk_update + release - niezależnie od liczby botów
+        with self.assertNumQueries(11):
+            cycle.flush()
+
+        self.assertEqual(BnbTrade.objects.filter(side="BUY").count(), 6)
+        for bot in self.bots:
+            bot.refresh_from_db()
+            self.assertTrue(bot.get_runtime_data()["flags"]["lv2_bought"])
+        self.assertEqual(bnb_manager._last_prices[self.bots[0].id], Decimal("97"))
+
+    def test_first_trades_tolerate_stats_row_created_concurrently(self):
+        cycle = self.run_ticks()
+        locked = BnbBotStats.objects.select_for_update
+        calls = []
+
+        def racing_select():
+            # Inny worker wstawia wiersz rollupu pierwszego bota tuż po naszym (pustym) select_for_update
+            if not calls:
+                calls.append(1)
+                BnbBotStats.objects.create(bot=self.bots[0], trade_count=1, total_profit=Decimal("1"))
+                return locked().none()
+            return locked()
+
+        with mock.patch.object(BnbBotStats.objects, "select_for_update", side_effect=racing_select):
+            cycle.flush()
+
+        stats = BnbBotStats.objects.get(bot=self.bots[0])
+        self.assertEqual((stats.trade_count, stats.total_profit), (3, Decimal("1")))
+        self.assertEqual(BnbBotStats.objects.count(), 3)
+
+    def test_failed_write_keeps_trades_and_flags_together(self):
+        cycle = self.run_ticks()
+        with mock.patch.object(BnbBot.objects, "bulk_update", side_effect=RuntimeError("db down")):
+            cycle.flush()
+
+        # Ani transakcje, ani flagi - nic nie zostało zapisane połowicznie
+        self.assertEqual(BnbTrade.objects.count(), 0)
+        self.bots[0].refresh_from_db()
+        self.assertFalse(self.bots[0].get_runtime_data()["flags"]["lv1_bought"])
+        self.assertNotIn(self.bots[0].id, bnb_manager._last_prices)
+
+    def test_late_job_flushes_its_own_buffer(self):
+        cycle = CycleWriteBuffer()
+        cycle.flush()
+        self.assertFalse(cycle.add(WriteBuffer()))
+
+
+class FakeStreamServer:
+    """
+    Lokalny serwer WebSocket udający combined stream Binance.
+    Zapamiętuje żądania SUBSCRIBE/UNSUBSCRIBE i pozwala wysłać ticker do klientów.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = []
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), daemon=True).start()
+        ready.wait(5)
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/stream"
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(self._serve())
+        self.port = list(self.server.sockets)[0].getsockname()[1]
+        ready.set()
+        self.loop.run_forever()
+
+    async def _serve(self):
+        return await websockets.serve(self._handler, "127.0.0.1", 0)
+
+    async def _handler(self, ws, *args):
+        self.connections.append(ws)
+        async for message in ws:
+            self.requests.append(json.loads(message))
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(5)
+
+    def push(self, payload):
+        self._call(self.connections[-1].send(json.dumps(payload)))
+
+    def push_price(self, symbol, price):
+        message = json.dumps({
+            "stream": f"{symbol.lower()}@miniTicker",
+            "data": {"e": "24hrMiniTicker", "s": symbol, "c": price},
+        })
+        self._call(self.connections[-1].send(message))
+
+    def drop_connections(self):
+        for ws in list(self.connections):
+            self._call(ws.close())
+
+    def shutdown(self):
+        self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class PriceStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeStreamServer()
+        patcher = mock.patch("bnbgrid.price_stream.RECONNECT_MIN_DELAY", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stream = PriceStream(self.server.url)
+        self.stream.start()
+
+    def tearDown(self):
+        self.stream.stop()
+        self.server.shutdown()
+
+    def subscribed_params(self, method="SUBSCRIBE"):
+        return [p for r in self.server.requests if r["method"] == method for p in r["params"]]
+
+    def test_subscribes_and_keeps_latest_price(self):
+        self.stream.set_symbols({"BTCUSDT"})
+        self.assertTrue(wait_for(lambda: self.subscribed_params() == ["btcusdt@miniTicker"]))
+
+        self.server.push_price("BTCUSDT", "101.25")
+        self.server.push_price("BTCUSDT", "101.50")
+        self.assertTrue(wait_for(lambda: self.stream.get_price("BTCUSDT") == Decimal("101.50")))
+        self.assertIsNone(self.stream.get_price("BNBUSDT"))
+
+    def test_resubscribes_when_bots_change(self):
+        self.stream.set_symbols({"BTCUSDT"})
+        self.assertTrue(wait_for(lambda: self.stream.connected and self.subscribed_params()))
+
+        self.stream.set_symbols({"BNBUSDT"})
+        self.assertTrue(wait_for(lambda: self.subscribed_params("UNSUBSCRIBE") == ["btcusdt@miniTicker"]))
+        self.assertIn("bnbusdt@miniTicker", self.subscribed_params())
+
+    def test_reconnects_and_resubscribes(self):
+        self.stream.set_symbols({"BTCUSDT"})
+        self.assertTrue(wait_for(lambda: len(self.server.connections) == 1 and self.subscribed_params()))
+
+        self.server.drop_connections()
+        self.assertTrue(wait_for(lambda: len(self.server.connections) == 2))
+        self.assertTrue(wait_for(lambda: self.subscribed_params().count("btcusdt@miniTicker") == 2))
+
+        self.server.push_price("BTCUSDT", "99")
+        self.assertTrue(wait_for(lambda: self.stream.get_price("BTCUSDT") == Decimal("99")))
+
+    def test_stale_prices_are_ignored(self):
+        self.stream.set_symbols({"BTCUSDT"})
+        self.assertTrue(wait_for(lambda: self.subscribed_params()))
+        self.server.push_price("BTCUSDT", "100")
+        self.assertTrue(wait_for(lambda: self.stream.get_price("BTCUSDT") is not None))
+
+        with mock.patch("bnbgrid.price_stream.time.monotonic", return_value=time.monotonic() + 60):
+            self.assertIsNone(self.stream.get_price("BTCUSDT", max_age=30))
+
+
+class UserDataStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeStreamServer()
+        patcher = mock.patch("bnbgrid.user_stream.RECONNECT_MIN_DELAY", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = mock.Mock()
+        self.client.stream_get_listen_key.return_value = "listen-key"
+        self.stream = UserDataStream(self.client, self.server.url)
+        self.stream.start()
+
+    def tearDown(self):
+        self.stream.stop()
+        self.server.shutdown()
+
+    def test_queues_execution_reports(self):
+        self.assertTrue(wait_for(lambda: self.stream.connected and self.server.connections))
+        self.assertTrue(self.stream.take_reconnected())
+        self.server.push({"e": "outboundAccountPosition", "B": []})
+        self.server.push({"e": "executionReport", "c": "bnb1-lv2-0B", "X": "FILLED", "z": "0.5", "Z": "49"})
+
+        events = []
+        self.assertTrue(wait_for(lambda: events.extend(self.stream.drain()) or events))
+        self.assertEqual([e["c"] for e in events], ["bnb1-lv2-0B"])
+        self.assertEqual(execution_report_order(events[0])["executedQty"], "0.5")
+
+    def test_reconnects_with_new_listen_key_after_expiry(self):
+        self.assertTrue(wait_for(lambda: self.stream.connected and self.server.connections))
+        self.stream.take_reconnected()
+        self.server.push({"e": "listenKeyExpired"})
+        self.assertTrue(wait_for(lambda: len(self.server.connections) == 2))
+        self.assertEqual(self.client.stream_get_listen_key.call_count, 2)
+        self.assertTrue(wait_for(self.stream.take_reconnected))
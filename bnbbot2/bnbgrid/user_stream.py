@@ -0,0 +1,156 @@
+# bnbgrid/user_stream.py
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+import websockets
+
+USER_STREAM_URL = "wss://stream.binance.com:9443/ws"  # + "/<listenKey>"
+KEEPALIVE_INTERVAL = 30 * 60  # listenKey wygasa po 60 min bez PUT /api/v3/userDataStream
+RECONNECT_MIN_DELAY = 1   # sekundy
+RECONNECT_MAX_DELAY = 60  # sekundy
+MAX_QUEUED_EVENTS = 10000
+
+
+def execution_report_order(event: dict) -> dict:
+    """
+    Zdarzenie executionReport w formacie odpowiedzi get_order (dla order_fill / resolve_order).
+    """
+    return {
+        "orderId": event.get("i", ""),
+        "clientOrderId": event.get("c", ""),
+        "status": event.get("X", ""),
+        "executedQty": event.get("z", "0"),
+        "cummulativeQuoteQty": event.get("Z", "0"),
+    }
+
+
+class UserDataStream:
+    """
+    Strumień danych użytkownika jednego konta Binance (zdarzenia executionReport jego zleceń).
+
+    Działa w osobnym wątku z własną pętlą asyncio, jak PriceStream: pobiera listenKey,
+    co KEEPALIVE_INTERVAL go przedłuża, a po zerwaniu połączenia lub wygaśnięciu klucza
+    łączy się ponownie. Zdarzenia czekają w kolejce, którą worker opróżnia przez drain().
+    Po każdym (ponownym) połączeniu take_reconnected() zwraca True - wypełnienia z przerwy
+    mogły przepaść, więc boty konta trzeba zsynchronizować z giełdą.
+    """
+
+    def __init__(self, client, url: str = USER_STREAM_URL):
+        self.client = client
+        self.url = url.rstrip("/")
+        self.connected = False
+
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=MAX_QUEUED_EVENTS)
+        self._reconnected = False
+
+        self._loop = None
+        self._stop_event = None
+        self._stopped = False
+        self._thread = None
+
+    # -------------------------------------------------------
+    # API wywoływane z wątku worker-a
+    # -------------------------------------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._thread_main, daemon=True)
+        self._thread.start()
+        print("[user_stream] Strumień użytkownika wystartował.")
+
+    def stop(self):
+        self._stopped = True
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def drain(self) -> list:
+        """
+        Zwraca i usuwa z kolejki zebrane zdarzenia executionReport.
+        """
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def take_reconnected(self) -> bool:
+        with self._lock:
+            reconnected, self._reconnected = self._reconnected, False
+        return reconnected
+
+    # -------------------------------------------------------
+    # Wnętrze - pętla asyncio
+    # -------------------------------------------------------
+    def _thread_main(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        delay = RECONNECT_MIN_DELAY
+
+        while not self._stopped:
+            try:
+                listen_key = await self._loop.run_in_executor(None, self.client.stream_get_listen_key)
+                async with websockets.connect(f"{self.url}/{listen_key}", ping_interval=20) as ws:
+                    self.connected = True
+                    delay = RECONNECT_MIN_DELAY
+                    with self._lock:
+                        self._reconnected = True
+                    await self._consume(ws, listen_key)
+            except Exception as e:
+                print(f"[user_stream] Połączenie przerwane: {e}")
+            finally:
+                self.connected = False
+
+            if self._stopped:
+                break
+            # Ponowne połączenie z rosnącym odstępem
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _consume(self, ws, listen_key: str):
+        reader = asyncio.ensure_future(self._read(ws))
+        keepalive = asyncio.ensure_future(self._keepalive(listen_key))
+        stopper = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            done, _ = await asyncio.wait({reader, keepalive, stopper}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                reader.result()  # propaguje wyjątek zamkniętego połączenia
+        finally:
+            for task in (reader, keepalive, stopper):
+                task.cancel()
+
+    async def _keepalive(self, listen_key: str):
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            await self._loop.run_in_executor(None, lambda: self.client.stream_keepalive(listen_key))
+
+    async def _read(self, ws):
+        async for message in ws:
+            if self._handle_message(message):
+                return  # listenKey wygasł - łączymy się z nowym
+
+    def _handle_message(self, message) -> bool:
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return False
+        data = payload.get("data", payload) if isinstance(payload, dict) else None
+        if not isinstance(data, dict):
+            return False
+
+        event_type = data.get("e")
+        if event_type == "listenKeyExpired":
+            print("[user_stream] listenKey wygasł, łączę ponownie.")
+            return True
+        if event_type == "executionReport":
+            with self._lock:
+                self._events.append(data)
+        return False
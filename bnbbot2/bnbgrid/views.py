@@ -4,24 +4,27 @@ from rest_framework.decorators import api_view, authentication_classes, permissi
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 from decimal import Decimal
-import csv
 import json
-from io import StringIO
 
 from django.conf import settings
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncHour, TruncWeek
 
-from .models import UserProfile, BnbBot, BnbTrade
+from .models import UserProfile, BnbBot, BnbBotDailyProfit, BnbBotStats, BnbTrade
 from .authentication import CustomAuthentication
+from . import export as bnb_export
 import logging
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from rest_framework import status
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+MAX_GRID_LEVELS = 50  # maks. liczba poziomów siatki w generate_levels
 
 
 # -------------------------------------------------------
@@ -53,10 +56,10 @@ def register(request):
     return Response({'status': 'Token saved successfully'})
 
 
-def generate_levels(max_price, pct, capital, min_price=None, decimals=3):
+def generate_levels(max_price, pct, capital, min_price=None, decimals=3, max_levels=MAX_GRID_LEVELS):
     """
     Generuje SŁOWNIK zawierający TYLKO:
-      - lv1, lv2, ... (właściwe ceny)
+      - lv1, lv2, ... (właściwe ceny, najwyżej max_levels poziomów)
       - caps
       - sell_levels
     Nie zwraca flag i buy_price/buy_volume!
@@ -78,7 +81,7 @@ def generate_levels(max_price, pct, capital, min_price=None, decimals=3):
             break
         if min_price and lv_price <= float(min_price):
             break
-        if i > 50:
+        if i > max_levels:
             break
 
         lv_price = round(lv_price, decimals)
@@ -107,12 +110,13 @@ def generate_levels(max_price, pct, capital, min_price=None, decimals=3):
 
 def init_runtime_data(level_names):
     """
-    Tworzy słownik z `flags`, `buy_price`, `buy_volume` = 0.
+    Tworzy słownik z `flags`, `buy_price`, `buy_volume` = 0 i licznikami cykli `cycles`.
     """
     rd = {
         "flags": {},
         "buy_price": {},
-        "buy_volume": {}
+        "buy_volume": {},
+        "cycles": {}
     }
     for lv_name in level_names:
         rd["flags"][f"{lv_name}_bought"] = False
@@ -120,6 +124,7 @@ def init_runtime_data(level_names):
         rd["flags"][f"{lv_name}_in_progress"] = False
         rd["buy_price"][lv_name] = 0.0
         rd["buy_volume"][lv_name] = 0.0
+        rd["cycles"][lv_name] = 0
     return rd
 
 
@@ -136,6 +141,9 @@ def create_bot(request):
     decimals = int(request.data.get("decimals", 2))
     binance_key = request.data.get("binance_api_key", "")
     binance_secret = request.data.get("binance_api_secret", "")
+    order_mode = str(request.data.get("order_mode", BnbBot.MARKET_MODE)).upper()
+    if order_mode not in dict(BnbBot.ORDER_MODE_CHOICES):
+        return Response({"error": f"Unknown order_mode: {order_mode}"}, status=400)
 
     bot = BnbBot.objects.create(
         user_id=user_id,
@@ -145,7 +153,8 @@ def create_bot(request):
         percent=percent,
         capital=capital,
         status='RUNNING',
-        binance_api_key=binance_key
+        binance_api_key=binance_key,
+        order_mode=order_mode
     )
     if binance_secret:
         bot.set_binance_api_secret(binance_secret)
@@ -161,6 +170,10 @@ def create_bot(request):
     runtime = init_runtime_data(level_names)
     bot.save_runtime_data(runtime)
 
+    # 3) Opcjonalnie: stan poziomów w osobnej tabeli (BnbLevelState)
+    if getattr(settings, "BNB_LEVEL_STATE_TABLE", False):
+        bot.enable_level_table()
+
     bot.save()
     return Response({
         "bot_id": bot.id,
@@ -176,11 +189,27 @@ def create_bot(request):
 @authentication_classes([CustomAuthentication])
 @permission_classes([IsAuthenticated])
 def get_bot_details(request, bot_id):
-    bot = get_object_or_404(BnbBot, pk=bot_id, user_id=request.user.id)
-    raw_data = bot.get_levels_data()
+    bot = get_object_or_404(BnbBot.objects.select_related('stats'), pk=bot_id, user_id=request.user.id)
+    levels, total_profit = bot_levels(bot)
+
+    resp = {
+        "bot_id": bot.id,
+        "status": bot.status,
+        "symbol": bot.symbol,
+        "levels": levels,
+        "capital": float(bot.capital),
+        "total_profit": round(total_profit, 2)
+    }
+    return Response(resp)
 
-    # wczytaj FILLED transakcje
-    trades = BnbTrade.objects.filter(bot=bot, status='FILLED')
+
+def bot_levels(bot: BnbBot):
+    """
+    (poziomy {lvX: price, capital, tp, profit}, suma zysku poziomów) - ceny i kapitał z get_state(),
+    liczba TP i zysk poziomów z rollupu BnbBotStats (pobranego razem z botem).
+    """
+    raw_data, _ = bot.get_state()
+    stats = bot_stats(bot).get_level_stats()
 
     # Zbuduj obiekt levels
     levels = {}
@@ -195,23 +224,91 @@ def get_bot_details(request, bot_id):
 
     total_profit = 0.0
     for lv_key, info in levels.items():
-        sells = trades.filter(level=lv_key, side='SELL')
-        tp_count = sells.count()
-        lv_profit = sum(float(t.profit or 0) for t in sells)
+        tp_count, lv_profit = stats.get(lv_key, (0, 0))
 
         info["tp"] = tp_count
-        info["profit"] = round(lv_profit, 2)
-        total_profit += lv_profit
+        info["profit"] = round(float(lv_profit), 2)
+        total_profit += float(lv_profit)
+    return levels, total_profit
 
-    resp = {
-        "bot_id": bot.id,
-        "status": bot.status,
-        "symbol": bot.symbol,
-        "levels": levels,
-        "capital": float(bot.capital),
-        "total_profit": round(total_profit, 2)
-    }
-    return Response(resp)
+
+# -------------------------------------------------------
+# 4b) Szczegóły wielu botów w jednym zapytaniu
+# -------------------------------------------------------
+BATCH_FIELDS = ('status', 'levels', 'profit')
+MAX_BATCH_BOTS = 500
+
+
+@api_view(['POST'])
+@authentication_classes([CustomAuthentication])
+@permission_classes([IsAuthenticated])
+def get_bots_batch(request):
+    """
+    Status, poziomy i zysk wielu botów użytkownika w jednej odpowiedzi - zamiast get_bot_details/get_bot_status
+    wołanych osobno dla każdego bota. Body: {"bot_ids": [1, 2]} albo {"user_id": 5} (wszystkie boty),
+    opcjonalnie "fields": ["status", "levels", "profit"] (domyślnie wszystkie).
+    Liczba zapytań nie rośnie z liczbą botów: rollup przez select_related, BnbLevelState przez prefetch_related.
+    Boty nieistniejące albo cudze trafiają do "missing".
+    """
+    bot_ids = request.data.get("bot_ids")
+    user_id = request.data.get("user_id")
+    fields = request.data.get("fields")
+
+    # Napis ("status", "123") też jest iterowalny - bez sprawdzenia typu rozpadłby się na znaki
+    if fields is not None and not (isinstance(fields, list) and all(isinstance(field, str) for field in fields)):
+        return Response({"error": "fields must be a list of strings"}, status=400)
+    if bot_ids is not None and not isinstance(bot_ids, list):
+        return Response({"error": "bot_ids must be a list of integers"}, status=400)
+    fields = fields or list(BATCH_FIELDS)
+
+    unknown = sorted(set(fields) - set(BATCH_FIELDS))
+    if unknown:
+        return Response({"error": f"Unknown fields: {', '.join(unknown)}"}, status=400)
+    if bot_ids is None and user_id is None:
+        return Response({"error": "bot_ids or user_id is required"}, status=400)
+    if user_id is not None and str(user_id) != str(request.user.id):
+        return Response({"error": "user_id does not match the authenticated user"}, status=403)
+
+    bots = BnbBot.objects.filter(user_id=request.user.id).order_by('id')
+    if bot_ids is not None:
+        try:
+            bot_ids = [int(bot_id) for bot_id in bot_ids]
+        except (TypeError, ValueError):
+            return Response({"error": "bot_ids must be a list of integers"}, status=400)
+        if len(bot_ids) > MAX_BATCH_BOTS:
+            return Response({"error": f"At most {MAX_BATCH_BOTS} bots per request"}, status=400)
+        bots = bots.filter(id__in=bot_ids)
+    if 'levels' in fields or 'profit' in fields:
+        bots = bots.select_related('stats')
+    if 'levels' in fields:
+        bots = bots.prefetch_related('level_states')
+
+    bots_data = []
+    for bot in bots:
+        bot_data = {"bot_id": bot.id, "symbol": bot.symbol}
+        if 'status' in fields:
+            bot_data["status"] = bot.status
+        if 'levels' in fields:
+            bot_data["levels"], _ = bot_levels(bot)
+            bot_data["capital"] = float(bot.capital)
+        if 'profit' in fields:
+            bot_data["total_profit"] = round(float(bot_stats(bot).total_profit), 2)
+        bots_data.append(bot_data)
+
+    found = {bot_data["bot_id"] for bot_data in bots_data}
+    missing = [bot_id for bot_id in bot_ids if bot_id not in found] if bot_ids is not None else []
+    return Response({"bots": bots_data, "missing": missing})
+
+
+def bot_stats(bot: BnbBot) -> BnbBotStats:
+    """
+    Rollup zysku bota (BnbBotStats) - pobierz bota z select_related('stats'), żeby nie było osobnego zapytania.
+    Bot bez transakcji (albo sprzed bnb_rebuild_stats) dostaje pusty, niezapisany rollup.
+    """
+    try:
+        return bot.stats
+    except BnbBotStats.DoesNotExist:
+        return BnbBotStats(bot=bot, total_profit=Decimal("0"))
 
 
 # -------------------------------------------------------
@@ -271,67 +368,50 @@ def get_bot_status(request, bot_id):
 @authentication_classes([CustomAuthentication])
 @permission_classes([IsAuthenticated])
 def export_bnb_trades_csv(request, bot_id):
+    """
+    Eksport transakcji bota strumieniowo (StreamingHttpResponse + .iterator) - pamięć nie rośnie z liczbą transakcji.
+    Parametry: file_format=csv|parquet|arrow (parquet/arrow wymagają pyarrow), after_id - tylko transakcje
+    o id > after_id (stronicowanie po kluczu), limit - rozmiar strony; nagłówek X-Next-After-Id wskazuje następną
+    i jest wysyłany tylko wtedy, gdy za pełną stroną są jeszcze transakcje.
+    """
     try:
         bot = BnbBot.objects.get(id=bot_id, user_id=request.user.id)
     except BnbBot.DoesNotExist:
         return Response({"error": "Bot not found or not owned by user"}, status=404)
 
-    trades = BnbTrade.objects.filter(bot=bot).order_by('created_at')
-
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';')
-
-    # Definicja nagłówka CSV - pomijamy pola związane z id
-    header = [
-        "Level", 
-        "Side",
-        "Quantity",
-        "Open Price",
-        "Close Price",
-        "Profit",
-        "Binance Order Id",
-        "Buy Type",
-        "Sell Type",
-        "Status",
-        "Open Time",
-        "Close Time"
-    ]
-    writer.writerow(header)
-
-    for trade in trades:
-        quantity = str(trade.quantity).replace('.', ',') if trade.quantity is not None else ""
-        open_price = str(trade.open_price).replace('.', ',') if trade.open_price is not None else ""
-        close_price = str(trade.close_price).replace('.', ',') if trade.close_price is not None else ""
-        profit = str(trade.profit).replace('.', ',') if trade.profit is not None else ""
-        
-        binance_order_id = trade.binance_order_id or ""
-        buy_type = trade.buy_type or ""
-        sell_type = trade.sell_type or ""
-        side = trade.side or ""
-
-        open_time = trade.created_at.strftime("%Y-%m-%d %H:%M") if trade.created_at else ""
-        # Jeżeli posiadasz pole 'filled_at' (np. jako moment zamknięcia transakcji)
-        close_time = ""
-        if hasattr(trade, 'filled_at') and trade.filled_at:
-            close_time = trade.filled_at.strftime("%Y-%m-%d %H:%M")
-
-        writer.writerow([
-            trade.level,
-            side,
-            quantity,
-            open_price,
-            close_price,
-            profit,
-            binance_order_id,
-            buy_type,
-            sell_type,
-            trade.status,
-            open_time,
-            close_time,
-        ])
-
-    response = HttpResponse(output.getvalue(), content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="bot_{bot_id}_trades.csv"'
+    # "format" jest zajęty przez negocjację formatu DRF
+    file_format = request.query_params.get('file_format', 'csv').lower()
+    if file_format not in bnb_export.available_formats():
+        return Response({"error": f"Unsupported file_format: {file_format} "
+                                  f"(available: {', '.join(bnb_export.available_formats())})"}, status=400)
+    try:
+        after_id = int(request.query_params.get('after_id', 0))
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return Response({"error": "after_id and limit must be integers"}, status=400)
+    if limit is not None and limit <= 0:
+        return Response({"error": "limit must be positive"}, status=400)
+
+    # Kolejność po id (rośnie razem z created_at) - stronicowanie po kluczu zamiast OFFSET
+    trades = (BnbTrade.objects.filter(bot=bot, id__gt=after_id)
+              .only(*bnb_export.TRADE_FIELDS).order_by('id'))
+    next_after_id = None
+    if limit is not None:
+        # Ostatnie id strony i pierwsze za nią - bez następnego wiersza nie ma następnej strony
+        boundary = list(trades.values_list('id', flat=True)[limit - 1:limit + 1])
+        if len(boundary) == 2:
+            next_after_id = boundary[0]
+        trades = trades[:limit]
+
+    content_type, extension = bnb_export.FORMATS[file_format]
+    response = StreamingHttpResponse(
+        bnb_export.iter_export(trades.iterator(chunk_size=bnb_export.CHUNK_SIZE), file_format),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="bot_{bot_id}_trades.{extension}"'
+    if next_after_id is not None:
+        response['X-Next-After-Id'] = str(next_after_id)
     return response
 
 
@@ -346,13 +426,12 @@ def get_bot_full_data(request, bot_id):
     Zwraca pełne dane bota, włącznie z poziomami handlowymi, statusem i historią transakcji.
     """
     try:
-        bot = BnbBot.objects.get(id=bot_id, user_id=request.user.id)
+        bot = BnbBot.objects.select_related('stats').get(id=bot_id, user_id=request.user.id)
     except BnbBot.DoesNotExist:
         return Response({"error": "Bot not found or not owned by user"}, status=404)
     
-    # Pobierz dane poziomów
-    levels_data = bot.get_levels_data()
-    runtime_data = bot.get_runtime_data()
+    # Pobierz dane poziomów (dla botów z tabelą BnbLevelState - jednym zapytaniem)
+    levels_data, runtime_data = bot.get_state()
     
     # Pobierz transakcje
     trades = BnbTrade.objects.filter(bot=bot).order_by('-created_at')[:20]  # Ostatnie 20 transakcji
@@ -371,8 +450,10 @@ def get_bot_full_data(request, bot_id):
             "created_at": trade.created_at.isoformat() if trade.created_at else None,
         })
     
-    # Oblicz zysk całkowity
-    total_profit = sum(float(t.profit or 0) for t in BnbTrade.objects.filter(bot=bot, side='SELL'))
+    # Liczba TP i zysk poziomów oraz zysk całkowity z rollupu BnbBotStats
+    rollup = bot_stats(bot)
+    stats = rollup.get_level_stats()
+    total_profit = float(rollup.total_profit)
     
     # Przygotuj dane poziomów handlowych w bardziej przyjaznej formie
     trading_levels = []
@@ -385,9 +466,7 @@ def get_bot_full_data(request, bot_id):
             level_buy_volume = float(runtime_data.get("buy_volume", {}).get(k, 0))
             
             # Calculate tp count and profit for this level
-            sells = BnbTrade.objects.filter(bot=bot, level=k, side='SELL', status='FILLED')
-            tp_count = sells.count()
-            level_profit = sum(float(t.profit or 0) for t in sells)
+            tp_count, level_profit = stats.get(k, (0, 0))
             
             trading_levels.append({
                 "name": k,
@@ -397,7 +476,7 @@ def get_bot_full_data(request, bot_id):
                 "buy_price": level_buy_price,
                 "buy_volume": level_buy_volume,
                 "tp": tp_count,
-                "profit": round(level_profit, 2)
+                "profit": round(float(level_profit), 2)
             })
     
     # Sortuj poziomy według ceny (od najwyższej do najniższej)
@@ -429,7 +508,7 @@ def get_bot_trades(request, bot_id):
     Pobiera i zwraca listę transakcji dla danego bota.
     """
     try:
-        bot = BnbBot.objects.get(id=bot_id, user_id=request.user.id)
+        bot = BnbBot.objects.select_related('stats').get(id=bot_id, user_id=request.user.id)
     except BnbBot.DoesNotExist:
         return Response({"error": "Bot not found or not owned by user"}, status=404)
     
@@ -451,8 +530,8 @@ def get_bot_trades(request, bot_id):
             "created_at": trade.created_at.isoformat() if trade.created_at else None,
         })
     
-    # Oblicz zysk całkowity
-    total_profit = sum(float(t.profit or 0) for t in BnbTrade.objects.filter(bot=bot, side='SELL', status='FILLED'))
+    # Zysk całkowity z rollupu BnbBotStats
+    total_profit = float(bot_stats(bot).total_profit)
     
     response_data = {
         "trades": trades_list,
@@ -472,10 +551,7 @@ def get_user_bots(request, user_id):
     """
     try:
         # Znajdź wszystkie boty należące do podanego użytkownika
-        bots = BnbBot.objects.filter(user_id=user_id)
-        
-        if not bots.exists():
-            return Response([], status=status.HTTP_200_OK)
+        bots = BnbBot.objects.filter(user_id=user_id).select_related('stats')
         
         # Przygotuj dane wszystkich botów
         bots_data = []
@@ -492,11 +568,10 @@ def get_user_bots(request, user_id):
                 'total_profit': "0.0",  # Domyślna wartość
             }
             
-            # Dodaj całkowity zysk, jeśli istnieją transakcje
-            trades = BnbTrade.objects.filter(bot=bot)
-            if trades.exists():
-                total_profit = sum(trade.profit for trade in trades if trade.profit is not None)
-                bot_data['total_profit'] = str(round(total_profit, 8))
+            # Dodaj całkowity zysk (z rollupu BnbBotStats), jeśli istnieją transakcje
+            stats = bot_stats(bot)
+            if stats.trade_count:
+                bot_data['total_profit'] = str(round(stats.total_profit, 8))
             
             bots_data.append(bot_data)
         
@@ -506,6 +581,52 @@ def get_user_bots(request, user_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Okresy grupowania zysków w get_bot_profits
+PROFIT_GRANULARITIES = {
+    'hour': TruncHour,
+    'day': TruncDate,
+    'week': TruncWeek,
+}
+
+
+def profit_rows(user_id, bot_id, start_date, end_date, granularity, tz):
+    """
+    [(początek okresu, bot_id, symbol, zysk, liczba transakcji)] - jedno zapytanie zgrupowane po (okres, bot).
+    Dni i tygodnie w UTC liczymy z dziennych kubełków rollupu (BnbBotDailyProfit),
+    godziny i inne strefy czasowe - z BnbTrade (indeksy BnbBot.user_id i BnbTrade(bot, created_at)).
+    Dni i tygodnie liczymy od północy (w strefie tz) dnia start_date - kubełek dzienny nie ma godzin,
+    więc obie ścieżki obejmują pełny pierwszy dzień, a nie jego część od godziny start_date.
+    """
+    if granularity != 'hour':
+        start_date = start_date.astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity != 'hour' and tz.key == 'UTC':
+        rows = BnbBotDailyProfit.objects.filter(
+            bot__user_id=user_id,
+            date__gte=start_date.date(),
+            date__lte=end_date.date()
+        )
+        period = TruncWeek('date') if granularity == 'week' else F('date')
+        count = Sum('trade_count')
+    else:
+        rows = BnbTrade.objects.filter(
+            bot__user_id=user_id,
+            created_at__gte=start_date,
+            created_at__lte=end_date
+        )
+        trunc = PROFIT_GRANULARITIES[granularity]
+        # Tydzień jako data poniedziałku (jak z kubełków), godzina jako datetime w strefie tz
+        period = trunc('created_at', output_field=DateField(), tzinfo=tz) if granularity == 'week' \
+            else trunc('created_at', tzinfo=tz)
+        count = Count('id')
+    if bot_id:
+        rows = rows.filter(bot_id=bot_id)
+
+    rows = (rows.annotate(period=period).values('period', 'bot_id', 'bot__symbol')
+            .annotate(profit=Sum('profit'), trade_count=count).order_by('period'))
+    return [(row['period'], row['bot_id'], row['bot__symbol'], row['profit'] or Decimal("0"), row['trade_count'])
+            for row in rows]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @authentication_classes([CustomAuthentication])
@@ -513,6 +634,7 @@ def get_bot_profits(request, bot_id=None, user_id=None):
     """
     Pobiera historyczne zyski botów dla danego użytkownika.
     Jeśli podano bot_id, pobiera tylko zyski tego konkretnego bota.
+    Parametry: days (domyślnie 30), granularity=hour|day|week (domyślnie day), tz (np. Europe/Warsaw, domyślnie UTC).
     """
     try:
         # Pobierz user_id z parametru URL lub z uwierzytelniania
@@ -540,56 +662,40 @@ def get_bot_profits(request, bot_id=None, user_id=None):
         except ValueError:
             days = 30
         
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in PROFIT_GRANULARITIES:
+            return Response({'error': f'Nieprawidłowe granularity: {granularity} (hour, day, week)'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tz = ZoneInfo(request.query_params.get('tz', 'UTC'))
+        except (ZoneInfoNotFoundError, ValueError):
+            return Response({'error': 'Nieznana strefa czasowa'}, status=status.HTTP_400_BAD_REQUEST)
+        
         end_date = timezone.now()
         start_date = end_date - timedelta(days=days)
         
-        # Filtruj boty według user_id i opcjonalnie bot_id
-        if bot_id:
-            bot_trades = BnbTrade.objects.filter(
-                bot__user_id=user_id,
-                bot_id=bot_id,
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            ).order_by('created_at')
-        else:
-            bot_trades = BnbTrade.objects.filter(
-                bot__user_id=user_id,
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            ).order_by('created_at')
-        
-        # Zgrupuj zyski według daty
-        daily_profits = {}
+        # Zyski według okresu i podsumowanie botów z jednego zgrupowanego zapytania
+        period_profits = {}
         bot_summary = {}
-        total_profit = 0
-        
-        for trade in bot_trades:
-            # Zysk z transakcji
-            profit = trade.profit or 0
-            total_profit += profit
-            
-            # Grupowanie zysków według dnia
-            date_key = trade.created_at.date().isoformat()
-            if date_key not in daily_profits:
-                daily_profits[date_key] = 0
-            daily_profits[date_key] += profit
+        for period, row_bot_id, symbol, profit, trade_count in profit_rows(
+                user_id, bot_id, start_date, end_date, granularity, tz):
+            period_key = period.isoformat()
+            period_profits[period_key] = period_profits.get(period_key, Decimal("0")) + profit
             
-            # Grupowanie zysków według botów
-            bot_key = f"{trade.bot.symbol}_{trade.bot.id}"
-            if bot_key not in bot_summary:
-                bot_summary[bot_key] = {
-                    "bot_id": trade.bot.id,
-                    "symbol": trade.bot.symbol,
-                    "total_profit": 0,
+            if row_bot_id not in bot_summary:
+                bot_summary[row_bot_id] = {
+                    "bot_id": row_bot_id,
+                    "symbol": symbol,
+                    "total_profit": Decimal("0"),
                     "trade_count": 0
                 }
-            bot_summary[bot_key]["total_profit"] += profit
-            bot_summary[bot_key]["trade_count"] += 1
+            bot_summary[row_bot_id]["total_profit"] += profit
+            bot_summary[row_bot_id]["trade_count"] += trade_count
         
-        # Uporządkuj dane według dat
+        # Okresy są już posortowane w zapytaniu
         profit_history = [
-            {"date": date, "profit": round(profit, 8)}
-            for date, profit in sorted(daily_profits.items())
+            {"date": period, "profit": round(profit, 8)}
+            for period, profit in period_profits.items()
         ]
         
         # Uporządkuj podsumowanie botów według zysków (od najwyższych)
@@ -598,13 +704,16 @@ def get_bot_profits(request, bot_id=None, user_id=None):
             key=lambda x: x["total_profit"],
             reverse=True
         )
+        total_profit = sum((bot["total_profit"] for bot in bot_performance), Decimal("0"))
         
         response_data = {
             "profits": profit_history,
             "summary": {
                 "total_profit": round(total_profit, 8),
-                "trade_count": len(bot_trades),
+                "trade_count": sum(bot["trade_count"] for bot in bot_performance),
                 "period_days": days,
+                "granularity": granularity,
+                "timezone": tz.key,
                 "bots": bot_performance
             }
         }
@@ -614,3 +723,21 @@ def get_bot_profits(request, bot_id=None, user_id=None):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+# -------------------------------------------------------
+# Metryki Prometheusa (czasy ticków worker-a)
+# -------------------------------------------------------
+def metrics(request):
+    """
+    Rejestr prometheus_client (histogramy ticków botów) przez eksport django-prometheus - z
+    PROMETHEUS_MULTIPROC_DIR zbiera też metryki procesów run_bnb_worker.
+    Bez tokena - dostęp ograniczony do adresów z BNB_METRICS_ALLOWED_IPS (domyślnie localhost).
+    """
+    allowed = getattr(settings, "BNB_METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+    if request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponse(status=403)
+    try:
+        from django_prometheus.exports import ExportToDjangoView
+    except ImportError:
+        return HttpResponse("django-prometheus is not installed", status=503)
+    return ExportToDjangoView(request)
@@ -10,8 +10,10 @@ setup(
         'django-rest-framework>=0.1.0',
         'djangorestframework>=3.14.0',
         'websocket-client>=1.6.1',
+        'websockets>=11.0',
         'numpy>=1.24.3',
         'pandas>=2.0.2',
+        'pyarrow>=14.0.0',
         'requests>=2.31.0',
         'python-binance>=1.0.19',
         'cryptography>=41.0.1',
@@ -8,9 +8,11 @@ z wymaganiami giełdy.
 import logging
 from decimal import Decimal
 from django.utils import timezone
-from binance.client import Client
 from binance.exceptions import BinanceAPIException
 
+from binance_common.exchange_info import get_symbol_filters
+from hpcrypto.client_pool import get_profile_client
+
 logger = logging.getLogger(__name__)
 
 def execute_stop_limit_order(user, trading_data):
@@ -102,10 +104,10 @@ def execute_stop_limit_order(user, trading_data):
         
         # Inicjalizuj klienta Binance
         api_key = profile.binance_api_key
-        api_secret = profile.get_binance_api_secret()
         logger.info(f"Inicjalizuję klienta Binance z kluczami: {api_key[:5]}...{api_key[-5:] if len(api_key) > 10 else ''}")
         
-        client = Client(api_key, api_secret)
+        # Klient z puli - zapytania przechodzą przez wspólny limiter Binance (binance_common.rate_limit)
+        client = get_profile_client(profile)
         
         # Przygotuj parametry zlecenia
         # Debugowanie symbolu i waluty
@@ -127,7 +129,7 @@ def execute_stop_limit_order(user, trading_data):
             
         # Pobierz informacje o symbolu, aby sprawdzić filtry handlowe
         try:
-            symbol_info = client.get_symbol_info(symbol)
+            symbol_info = get_symbol_filters(client, symbol)
             if not symbol_info:
                 logger.error(f"Nie znaleziono informacji o symbolu {symbol}")
                 return {
@@ -136,11 +138,11 @@ def execute_stop_limit_order(user, trading_data):
                 }
                 
             # Sprawdź czy handel dla symbolu jest aktywny
-            if symbol_info['status'] != 'TRADING':
-                logger.error(f"Para handlowa {symbol} nie jest aktualnie dostępna do handlu. Status: {symbol_info['status']}")
+            if symbol_info.status != 'TRADING':
+                logger.error(f"Para handlowa {symbol} nie jest aktualnie dostępna do handlu. Status: {symbol_info.status}")
                 return {
                     'success': False,
-                    'message': f"Para handlowa {symbol} nie jest aktualnie dostępna do handlu. Status: {symbol_info['status']}"
+                    'message': f"Para handlowa {symbol} nie jest aktualnie dostępna do handlu. Status: {symbol_info.status}"
                 }
         except BinanceAPIException as e:
             logger.error(f"Błąd podczas pobierania informacji o symbolu: {e}")
@@ -206,12 +208,8 @@ def execute_stop_limit_order(user, trading_data):
             # Normalizuj ilość zgodnie z wymaganiami Binance dla danego symbolu
             quantity = normalize_binance_quantity(client, symbol, raw_quantity)
             
-            # Sprawdź minimalną wartość zlecenia (MIN_NOTIONAL)
-            min_notional = None
-            for filter_item in symbol_info['filters']:
-                if filter_item['filterType'] == 'MIN_NOTIONAL':
-                    min_notional = float(filter_item['minNotional'])
-                    break
+            # Sprawdź minimalną wartość zlecenia (filtr NOTIONAL albo starszy MIN_NOTIONAL)
+            min_notional = float(symbol_info.min_notional)
             
             estimated_value = quantity * normalized_limit_price
             if min_notional and estimated_value < min_notional:
@@ -350,8 +348,8 @@ def get_binance_quantity_precision(client, symbol):
     Returns:
         tuple: (min_qty, max_qty, step_size, precyzja zaokrąglenia)
     """
-    # Pobierz info o symbolu
-    info = client.get_symbol_info(symbol)
+    # Pobierz filtry symbolu z cache exchangeInfo (bez zapytania do Binance przy każdym zleceniu)
+    info = get_symbol_filters(client, symbol)
     
     # Domyślne wartości
     min_qty = 0.00000001
@@ -359,14 +357,11 @@ def get_binance_quantity_precision(client, symbol):
     step_size = 0.00000001
     precision = 8  # domyślna precyzja
     
-    # Znajdź filtr LOT_SIZE, który określa dozwolone wartości ilości
-    if info and 'filters' in info:
-        for filter_item in info['filters']:
-            if filter_item['filterType'] == 'LOT_SIZE':
-                min_qty = float(filter_item['minQty'])
-                max_qty = float(filter_item['maxQty'])
-                step_size = float(filter_item['stepSize'])
-                break
+    # Filtr LOT_SIZE określa dozwolone wartości ilości
+    if info and 'LOT_SIZE' in info.filters:
+        min_qty = float(info.min_qty)
+        max_qty = float(info.max_qty)
+        step_size = float(info.step_size)
     
     # Oblicz precyzję na podstawie step_size
     if step_size != 0:
@@ -415,8 +410,8 @@ def get_binance_price_precision(client, symbol):
     Returns:
         tuple: (min_price, max_price, tick_size, precyzja zaokrąglenia)
     """
-    # Pobierz info o symbolu
-    info = client.get_symbol_info(symbol)
+    # Pobierz filtry symbolu z cache exchangeInfo (bez zapytania do Binance przy każdym zleceniu)
+    info = get_symbol_filters(client, symbol)
     
     # Domyślne wartości
     min_price = 0.00000001
@@ -424,14 +419,11 @@ def get_binance_price_precision(client, symbol):
     tick_size = 0.00000001
     precision = 8  # domyślna precyzja
     
-    # Znajdź filtr PRICE_FILTER, który określa dozwolone wartości ceny
-    if info and 'filters' in info:
-        for filter_item in info['filters']:
-            if filter_item['filterType'] == 'PRICE_FILTER':
-                min_price = float(filter_item['minPrice'])
-                max_price = float(filter_item['maxPrice'])
-                tick_size = float(filter_item['tickSize'])
-                break
+    # Filtr PRICE_FILTER określa dozwolone wartości ceny
+    if info and 'PRICE_FILTER' in info.filters:
+        min_price = float(info.min_price)
+        max_price = float(info.max_price)
+        tick_size = float(info.tick_size)
     
     # Oblicz precyzję na podstawie tick_size
     if tick_size != 0:
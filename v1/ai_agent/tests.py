@@ -1,3 +1,72 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from binance_common.exchange_info import exchange_info_cache
+
+from .binance_orders import execute_stop_limit_order
+
+
+class FakeOrderClient:
+    """
+    Klient Binance z filtrami BTCUSDT (NOTIONAL 5 USDT) i ceną 100; zapisuje złożone zlecenia.
+    """
+
+    def __init__(self):
+        self.orders = []
+
+    def get_exchange_info(self):
+        return {"symbols": [{
+            "symbol": "BTCUSDT", "status": "TRADING", "baseAsset": "BTC", "quoteAsset": "USDT",
+            "filters": [
+                {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000", "tickSize": "0.01"},
+                {"filterType": "LOT_SIZE", "minQty": "0.001", "maxQty": "9000", "stepSize": "0.001"},
+                {"filterType": "NOTIONAL", "minNotional": "5.00", "maxNotional": "9000000"},
+            ],
+        }]}
+
+    def get_symbol_ticker(self, symbol):
+        return {"symbol": symbol, "price": "100"}
+
+    def create_test_order(self, **params):
+        return {}
+
+    def create_order(self, **params):
+        self.orders.append(params)
+        return {"orderId": 1, "clientOrderId": "test"}
+
+
+class StopLimitBuyTests(SimpleTestCase):
+
+    def setUp(self):
+        exchange_info_cache.clear()
+        self.addCleanup(exchange_info_cache.clear)
+        self.client = FakeOrderClient()
+        self.user = SimpleNamespace(profile=SimpleNamespace(binance_api_key="key-1234567890",
+                                                            binance_api_secret_enc=b"secret"))
+        for patcher in (
+            mock.patch("ai_agent.binance_orders.get_profile_client", return_value=self.client),
+            mock.patch("hpcrypto.models.PendingOrder"),
+            mock.patch("hpcrypto.models.HPCategory.objects.get_or_create", return_value=(mock.Mock(), False)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def buy(self, amount):
+        return execute_stop_limit_order(self.user, {
+            "action": "stop_limit_buy", "asset": "BTC", "currency": "USDT",
+            "limit_price": "90", "trigger_price": "95", "amount": amount,
+        })
+
+    def test_buy_checks_min_notional_from_symbol_filters(self):
+        result = self.buy("1")
+        self.assertFalse(result["success"])
+        self.assertIn("poniżej minimalnej", result["message"])
+        self.assertEqual(self.client.orders, [])
+
+    def test_buy_above_min_notional_is_sent(self):
+        result = self.buy("20")
+        self.assertTrue(result["success"], result["message"])
+        self.assertEqual(len(self.client.orders), 1)
+        self.assertEqual(self.client.orders[0]["quantity"], "0.222")
@@ -3,6 +3,8 @@ import logging
 from django.conf import settings
 import openai
 
+from binance_common.exchange_info import get_symbol_filters
+
 logger = logging.getLogger(__name__)
 
 def get_binance_symbol_info(client, symbol):
@@ -17,28 +19,17 @@ def get_binance_symbol_info(client, symbol):
         dict: Informacje o symbolu lub None w przypadku błędu.
     """
     try:
-        exchange_info = client.get_exchange_info()
-        
-        for sym_info in exchange_info['symbols']:
-            if sym_info['symbol'] == symbol:
-                lot_size_filter = None
-                min_notional_filter = None
-                
-                # Znajdź filtry LOT_SIZE i MIN_NOTIONAL
-                for filter_info in sym_info['filters']:
-                    if filter_info['filterType'] == 'LOT_SIZE':
-                        lot_size_filter = filter_info
-                    elif filter_info['filterType'] == 'MIN_NOTIONAL':
-                        min_notional_filter = filter_info
-                        
-                return {
-                    'baseAsset': sym_info['baseAsset'],
-                    'quoteAsset': sym_info['quoteAsset'],
-                    'lot_size': lot_size_filter,
-                    'min_notional': min_notional_filter
-                }
-                
-        return None
+        # Filtry z cache exchangeInfo - pełne exchangeInfo pobierane jest raz na TTL, nie przy każdym zleceniu
+        sym_info = get_symbol_filters(client, symbol)
+        if sym_info is None:
+            return None
+
+        return {
+            'baseAsset': sym_info.base_asset,
+            'quoteAsset': sym_info.quote_asset,
+            'lot_size': sym_info.filters.get('LOT_SIZE'),
+            'min_notional': sym_info.filters.get('MIN_NOTIONAL') or sym_info.filters.get('NOTIONAL')
+        }
     except Exception as e:
         print(f"[DEBUG] Błąd pobierania informacji o symbolu: {e}")
         return None
@@ -178,12 +169,10 @@ def execute_trade(user_id, trading_data):
             try:
                 from binance.client import Client
                 from binance.exceptions import BinanceAPIException
+                from hpcrypto.client_pool import get_profile_client
                 
-                api_key = profile.binance_api_key
-                api_secret = profile.get_binance_api_secret()
-                
-                # Inicjalizuj klienta Binance
-                binance_client = Client(api_key, api_secret)
+                # Klient Binance z puli (wspólny limiter zapytań)
+                binance_client = get_profile_client(profile)
                 print(f"[DEBUG] Inicjalizacja klienta Binance powiodła się")
             except Exception as e:
                 print(f"[DEBUG] Błąd inicjalizacji klienta Binance: {e}")
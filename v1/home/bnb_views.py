@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import Bot, BotLog
@@ -9,7 +9,7 @@ import logging
 from django.conf import settings
 import requests
 from decimal import Decimal
-from .utils import get_token
+from .utils import get_token, stream_response
 from django.views.decorators.http import require_POST
 import time
 
@@ -493,16 +493,14 @@ def export_bnb_trades(request, bot_id):
             timeout=10
         )
         if r.status_code == 200:
-            from django.http import HttpResponse
-            response = HttpResponse(content_type='text/csv')
+            # Przekazujemy strumień z mikroserwisu dalej, bez składania całego pliku w pamięci
+            response = StreamingHttpResponse(stream_response(r), content_type='text/csv')
             response['Content-Disposition'] = f'attachment; filename="bot_{bot_id}_trades.csv"'
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    response.write(chunk)
             return response
         else:
             messages.error(request, f"Błąd mikroserwisu: {r.status_code} {r.text}")
             return redirect('bnb_detail', bot_id=bot_id)
     except Exception as e:
         messages.error(request, f"Błąd: {str(e)}")
-        return redirect('bnb_detail', bot_id=bot_id) 
\ No newline at end of file
+        return redirect('bnb_detail', bot_id=bot_id) 
+
@@ -9,21 +9,102 @@ from .models import Bot, User, BotLog, UserProfile, TelegramConfig
 
 logger = logging.getLogger(__name__)
 
+def bnb_microservice_url(bot):
+    """
+    Microservice serving a BNB bot: 51015rei bots run on BNB_MICROSERVICE_URL, the rest on BNB_MICROSERVICE_URL_2.
+    """
+    is_rei_bot = "51015rei" in bot.name.lower()
+    return settings.BNB_MICROSERVICE_URL if is_rei_bot else settings.BNB_MICROSERVICE_URL_2
+
+
+def apply_bot_status(bot, new_status):
+    """
+    Stores a status reported by the microservice and notifies the user when the bot has finished.
+    """
+    if not new_status or bot.status == new_status:
+        return
+    bot.status = new_status
+    if new_status == 'FINISHED' and not bot.finished_at:
+        bot.finished_at = timezone.now()
+        logger.info(f"finished_at for bot {bot.id} = {bot.finished_at}")
+    bot.save()
+    logger.info(f"Bot {bot.id} (micro_id={bot.microservice_bot_id}) updated: {bot.status}")
+
+    # Send notification when a bot finishes
+    if new_status == 'FINISHED':
+        notify_bot_finished(bot.id, bot.name, bot.instrument)
+
+
 @shared_task
 def sync_all_bots():
     """
     Async task to sync the status of all active bots with their respective microservices.
     This replaces the synchronous middleware.
+    BNB bots are synced with one get_bots_batch request per (user, microservice) instead of one request per bot;
+    if the batch call fails, the group falls back to sync_bot_status per bot.
     """
     # Get all active bots
     active_bots = Bot.objects.filter(status__in=['NEW', 'RUNNING'])
     
+    groups = {}
     for bot in active_bots:
+        if bot.broker_type == 'BNB' and bot.microservice_bot_id:
+            groups.setdefault((bot.user_id, bnb_microservice_url(bot)), []).append(bot)
+            continue
         try:
             sync_bot_status.delay(bot.id)
         except Exception as e:
             logger.error(f"Error scheduling sync for bot {bot.id}: {e}")
 
+    for (user_id, base_url), bots in groups.items():
+        if sync_bots_batch(user_id, base_url, bots):
+            continue
+        for bot in bots:
+            try:
+                sync_bot_status.delay(bot.id)
+            except Exception as e:
+                logger.error(f"Error scheduling sync for bot {bot.id}: {e}")
+
+
+def sync_bots_batch(user_id, base_url, bots):
+    """
+    Syncs the status of one user's bots on one microservice with a single get_bots_batch call.
+    Returns False when the batch request failed and the bots still need syncing.
+    """
+    try:
+        from rest_framework.authtoken.models import Token
+        token = Token.objects.get(user_id=user_id).key
+    except Exception:
+        logger.error(f"User {user_id} has no auth token - skipping {len(bots)} bots")
+        return True
+
+    timeout = getattr(settings, 'REQUESTS_TIMEOUT', 10)
+    try:
+        resp = requests.post(
+            f"{base_url}/get_bots_batch/",
+            json={"bot_ids": [bot.microservice_bot_id for bot in bots], "fields": ["status"]},
+            headers={'Authorization': f'Token {token}'},
+            timeout=timeout
+        )
+    except requests.RequestException as e:
+        logger.error(f"Batch sync of {len(bots)} bots with {base_url} failed: {e}")
+        return False
+    if resp.status_code != 200:
+        logger.error(f"Batch sync of {len(bots)} bots with {base_url} failed: {resp.status_code} {resp.text}")
+        return False
+
+    statuses = {item["bot_id"]: item.get("status") for item in resp.json().get("bots", [])}
+    for bot in bots:
+        if bot.microservice_bot_id not in statuses:
+            logger.warning(f"Bot {bot.id} (micro_id={bot.microservice_bot_id}) not found on {base_url}")
+            continue
+        try:
+            apply_bot_status(bot, statuses[bot.microservice_bot_id])
+        except Exception as e:
+            logger.error(f"Error during sync of bot {bot.id}: {e}")
+    return True
+
+
 @shared_task
 def sync_bot_status(bot_id):
     """
@@ -70,20 +151,7 @@ def sync_bot_status(bot_id):
         if resp.status_code == 200:
             data = resp.json()
             logger.info(f"Data from microservice {microservice_name} for bot {bot.id}: {data}")
-            new_status = data.get("status")
-            
-            if new_status and bot.status != new_status:
-                old_status = bot.status  # Store old status for notification
-                bot.status = new_status
-                if new_status == 'FINISHED' and not bot.finished_at:
-                    bot.finished_at = timezone.now()
-                    logger.info(f"finished_at for bot {bot.id} = {bot.finished_at}")
-                bot.save()
-                logger.info(f"Bot {bot.id} (micro_id={bot.microservice_bot_id}) updated: {bot.status}")
-                
-                # Send notification when a bot finishes
-                if new_status == 'FINISHED':
-                    notify_bot_finished(bot.id, bot.name, bot.instrument)
+            apply_bot_status(bot, data.get("status"))
         else:
             logger.error(f"Error syncing bot {bot.id} with {microservice_name}: {resp.status_code} {resp.text}")
     
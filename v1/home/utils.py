@@ -72,13 +72,14 @@ def ensure_token_in_microservices(user_id, token_key):
             logger.warning(f"Could not register token in {service['name']}: {str(e)}")
 
 # home/utils.py
-from binance.client import Client
 from binance.exceptions import BinanceAPIException
 
+from binance_common.rate_limit import GovernedClient
+
 def test_binance_connection(api_key, api_secret):
     """Test Binance API connection with the provided credentials"""
     try:
-        client = Client(api_key, api_secret)
+        client = GovernedClient(api_key, api_secret)
         
         # Try a basic, non-intrusive API call
         status = client.get_system_status()
@@ -97,4 +98,16 @@ def test_binance_connection(api_key, api_secret):
     except BinanceAPIException as e:
         return f"Binance API error (code {e.code}): {e.message}"
     except Exception as e:
-        return f"Connection error: {str(e)}"
\ No newline at end of file
+        return f"Connection error: {str(e)}"
+
+
+def stream_response(r, chunk_size=8192):
+    """
+    Kawałki odpowiedzi requests (stream=True); połączenie zamykamy po przesłaniu całości.
+    """
+    try:
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        r.close()
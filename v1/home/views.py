@@ -3,7 +3,7 @@
 import logging
 import requests
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, authenticate, logout
@@ -19,7 +19,7 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from .forms import CustomUserCreationForm, BotForm, BinanceApiForm
 from .models import Bot, UserProfile, TelegramConfig, BotLog
-from .utils import get_token
+from .utils import get_token, stream_response
 from datetime import datetime, timedelta, timezone as py_timezone
 from django.http import HttpResponse
 import csv
@@ -785,11 +785,9 @@ def export_bnb_trades(request, bot_id):
     try:
         r = requests.get(url, headers=headers, stream=True, timeout=10)
         if r.status_code == 200:
-            response = HttpResponse(content_type='text/csv')
+            # Przekazujemy strumień z mikroserwisu dalej, bez składania całego pliku w pamięci
+            response = StreamingHttpResponse(stream_response(r), content_type='text/csv')
             response['Content-Disposition'] = f'attachment; filename="bot_{bot_id}_trades.csv"'
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    response.write(chunk)
             return response
         else:
             messages.error(request, f"Błąd mikroserwisu: {r.status_code} {r.text}")
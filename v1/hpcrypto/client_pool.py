@@ -0,0 +1,22 @@
+# hpcrypto/client_pool.py
+
+from binance.client import Client
+
+from binance_common.client_pool import ClientPool
+
+client_pool = ClientPool()
+
+
+def get_profile_client(profile) -> Client:
+    """
+    Klient Binance dla kluczy z profilu użytkownika (UserProfile), współdzielony z puli.
+    """
+    return client_pool.get(profile.binance_api_key, profile.binance_api_secret_enc,
+                           profile.get_binance_api_secret)
+
+
+def get_public_client() -> Client:
+    """
+    Klient bez kluczy - tylko publiczne endpointy (ceny).
+    """
+    return client_pool.get("", None, lambda: "")
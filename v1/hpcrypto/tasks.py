@@ -243,14 +243,13 @@ def check_pending_orders():
                     orders_with_errors += 1
                     continue
                 
-                # Import klienta Binance
-                from binance.client import Client
+                # Import puli klientów Binance
+                from .client_pool import get_profile_client
+                from binance_common.rate_limit import PRIORITY_SYNC, rate_priority
                 from binance.exceptions import BinanceAPIException
                 
-                # Inicjalizuj klienta Binance
-                api_key = profile.binance_api_key
-                api_secret = profile.get_binance_api_secret()
-                client = Client(api_key, api_secret)
+                # Klient Binance z puli (jeden na klucz API, bez ponownego odszyfrowania sekretu)
+                client = get_profile_client(profile)
                 
                 # Sprawdź status zlecenia
                 if order.status == 'WAITING':
@@ -310,11 +309,12 @@ def check_pending_orders():
                 elif order.status == 'CREATED':
                     # Zlecenie istnieje na Binance, sprawdź jego status
                     try:
-                        # Pobierz status zlecenia z Binance
-                        binance_order = client.get_order(
-                            symbol=order.get_trading_pair,
-                            orderId=order.binance_order_id
-                        )
+                        # Pobierz status zlecenia z Binance (priorytet synchronizacji w limiterze)
+                        with rate_priority(PRIORITY_SYNC):
+                            binance_order = client.get_order(
+                                symbol=order.get_trading_pair,
+                                orderId=order.binance_order_id
+                            )
                         
                         # Aktualizuj czas ostatniego sprawdzenia
                         order.last_checked = timezone.now()
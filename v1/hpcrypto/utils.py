@@ -1,9 +1,10 @@
 # hpcrypto/utils.py
-from binance.client import Client
 from binance.exceptions import BinanceAPIException
 from django.core.cache import cache
 import logging
-import time
+
+from binance_common.rate_limit import PRIORITY_PRICE, RateLimitExceeded, rate_priority
+from .client_pool import get_profile_client, get_public_client
 
 logger = logging.getLogger(__name__)
 
@@ -33,17 +34,6 @@ def get_binance_price(user, ticker, cache_time=60):
         logger.debug(f"Cache hit for {binance_ticker}: {cached_price}")
         return cached_price
     
-    # Get global API rate limit cache to prevent too many requests
-    rate_limit_key = "binance_api_last_call"
-    last_call_time = cache.get(rate_limit_key)
-    current_time = time.time()
-    
-    # If we've made a call in the last 0.5 second, wait a bit
-    if last_call_time and current_time - last_call_time < 0.5:
-        wait_time = 0.5 - (current_time - last_call_time)
-        logger.debug(f"Rate limiting: waiting {wait_time:.2f}s before API call")
-        time.sleep(wait_time)
-    
     try:
         # Get user's Binance credentials
         profile = getattr(user, 'profile', None)
@@ -51,31 +41,30 @@ def get_binance_price(user, ticker, cache_time=60):
             logger.warning(f"User {user.id} missing Binance API credentials")
             return None
         
-        api_key = profile.binance_api_key
-        api_secret = profile.get_binance_api_secret()
-        
-        # Create client and fetch price
-        client = Client(api_key, api_secret)
+        # Reuse pooled client (keep-alive session, secret decrypted only on first use)
+        client = get_profile_client(profile)
         
-        try:
-            ticker_data = client.get_symbol_ticker(symbol=binance_ticker)
-            price = float(ticker_data['price'])
-        except BinanceAPIException as e:
-            # If the first attempt fails with USDT and it wasn't explicitly specified,
-            # try with USDC instead
-            if not ticker.endswith('USDT') and not ticker.endswith('USDC') and "USDT" in binance_ticker:
-                logger.info(f"USDT pair not found for {ticker}, trying USDC pair")
-                binance_ticker = f"{ticker}USDC"
+        # Rate limiting is handled by the shared governor (price refreshes have the lowest priority
+        # and are shed with RateLimitExceeded instead of risking a ban)
+        with rate_priority(PRIORITY_PRICE):
+            try:
                 ticker_data = client.get_symbol_ticker(symbol=binance_ticker)
                 price = float(ticker_data['price'])
-                # Update cache key for the actual pair we used
-                cache_key = f"binance_price_{binance_ticker}"
-            else:
-                # If it was explicitly specified or second attempt also failed, re-raise
+            except RateLimitExceeded:
                 raise
-        
-        # Update rate limit cache
-        cache.set(rate_limit_key, time.time(), 60)
+            except BinanceAPIException as e:
+                # If the first attempt fails with USDT and it wasn't explicitly specified,
+                # try with USDC instead
+                if not ticker.endswith('USDT') and not ticker.endswith('USDC') and "USDT" in binance_ticker:
+                    logger.info(f"USDT pair not found for {ticker}, trying USDC pair")
+                    binance_ticker = f"{ticker}USDC"
+                    ticker_data = client.get_symbol_ticker(symbol=binance_ticker)
+                    price = float(ticker_data['price'])
+                    # Update cache key for the actual pair we used
+                    cache_key = f"binance_price_{binance_ticker}"
+                else:
+                    # If it was explicitly specified or second attempt also failed, re-raise
+                    raise
         
         # Cache price
         cache.set(cache_key, price, cache_time)
@@ -112,9 +101,7 @@ def get_bulk_binance_prices(user, tickers, cache_time=60):
     
     # Create Binance client only once
     try:
-        api_key = profile.binance_api_key
-        api_secret = profile.get_binance_api_secret()
-        client = Client(api_key, api_secret)
+        client = get_profile_client(profile)
         
         # Prepare list of Binance-formatted tickers
         binance_tickers = []
@@ -141,7 +128,8 @@ def get_bulk_binance_prices(user, tickers, cache_time=60):
         # If we still have tickers to fetch
         if binance_tickers:
             # Get all tickers at once
-            prices = client.get_all_tickers()
+            with rate_priority(PRIORITY_PRICE):
+                prices = client.get_all_tickers()
             price_by_symbol = {price_data['symbol']: float(price_data['price']) for price_data in prices}
             
             # Process results for tickers we have
@@ -165,6 +153,10 @@ def get_bulk_binance_prices(user, tickers, cache_time=60):
                         cache.set(cache_key, price, cache_time)
                         logger.info(f"Used USDC pair instead of USDT for {original_ticker}")
     
+    except RateLimitExceeded as e:
+        # Governor shed the refresh - return what we have from cache instead of a second request
+        logger.warning(f"Bulk price fetch skipped: {e}")
+        return results
     except BinanceAPIException as e:
         logger.error(f"Binance API error in bulk price fetch: {e}")
         # Fall back to public API
@@ -190,8 +182,8 @@ def get_public_binance_prices(tickers, cache_time=60):
     results = {}
     
     try:
-        # Create client without authentication
-        client = Client("", "")
+        # Pooled client without authentication
+        client = get_public_client()
         
         # Prepare list of Binance-formatted tickers
         binance_tickers = []
@@ -218,7 +210,8 @@ def get_public_binance_prices(tickers, cache_time=60):
         # If we still have tickers to fetch
         if binance_tickers:
             # Get all tickers at once
-            prices = client.get_all_tickers()
+            with rate_priority(PRIORITY_PRICE):
+                prices = client.get_all_tickers()
             price_by_symbol = {price_data['symbol']: float(price_data['price']) for price_data in prices}
             
             # Process results for tickers we have
@@ -616,13 +616,11 @@ def cancel_order(request, order_id):
             profile = getattr(request.user, 'profile', None)
             
             if profile and profile.binance_api_key and profile.binance_api_secret_enc:
-                from binance.client import Client
+                from .client_pool import get_profile_client
                 from binance.exceptions import BinanceAPIException
                 
-                # Inicjalizuj klienta Binance
-                api_key = profile.binance_api_key
-                api_secret = profile.get_binance_api_secret()
-                client = Client(api_key, api_secret)
+                # Klient Binance z puli (jeden na klucz API, bez ponownego odszyfrowania sekretu)
+                client = get_profile_client(profile)
                 
                 try:
                     # Anuluj zlecenie na Binance
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Dodajemy obsługę zmiennych środowiskowych z pliku .env
 from dotenv import load_dotenv
@@ -22,6 +23,9 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file_
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Moduły Binance wspólne z bnbbot1/bnbbot2 (binance_common) leżą w katalogu repozytorium
+sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -230,4 +234,10 @@ PINECONE_DIMENSION = os.getenv('PINECONE_DIMENSION', 1536)
 PINECONE_METRIC = os.getenv('PINECONE_METRIC', "cosine")
 PINECONE_CLOUD = os.getenv('PINECONE_CLOUD', "aws")
 PINECONE_REGION = os.getenv('PINECONE_REGION', "us-east-1")
-PINECONE_NAMESPACE = os.getenv('PINECONE_NAMESPACE', "trading_analysis")  # Dodane z pliku popo.py
\ No newline at end of file
+PINECONE_NAMESPACE = os.getenv('PINECONE_NAMESPACE', "trading_analysis")  # Dodane z pliku popo.py
+# Wspólny limiter zapytań do Binance (binance_common.rate_limit) - ten sam Redis i klucze co w bnbbot1/bnbbot2,
+# więc wszystkie usługi na tym IP dzielą jeden limit wagi
+BINANCE_RATE_LIMIT_REDIS_URL = os.getenv(
+    'BINANCE_RATE_LIMIT_REDIS_URL',
+    f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', 6379)}/2"
+)